@@ -1,20 +1,24 @@
-from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import deque
 import html
 import json
-from json import dump as json_dump, load as json_load
-from os import listdir, makedirs, path
+from json import load as json_load
+import logging
+from logging.handlers import RotatingFileHandler
+import multiprocessing
+from os import path
 import os
-import re
 import sys
 import threading
 import time
 
 from PyQt6.QtCore import QCoreApplication, QDate, QThread, QTimer, Qt, pyqtSignal
-from PyQt6.QtGui import QPixmap
+from PyQt6.QtGui import QPixmap, QTextCharFormat
 from PyQt6.QtWidgets import (
     QApplication,
     QCheckBox,
+    QComboBox,
     QDateEdit,
+    QDoubleSpinBox,
     QFileDialog,
     QHBoxLayout,
     QLabel,
@@ -29,66 +33,19 @@ from PyQt6.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
-import yt_dlp
-from yt_dlp.utils import DownloadCancelled
-
-
-URL_PATTERN = re.compile(r"(https?://[^\s<>\"]+)")
-
-
-def make_links_clickable(message):
-    message = str(message)
-    parts = []
-    last_index = 0
-    for match in URL_PATTERN.finditer(message):
-        parts.append(html.escape(message[last_index:match.start()]))
-        url = match.group(0)
-        if 'tiktok' in url.lower():
-            safe_url = html.escape(url, quote=True)
-            parts.append(f"<a href=\"{safe_url}\">{safe_url}</a>")
-        else:
-            parts.append(html.escape(url))
-        last_index = match.end()
-    parts.append(html.escape(message[last_index:]))
-    return ''.join(parts)
-
-
-# Session tracking functions for blocked videos
-def load_session_data(download_folder):
-    """Load blocked and failed videos from favesave_errors.json file in download folder"""
-    session_file = path.join(download_folder, "favesave_errors.json")
-    blocked_videos = set()
-    failed_videos = set()
-    
-    if path.exists(session_file):
-        try:
-            with open(session_file, 'r') as f:
-                session_data = json_load(f)
-                blocked_videos = set(session_data.get('blocked', []))
-                failed_videos = set(session_data.get('failed', []))
-        except (json.JSONDecodeError, FileNotFoundError, KeyError):
-            # If file is corrupted or doesn't exist, start with empty sets
-            blocked_videos = set()
-            failed_videos = set()
-    
-    return blocked_videos, failed_videos
-
-
-def save_session_data(download_folder, blocked_videos, failed_videos):
-    """Save blocked and failed videos to favesave_errors.json file in download folder"""
-    session_file = path.join(download_folder, "favesave_errors.json")
-    session_data = {
-        'blocked': list(blocked_videos),
-        'failed': list(failed_videos)
-    }
-    
-    try:
-        with open(session_file, 'w') as f:
-            json_dump(session_data, f, indent=2)
-    except Exception as e:
-        print(f"Warning: Could not save session data: {e}")
-
 
+from FaveSaveCore import (
+    FOLDER_LAYOUTS,
+    ActivityDateIndex,
+    BandwidthSchedule,
+    DownloadOptions,
+    clear_session_data,
+    format_byte_rate,
+    format_time_of_day,
+    load_session_data,
+    make_links_clickable,
+    process_videos,
+)
 
 
 # Determine the path to the logo based on whether the app is bundled
@@ -97,389 +54,6 @@ if hasattr(sys, '_MEIPASS'):
 else:
     logo_path = path.join(path.dirname(__file__), 'img', 'logo.png')
 
-# Function to load JSON file with explicit UTF-8 encoding
-def load_json(json_file):
-    try:
-        with open(json_file, 'r', encoding='utf-8') as file:  # Explicitly set UTF-8 encoding
-            return json_load(file)
-    except UnicodeDecodeError as e:
-        raise ValueError(f"Failed to decode JSON file. Ensure it's UTF-8 encoded. Error: {e}")
-    except Exception as e:
-        raise ValueError(f"Failed to load JSON file. Error: {e}")
-
-
-# Function to get data from JSON with fallback logic
-def get_activity_data(data, log_callback=None):
-    """
-    Get activity data from JSON with fallback logic.
-    First tries 'Your Activity' node, then falls back to 'Likes and Favorites' node.
-    """
-    # Try 'Your Activity' first
-    your_activity = data.get('Your Activity', {})
-    if your_activity:
-        if log_callback:
-            log_callback("📊 Using 'Your Activity' node for data parsing")
-        return your_activity
-    
-    # Fall back to 'Likes and Favorites'
-    likes_and_favorites = data.get('Likes and Favorites', {})
-    if likes_and_favorites:
-        if log_callback:
-            log_callback("📊 'Your Activity' node not found, falling back to 'Likes and Favorites' node")
-        return likes_and_favorites
-    
-    # If neither exists, return empty dict
-    if log_callback:
-        log_callback("⚠️ Neither 'Your Activity' nor 'Likes and Favorites' nodes found in JSON")
-    return {}
-
-
-# Function to parse date string and check if it's after earliest date
-def is_date_after_earliest(date_str, earliest_date):
-    if not date_str or not earliest_date:
-        return True
-    
-    try:
-        from datetime import datetime
-        # Extract just the date part (before the space) from TikTok format "YYYY-MM-DD HH:MM:SS"
-        date_part = date_str.split(' ')[0] if ' ' in date_str else date_str
-        
-        # Parse the date part
-        video_date = datetime.strptime(date_part, '%Y-%m-%d').date()
-        result = video_date >= earliest_date
-        return result
-    except Exception as e:
-        # If parsing fails, include the video
-        return True
-
-
-
-# Function to download video using yt-dlp
-def download_video(video_url, download_folder, prefix, stop_event=None):
-    if stop_event and stop_event.is_set():
-        raise DownloadCancelled('Download cancelled before start')
-
-    def _progress_hook(d):
-        if stop_event and stop_event.is_set():
-            raise DownloadCancelled('Download cancelled by user')
-
-    ydl_opts = {
-        # Output template for downloaded videos
-        'outtmpl': path.join(download_folder, f"{prefix}%(id)s.%(ext)s"),
-        # Specify the format to download: best available video and audio
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
-        'progress_hooks': [_progress_hook],
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([video_url])
-
-
-# Function to check if a video is already downloaded
-def is_video_downloaded(video_url, downloaded_videos, prefix):
-    # Extract video_id from URL (assuming the last part of the path is the video id)
-    video_id = video_url.strip('/').split('/')[-1]
-    expected_filenames = [
-        file for file in downloaded_videos
-        if file.startswith(prefix)
-        and (file.endswith(f"{video_id}.mp4")
-             or file.endswith(f"{video_id}.m4a")
-             or file.endswith(f"{video_id}.mp3"))
-    ]
-    return len(expected_filenames) > 0
-
-
-# Function to get a set of already downloaded video filenames; creates folder if needed
-def get_downloaded_videos(download_folder):
-    downloaded_videos = set()
-    try:
-        makedirs(download_folder, exist_ok=True)
-        for file_name in listdir(download_folder):
-            downloaded_videos.add(file_name)
-    except PermissionError as e:
-        print(f"Warning: Permission denied accessing {download_folder}: {e}")
-        print("Using empty download list - all videos will be re-downloaded")
-    except Exception as e:
-        print(f"Warning: Error accessing download folder {download_folder}: {e}")
-        print("Using empty download list - all videos will be re-downloaded")
-    return downloaded_videos
-
-
-# Main processing function (with progress callback added)
-def process_videos(json_file, download_folder, log_callback, progress_callback, detailed_progress_callback, download_faves, download_likes, earliest_date=None, stop_event=None, max_concurrent_downloads=3, blocked_videos=None, failed_videos=None):
-    # Attempt to load the JSON file
-    try:
-        data = load_json(json_file)
-    except Exception as e:
-        log_callback(f"Error loading JSON file: {e}")
-        return 0, 0, 0, 0, 0, 0, 0, []  # Return zero counts on error
-
-    video_links = []
-
-    # Get activity data with fallback logic
-    activity_data = get_activity_data(data, log_callback)
-
-    # Process favorite videos if selected
-    if download_faves:
-        favorite_videos = activity_data.get('Favorite Videos', {}).get('FavoriteVideoList', [])
-        for video in favorite_videos:
-            # Check if video date is after earliest date filter
-            video_date = video.get('Date', '')
-            if is_date_after_earliest(video_date, earliest_date):
-                # Format date for filename prefix
-                date = video_date.replace(':', '').replace(' ', '-').replace('/', '-')
-                video_links.append((video['Link'], f"faved_{date}_" if date else "faved_"))
-
-    # Process liked videos if selected
-    if download_likes:
-        liked_videos = activity_data.get('Like List', {}).get('ItemFavoriteList', [])
-        for video in liked_videos:
-            # Check if video date is after earliest date filter
-            video_date = video.get('date', '')
-            if is_date_after_earliest(video_date, earliest_date):
-                # Format date for filename prefix
-                date = video_date.replace(':', '').replace(' ', '-').replace('/', '-')
-                video_links.append((video['link'], f"liked_{date}_" if date else "liked_"))
-
-    # Validate download folder and get existing videos
-    try:
-        downloaded_videos = get_downloaded_videos(download_folder)
-        log_callback(f"📁 Download folder: {download_folder}")
-        log_callback(f"📊 Found {len(downloaded_videos)} existing videos")
-    except Exception as e:
-        log_callback(f"❌ Error accessing download folder: {e}")
-        log_callback("🔄 Using empty download list - all videos candidates")
-        downloaded_videos = set()
-
-    total_videos = len(video_links)
-    if total_videos == 0:
-        log_callback("No videos to download.")
-        return 0, 0, 0, 0, 0, 0, 0, []
-
-    downloaded_count = 0
-    blocked_count = 0
-    failed_count = 0
-    downloaded_faves = 0
-    downloaded_likes = 0
-
-    start_time = time.time()
-    download_times = []
-    processed_count = 0
-    active_futures = {}
-    stall_reported = False
-    STALL_THRESHOLD = 60
-    stop_event = stop_event or threading.Event()
-    pending_tasks = []
-
-    def emit_progress(context):
-        elapsed_time = time.time() - start_time
-        video_id = context['url'].strip('/').split('/')[-1]
-        detailed_progress_callback({
-            'current_video': min(context['index'], total_videos),
-            'total_videos': total_videos,
-            'current_url': context['url'],
-            'video_id': video_id,
-            'prefix': context['prefix'],
-            'elapsed_time': elapsed_time,
-            'downloaded_count': downloaded_count,
-            'failed_count': failed_count
-        })
-
-    def update_progress_bar():
-        if total_videos == 0:
-            progress = 0
-        else:
-            progress = int((processed_count / total_videos) * 100)
-        progress_callback(progress)
-
-    def check_for_stall():
-        nonlocal stall_reported
-        if not active_futures:
-            if stall_reported:
-                stall_reported = False
-            return
-        current_time = time.time()
-        stalled = any(
-            info.get('start_time') is not None and current_time - info['start_time'] > STALL_THRESHOLD
-            for info in active_futures.values()
-        )
-        if stalled and not stall_reported:
-            stall_reported = True
-            log_callback(f"⚠️ Download appears stalled (>{STALL_THRESHOLD}s)")
-        elif not stalled and stall_reported:
-            stall_reported = False
-            log_callback("✅ Download resumed...")
-
-    def download_task(url, prefix):
-        start = time.time()
-        try:
-            download_video(url, download_folder, prefix, stop_event=stop_event)
-            duration = time.time() - start
-            return {'status': 'downloaded', 'duration': duration}
-        except DownloadCancelled:
-            return {'status': 'cancelled'}
-        except Exception as exc:
-            return {'status': 'error', 'error': str(exc)}
-
-    def harvest_futures(block):
-        nonlocal downloaded_count, processed_count, downloaded_faves, downloaded_likes, failed_count
-        if not active_futures:
-            return False
-        timeout = None if block else 0
-        done, _ = wait(list(active_futures.keys()), timeout=timeout, return_when=FIRST_COMPLETED)
-        if not done:
-            return False
-        for future in done:
-            context = active_futures.pop(future)
-            result = {}
-            try:
-                result = future.result()
-            except DownloadCancelled:
-                result = {'status': 'cancelled'}
-            except Exception as exc:
-                result = {'status': 'error', 'error': str(exc)}
-
-            status = result.get('status')
-            if status == 'downloaded':
-                duration = result.get('duration')
-                if duration:
-                    download_times.append(duration)
-                downloaded_count += 1
-                if "faved_" in context['prefix']:
-                    downloaded_faves += 1
-                elif "liked_" in context['prefix']:
-                    downloaded_likes += 1
-                log_callback(f"✅ Downloaded: {context['url']}")
-            elif status == 'cancelled':
-                log_callback(f"🛑 Cancelled: {context['url']}")
-            else:
-                error_message = result.get('error', 'Unknown error')
-                url = context['url']
-                failed_count += 1
-                # Check if this is a blocked video error
-                if 'IP address is blocked' in error_message:
-                    log_callback(f"🚫 Blocked: {url} - IP address blocked")
-                    # Add to blocked videos set and save to session
-                    if blocked_videos is not None:
-                        """Add a video URL to the blocked set and save to favesave_errors.json"""
-                        blocked_videos.add(url)
-                        save_session_data(download_folder, blocked_videos, failed_videos)
-
-                else:
-                    log_callback(f"❌ Failed to download {url} : {error_message}")
-                    # Add to failed videos set and save to session
-                    if failed_videos is not None:
-                        """Add a video URL to the failed set and save to favesave_errors.json"""
-                        failed_videos.add(url)
-                        save_session_data(download_folder, blocked_videos, failed_videos)
-
-
-            processed_count += 1
-            check_for_stall()
-            emit_progress(context)
-            update_progress_bar()
-        return True
-
-    for index, (url, prefix) in enumerate(video_links, start=1):
-        if stop_event.is_set():
-            break
-        context = {'index': index, 'url': url, 'prefix': prefix}
-        
-        # Check if video is blocked
-        if blocked_videos and url in blocked_videos:
-            log_callback(f"🎥 Processing Video {index} of {total_videos}")
-            log_callback(f"🚫 Skipping blocked video: {url}")
-            failed_count += 1
-            processed_count += 1
-            emit_progress(context)
-            update_progress_bar()
-            QCoreApplication.processEvents()
-            continue
-
-        if failed_videos and url in failed_videos:
-            log_callback(f"🎥 Processing Video {index} of {total_videos}")
-            log_callback(f"❌ Skipping failed video: {url}")
-            failed_count += 1
-            processed_count += 1
-            emit_progress(context)
-            update_progress_bar()
-            QCoreApplication.processEvents()
-            continue
-
-        if is_video_downloaded(url, downloaded_videos, prefix):
-            log_callback(f"🎥 Processing Video {index} of {total_videos}")
-            log_callback(f"Already downloaded: {url}")
-            downloaded_count += 1
-            if "faved_" in prefix:
-                downloaded_faves += 1
-            elif "liked_" in prefix:
-                downloaded_likes += 1
-            processed_count += 1
-            emit_progress(context)
-            update_progress_bar()
-            QCoreApplication.processEvents()
-        else:
-            pending_tasks.append(context)
-
-    if stop_event.is_set():
-        update_progress_bar()
-        return (
-            total_videos,
-            downloaded_count,
-            failed_count,
-            downloaded_faves,
-            downloaded_likes,
-            video_links
-        )
-
-    with ThreadPoolExecutor(max_workers=max_concurrent_downloads) as executor:
-        for context in pending_tasks:
-            if stop_event.is_set():
-                log_callback("Cancellation requested - stopping new downloads")
-                break
-
-            emit_progress(context)
-            log_callback(f"🎥 Processing Video {context['index']} of {total_videos}")
-
-            url = context['url']
-            prefix = context['prefix']
-            log_callback(f"Downloading: {url}")
-
-            while len(active_futures) >= max_concurrent_downloads and not stop_event.is_set():
-                if not harvest_futures(block=True):
-                    break
-                check_for_stall()
-
-            if stop_event.is_set():
-                break
-
-            future = executor.submit(download_task, url, prefix)
-            context['start_time'] = time.time()
-            active_futures[future] = context
-            check_for_stall()
-
-            while harvest_futures(block=False):
-                check_for_stall()
-
-        if stop_event.is_set():
-            for future in list(active_futures.keys()):
-                future.cancel()
-
-        while active_futures:
-            harvest_futures(block=True)
-            check_for_stall()
-
-    update_progress_bar()
-
-    return (
-        total_videos,
-        downloaded_count,
-        blocked_count,
-        failed_count,
-        downloaded_faves,
-        downloaded_likes,
-        video_links
-    )
-
 
 # Worker Thread to handle video processing in the background
 class VideoDownloadWorker(QThread):
@@ -507,6 +81,18 @@ class VideoDownloadWorker(QThread):
         self.current_video_index = 0
         self.stop_event = threading.Event()
         self.max_concurrent_downloads = 3
+        self.adaptive_concurrency = False
+        self.requests_per_minute = 0
+        self.rate_jitter = 0.0
+        self.use_processes = False
+        self.extraction_concurrency = 0
+        self.metrics_path = None
+        # Shared bandwidth cap; its limit may be changed while the download runs
+        self.bandwidth_schedule = None
+        self.folder_layout = None
+        self.verify_files = False
+        # Optional thread-safe log sink; defaults to one log_signal per message
+        self.log_callback = None
 
 
     def run(self):
@@ -514,7 +100,7 @@ class VideoDownloadWorker(QThread):
         results = process_videos(
             self.json_file,
             self.download_folder,
-            self.log_signal.emit,
+            self.log_callback or self.log_signal.emit,
             self.progress_signal.emit,
             self.detailed_progress_signal.emit,
             self.download_faves,
@@ -523,7 +109,18 @@ class VideoDownloadWorker(QThread):
             stop_event=self.stop_event,
             max_concurrent_downloads=self.max_concurrent_downloads,
             blocked_videos=self.blocked_videos,
-            failed_videos=self.failed_videos
+            failed_videos=self.failed_videos,
+            options=DownloadOptions(
+                adaptive_concurrency=self.adaptive_concurrency,
+                requests_per_minute=self.requests_per_minute,
+                rate_jitter=self.rate_jitter,
+                use_processes=self.use_processes,
+                extraction_concurrency=self.extraction_concurrency,
+                metrics_path=self.metrics_path,
+                bandwidth_schedule=self.bandwidth_schedule,
+                folder_layout=self.folder_layout,
+                verify_files=self.verify_files
+            )
         )
         (
             self.total_videos,
@@ -541,6 +138,15 @@ class VideoDownloadWorker(QThread):
 
 # PyQt6 Main Window for the Video Downloader Application
 class VideoDownloaderApp(QMainWindow):
+    # Log lines are coalesced and flushed to the view in batches every LOG_FLUSH_INTERVAL_MS,
+    # and the view keeps only the newest MAX_LOG_BLOCKS lines (the log file keeps everything)
+    LOG_FLUSH_INTERVAL_MS = 75
+    MAX_LOG_BLOCKS = 5000
+    LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+    LOG_FILE_BACKUPS = 3
+    # Random extra delay (fraction of the rate-limit interval) when jitter is enabled
+    RATE_JITTER = 0.5
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("FaveSave - TikTok Video Downloader -v1.2.0")
@@ -558,6 +164,11 @@ class VideoDownloaderApp(QMainWindow):
         # Session tracking for blocked and failed videos (will be loaded when download folder is set)
         self.blocked_videos = set()
         self.failed_videos = set()
+
+        # Time-of-day bandwidth windows; only editable in settings.json for now
+        self.bandwidth_windows = []
+        # Window last reported as overriding a live cap change
+        self.bandwidth_window_notice = None
         
         # Watchdog system
         self.watchdog_timer = None
@@ -566,8 +177,16 @@ class VideoDownloaderApp(QMainWindow):
         self.watchdog_timeout = 30  # 30 seconds timeout
         self.max_hang_duration = 120  # 2 minutes before showing recovery dialog
 
+        # Log pipeline: pending lines are appended from any thread and flushed by a timer
+        self.log_queue = deque()
+        self.log_flush_timer = None
+        self.file_logger = None
+
         # Initialize UI components
         self.init_ui()
+
+        # Initialize batched log view and log file
+        self.init_log_pipeline()
         
         # Initialize watchdog system
         self.init_watchdog()
@@ -580,7 +199,7 @@ class VideoDownloaderApp(QMainWindow):
             self.load_session_data()
 
     def load_session_data(self):
-        """Load blocked and failed videos from session file in download folder"""
+        """Load blocked and failed videos from the catalog in the download folder"""
         if self.download_folder:
             self.blocked_videos, self.failed_videos = load_session_data(self.download_folder)
 
@@ -664,10 +283,103 @@ class VideoDownloaderApp(QMainWindow):
         self.concurrent_downloads_spinner.setToolTip("Number of videos to download simultaneously (1-10)")
         self.concurrent_downloads_spinner.valueChanged.connect(self.on_concurrent_downloads_changed)
         concurrent_layout.addWidget(self.concurrent_downloads_spinner)
+
+        # Extraction stage concurrency (pipeline mode)
+        extraction_label = QLabel("🔀 Resolve Ahead:")
+        extraction_label.setStyleSheet("font-size: 12px;")
+        concurrent_layout.addWidget(extraction_label)
+
+        self.extraction_concurrency_spinner = QSpinBox()
+        self.extraction_concurrency_spinner.setMinimum(0)
+        self.extraction_concurrency_spinner.setMaximum(10)
+        self.extraction_concurrency_spinner.setValue(0)  # Default to single-stage downloads
+        self.extraction_concurrency_spinner.setSpecialValueText("Off")
+        self.extraction_concurrency_spinner.setToolTip("Number of videos whose info is fetched ahead of time, so slow pages don't hold a download slot (0 = off)")
+        self.extraction_concurrency_spinner.valueChanged.connect(self.save_settings)
+        concurrent_layout.addWidget(self.extraction_concurrency_spinner)
         
         concurrent_layout.addStretch()  # Push controls to the left
         self.advanced_settings_layout.addLayout(concurrent_layout)
 
+        # Adaptive concurrency checkbox
+        self.adaptive_concurrency_checkbox = QCheckBox("⚡ Adaptive concurrency - tune automatically up to the maximum above")
+        self.adaptive_concurrency_checkbox.setChecked(False)  # Default to fixed concurrency
+        self.adaptive_concurrency_checkbox.setStyleSheet("font-size: 12px;")
+        self.adaptive_concurrency_checkbox.setToolTip("Raise concurrency while throughput improves, back off sharply on blocks/timeouts")
+        self.adaptive_concurrency_checkbox.toggled.connect(self.save_settings)  # Save settings when toggled
+        self.advanced_settings_layout.addWidget(self.adaptive_concurrency_checkbox)
+
+        # Request rate limit setting
+        rate_layout = QHBoxLayout()
+        rate_label = QLabel("⏱️ Max Downloads per Minute:")
+        rate_label.setStyleSheet("font-size: 12px;")
+        rate_layout.addWidget(rate_label)
+
+        self.rate_limit_spinner = QSpinBox()
+        self.rate_limit_spinner.setMinimum(0)
+        self.rate_limit_spinner.setMaximum(600)
+        self.rate_limit_spinner.setValue(0)  # Default to unlimited
+        self.rate_limit_spinner.setSpecialValueText("Unlimited")
+        self.rate_limit_spinner.setToolTip("Pace download starts across all workers to avoid IP blocks (0 = unlimited)")
+        self.rate_limit_spinner.valueChanged.connect(self.save_settings)
+        rate_layout.addWidget(self.rate_limit_spinner)
+
+        self.rate_jitter_checkbox = QCheckBox("Random jitter")
+        self.rate_jitter_checkbox.setChecked(False)
+        self.rate_jitter_checkbox.setStyleSheet("font-size: 12px;")
+        self.rate_jitter_checkbox.setToolTip("Add a random delay to each download so requests don't follow a regular pattern")
+        self.rate_jitter_checkbox.toggled.connect(self.save_settings)
+        rate_layout.addWidget(self.rate_jitter_checkbox)
+
+        rate_layout.addStretch()  # Push controls to the left
+        self.advanced_settings_layout.addLayout(rate_layout)
+
+        # Bandwidth cap setting (stays adjustable while downloading)
+        bandwidth_layout = QHBoxLayout()
+        bandwidth_label = QLabel("📶 Bandwidth Cap:")
+        bandwidth_label.setStyleSheet("font-size: 12px;")
+        bandwidth_layout.addWidget(bandwidth_label)
+
+        self.bandwidth_spinner = QDoubleSpinBox()
+        self.bandwidth_spinner.setMinimum(0)
+        self.bandwidth_spinner.setMaximum(1000)
+        self.bandwidth_spinner.setDecimals(1)
+        self.bandwidth_spinner.setSingleStep(0.5)
+        self.bandwidth_spinner.setSuffix(" MB/s")
+        self.bandwidth_spinner.setValue(0)  # Default to unlimited
+        self.bandwidth_spinner.setSpecialValueText("Unlimited")
+        self.bandwidth_spinner.setToolTip("Combined download speed of all simultaneous downloads; can be changed during a download (0 = unlimited)")
+        self.bandwidth_spinner.valueChanged.connect(self.update_bandwidth_limit)
+        bandwidth_layout.addWidget(self.bandwidth_spinner)
+
+        bandwidth_layout.addStretch()  # Push controls to the left
+        self.advanced_settings_layout.addLayout(bandwidth_layout)
+
+        # Process mode checkbox
+        self.process_mode_checkbox = QCheckBox("🧩 Download in separate processes (faster at high concurrency)")
+        self.process_mode_checkbox.setChecked(False)  # Default to worker threads
+        self.process_mode_checkbox.setStyleSheet("font-size: 12px;")
+        self.process_mode_checkbox.setToolTip("Run each download slot's yt-dlp in its own process so they don't compete for one CPU core")
+        self.process_mode_checkbox.toggled.connect(self.save_settings)  # Save settings when toggled
+        self.advanced_settings_layout.addWidget(self.process_mode_checkbox)
+
+        # Folder layout setting
+        layout_layout = QHBoxLayout()
+        layout_label = QLabel("🗂️ Folder Layout:")
+        layout_label.setStyleSheet("font-size: 12px;")
+        layout_layout.addWidget(layout_label)
+
+        self.folder_layout_combo = QComboBox()
+        for layout_name, description in FOLDER_LAYOUTS.items():
+            self.folder_layout_combo.addItem(description, layout_name)
+        self.folder_layout_combo.setCurrentIndex(0)  # Default to one flat folder
+        self.folder_layout_combo.setToolTip("How videos are organized in the download folder; existing videos are moved on the next download when this changes")
+        self.folder_layout_combo.currentIndexChanged.connect(self.save_settings)
+        layout_layout.addWidget(self.folder_layout_combo)
+
+        layout_layout.addStretch()  # Push controls to the left
+        self.advanced_settings_layout.addLayout(layout_layout)
+
         # Retry previous failures checkbox
         self.retry_failures_checkbox = QCheckBox("🔄 Retry failed downloads on subsequent runs")
         self.retry_failures_checkbox.setChecked(False)  # Default to unchecked
@@ -675,6 +387,14 @@ class VideoDownloaderApp(QMainWindow):
         self.retry_failures_checkbox.toggled.connect(self.save_settings)  # Save settings when toggled
         self.advanced_settings_layout.addWidget(self.retry_failures_checkbox)
 
+        # Verify downloaded files checkbox
+        self.verify_files_checkbox = QCheckBox("🩺 Verify downloaded files first and re-download damaged ones")
+        self.verify_files_checkbox.setChecked(False)  # Default to unchecked
+        self.verify_files_checkbox.setStyleSheet("font-size: 12px;")
+        self.verify_files_checkbox.setToolTip("Check every video's MP4 structure and checksum before downloading; files unchanged since their last check are skipped")
+        self.verify_files_checkbox.toggled.connect(self.save_settings)  # Save settings when toggled
+        self.advanced_settings_layout.addWidget(self.verify_files_checkbox)
+
         # Date filter setting
         self.enable_date_filter = QCheckBox("🔍 Filter by earliest date - only videos from selected date onwards considered")
         self.enable_date_filter.setChecked(False)  # Default to download all
@@ -706,6 +426,7 @@ class VideoDownloaderApp(QMainWindow):
         self.description.setOpenExternalLinks(True)
         self.description.setTextInteractionFlags(Qt.TextInteractionFlag.TextBrowserInteraction)
         self.description.setMinimumHeight(150)  # Set minimum height for better log visibility
+        self.description.document().setMaximumBlockCount(self.MAX_LOG_BLOCKS)  # Oldest lines are trimmed
         layout.addWidget(self.description)
 
         # Progress bar for download progress
@@ -803,7 +524,7 @@ class VideoDownloaderApp(QMainWindow):
         layout.addWidget(donation_label)
 
 
-    # Get cached JSON data, loading from file only if necessary
+    # Get the cached date index for the JSON file, streaming the file only if necessary
     def get_cached_json_data(self):
         if not self.json_file:
             return None
@@ -812,7 +533,7 @@ class VideoDownloaderApp(QMainWindow):
         if (self._cached_json_data is None or 
             self._cached_json_file != self.json_file):
             try:
-                self._cached_json_data = load_json(self.json_file)
+                self._cached_json_data = ActivityDateIndex.from_json(self.json_file)
                 self._cached_json_file = self.json_file
             except Exception:
                 self._cached_json_data = None
@@ -828,7 +549,7 @@ class VideoDownloaderApp(QMainWindow):
         try:
             data = self.get_cached_json_data()
             if data is None:
-                return 0, 0, 0, 0
+                return 0, 0, 0
             
             # Get earliest date if filtering is enabled
             earliest_date = None
@@ -837,26 +558,9 @@ class VideoDownloaderApp(QMainWindow):
                 from datetime import date
                 earliest_date = date(qdate.year(), qdate.month(), qdate.day())
             
-            # Get activity data with fallback logic
-            activity_data = get_activity_data(data, None)  # No logging for count calculation
-            
-            # Count favorite videos
-            favorite_videos = activity_data.get('Favorite Videos', {}).get('FavoriteVideoList', [])
-            faves_count = 0
-            if self.faves_checkbox.isChecked():
-                for video in favorite_videos:
-                    video_date = video.get('Date', '')
-                    if is_date_after_earliest(video_date, earliest_date):  # No logging for count calculation
-                        faves_count += 1
-            
-            # Count liked videos
-            liked_videos = activity_data.get('Like List', {}).get('ItemFavoriteList', [])
-            likes_count = 0
-            if self.likes_checkbox.isChecked():
-                for video in liked_videos:
-                    video_date = video.get('date', '')
-                    if is_date_after_earliest(video_date, earliest_date):  # No logging for count calculation
-                        likes_count += 1
+            # Count favorite and liked videos (a bisect over the pre-sorted dates)
+            faves_count = data.count('Favorite Videos', earliest_date) if self.faves_checkbox.isChecked() else 0
+            likes_count = data.count('Like List', earliest_date) if self.likes_checkbox.isChecked() else 0
             
             total_count = faves_count + likes_count
             return faves_count, likes_count, total_count
@@ -898,20 +602,64 @@ class VideoDownloaderApp(QMainWindow):
         """Called when the concurrent downloads value changes"""
         self.save_settings()  # Save settings when value changes
 
-    # Append message to the log area
+    # Set up the log flush timer and the rotating log file
+    def init_log_pipeline(self):
+        self.log_flush_timer = QTimer(self)
+        self.log_flush_timer.timeout.connect(self.flush_log_queue)
+        self.log_flush_timer.start(self.LOG_FLUSH_INTERVAL_MS)
+
+        try:
+            log_dir = path.join(path.dirname(self.get_settings_file_path()), "logs")
+            os.makedirs(log_dir, exist_ok=True)
+            handler = RotatingFileHandler(
+                path.join(log_dir, "favesave.log"),
+                maxBytes=self.LOG_FILE_MAX_BYTES,
+                backupCount=self.LOG_FILE_BACKUPS,
+                encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.file_logger = logging.getLogger("favesave")
+            self.file_logger.setLevel(logging.INFO)
+            self.file_logger.propagate = False
+            self.file_logger.handlers = [handler]
+        except Exception as e:
+            self.file_logger = None
+            self.log_message(f"⚠️ Could not open log file: {e}")
+
+    # Queue a message for the log area (safe to call from the worker thread)
     def log_message(self, message):
-        text = str(message)
-        lines = text.splitlines() or ['']
+        lines = str(message).splitlines() or ['']
+        self.log_queue.extend(lines)
+        if self.file_logger:
+            for line in lines:
+                self.file_logger.info(line)
+
+    # Append all queued messages to the log area in one batch
+    def flush_log_queue(self):
+        pending_count = len(self.log_queue)
+        if not pending_count:
+            return
+        lines = [self.log_queue.popleft() for _ in range(pending_count)]
+        # Lines beyond the block limit would be trimmed straight away, so don't render them
+        lines = lines[-self.MAX_LOG_BLOCKS:]
+
+        document = self.description.document()
+        cursor = self.description.textCursor()
+        cursor.movePosition(cursor.MoveOperation.End)
+        cursor.beginEditBlock()
         for line in lines:
             if 'http' in line.lower():
                 formatted_message = make_links_clickable(line)
             else:
                 formatted_message = html.escape(line)
-            # Use append for consistency; Qt wraps each call in its own block.
-            self.description.append(formatted_message if formatted_message else '&nbsp;')
+            # One block per line so the block limit trims whole lines
+            if not document.isEmpty():
+                cursor.insertBlock()
+            cursor.setCharFormat(QTextCharFormat())  # Don't carry link formatting into the next line
+            cursor.insertHtml(formatted_message if formatted_message else '&nbsp;')
+        cursor.endEditBlock()
+
         # Scroll to bottom to show latest message
-        cursor = self.description.textCursor()
-        cursor.movePosition(cursor.MoveOperation.End)
         self.description.setTextCursor(cursor)
         self.description.ensureCursorVisible()
         # Update heartbeat for watchdog
@@ -1033,11 +781,10 @@ class VideoDownloaderApp(QMainWindow):
         # Check if user wants to retry previous failures
         if self.retry_failures_checkbox.isChecked():
             try:
-                # Delete the favesave_errors.json file if it exists
-                session_file = path.join(self.download_folder, "favesave_errors.json")
-                if path.exists(session_file):
-                    os.remove(session_file)
-                    self.log_message(f"🗑️ Cleared previous failures - deleted: {session_file}")
+                # Mark previously blocked/failed videos in the catalog as pending again
+                cleared_count = clear_session_data(self.download_folder)
+                if cleared_count:
+                    self.log_message(f"🗑️ Cleared {cleared_count:,} previous failures from the download catalog")
                 else:
                     self.log_message("ℹ️ No previous failures found to clear")
                 
@@ -1078,7 +825,17 @@ class VideoDownloaderApp(QMainWindow):
         max_concurrent = self.concurrent_downloads_spinner.value()
         self.worker = VideoDownloadWorker(self.json_file, self.download_folder, download_faves, download_likes, earliest_date, self.blocked_videos, self.failed_videos)
         self.worker.max_concurrent_downloads = max_concurrent
-        self.worker.log_signal.connect(self.log_message)
+        self.worker.adaptive_concurrency = self.adaptive_concurrency_checkbox.isChecked()
+        self.worker.requests_per_minute = self.rate_limit_spinner.value()
+        self.worker.rate_jitter = self.RATE_JITTER if self.rate_jitter_checkbox.isChecked() else 0.0
+        self.worker.use_processes = self.process_mode_checkbox.isChecked()
+        self.worker.extraction_concurrency = self.extraction_concurrency_spinner.value()
+        self.worker.folder_layout = self.folder_layout_combo.currentData()
+        self.worker.verify_files = self.verify_files_checkbox.isChecked()
+        self.worker.bandwidth_schedule = BandwidthSchedule(self.bandwidth_spinner.value() * 1e6, self.bandwidth_windows)
+        # Stage timings of the last run, next to the settings file
+        self.worker.metrics_path = path.join(path.dirname(self.get_settings_file_path()), "metrics.json")
+        self.worker.log_callback = self.log_message  # Batched by the log flush timer
         self.worker.progress_signal.connect(self.update_progress_bar)
         self.worker.detailed_progress_signal.connect(self.update_detailed_progress)
         self.worker.finished.connect(self.on_worker_finished)
@@ -1158,7 +915,14 @@ class VideoDownloaderApp(QMainWindow):
             self.enable_date_filter.setEnabled(False)
             self.date_filter.setEnabled(False)
             self.concurrent_downloads_spinner.setEnabled(False)
+            self.extraction_concurrency_spinner.setEnabled(False)
+            self.adaptive_concurrency_checkbox.setEnabled(False)
+            self.rate_limit_spinner.setEnabled(False)
+            self.rate_jitter_checkbox.setEnabled(False)
+            self.process_mode_checkbox.setEnabled(False)
+            self.folder_layout_combo.setEnabled(False)
             self.retry_failures_checkbox.setEnabled(False)
+            self.verify_files_checkbox.setEnabled(False)
         else:
             # Update button text based on whether download was cancelled
             if self.was_cancelled:
@@ -1176,8 +940,29 @@ class VideoDownloaderApp(QMainWindow):
             self.enable_date_filter.setEnabled(True)
             self.date_filter.setEnabled(True)
             self.concurrent_downloads_spinner.setEnabled(True)
+            self.extraction_concurrency_spinner.setEnabled(True)
+            self.adaptive_concurrency_checkbox.setEnabled(True)
+            self.rate_limit_spinner.setEnabled(True)
+            self.rate_jitter_checkbox.setEnabled(True)
+            self.process_mode_checkbox.setEnabled(True)
+            self.folder_layout_combo.setEnabled(True)
             self.retry_failures_checkbox.setEnabled(True)
+            self.verify_files_checkbox.setEnabled(True)
     
+    # Apply a new bandwidth cap, also to a download in progress
+    def update_bandwidth_limit(self, value):
+        if self.worker and self.worker.isRunning() and self.worker.bandwidth_schedule:
+            # Picked up by the download scheduler within a fraction of a second
+            self.worker.bandwidth_schedule.limit = value * 1e6
+            # A time-of-day window takes precedence; say so once per window rather than on every step
+            window = self.worker.bandwidth_schedule.active_window()
+            if window is not None and window != self.bandwidth_window_notice:
+                _, end, limit = window
+                self.log_message(f"📶 A bandwidth window ({format_byte_rate(limit)}) applies until "
+                                 f"{format_time_of_day(end)}; the new cap takes effect after it")
+            self.bandwidth_window_notice = window
+        self.save_settings()
+
     # Cancel the download process
     def cancel_download(self):
         if self.worker and self.worker.isRunning():
@@ -1215,11 +1000,23 @@ class VideoDownloaderApp(QMainWindow):
         avg_time_per_video = elapsed / current if current > 0 else 0
         estimated_remaining_time = remaining_videos * avg_time_per_video
                
+        # Byte-level throughput: aggregate speed, ETA and the speed of each running transfer
+        rate = progress_info.get('bytes_per_second', 0.0)
+        eta = progress_info.get('eta_seconds')
+        eta_str = f"{int(eta // 60):02d}:{int(eta % 60):02d}" if eta is not None else "--:--"
+        slot_speeds = progress_info.get('slot_speeds', [])
+        slots_str = " · ".join(f"{speed / 1e6:.1f}" for speed in slot_speeds) or "-"
+        # Slots without a running transfer are still resolving the video page
+        resolving = progress_info.get('active_downloads', 0) - len(slot_speeds)
+        resolving_str = f" (+{resolving} resolving)" if resolving > 0 else ""
+
         # Update progress info label with enhanced information
         self.progress_info_label.setText(
             f"📊 Progress: {current:,}/{total:,} videos | "
             f"✅ Downloaded: {downloaded:,} | ❌ Failed: {failed:,} | "
-            f"⏱️ Elapsed: {elapsed_str}"
+            f"⏱️ Elapsed: {elapsed_str}\n"
+            f"📶 {rate / 1e6:.2f} MB/s | ⏳ ETA: {eta_str} | "
+            f"🔌 Slots: {slots_str} MB/s{resolving_str}"
         )
                        
         # Update heartbeat for watchdog
@@ -1336,6 +1133,14 @@ class VideoDownloaderApp(QMainWindow):
             if os.path.exists(settings_file):
                 with open(settings_file, 'r', encoding='utf-8') as f:
                     settings = json_load(f)
+
+                # Restore bandwidth windows first: restoring the widgets below saves the settings again
+                if 'bandwidth_windows' in settings:
+                    try:
+                        BandwidthSchedule.parse_windows(settings['bandwidth_windows'])
+                        self.bandwidth_windows = settings['bandwidth_windows']
+                    except (TypeError, ValueError) as e:
+                        self.log_message(f"⚠️ Ignoring bandwidth windows in settings: {e}")
                 
                 # Restore JSON file path
                 if 'json_file' in settings and settings['json_file']:
@@ -1382,11 +1187,39 @@ class VideoDownloaderApp(QMainWindow):
                 # Restore concurrent downloads setting
                 if 'concurrent_downloads' in settings:
                     self.concurrent_downloads_spinner.setValue(settings['concurrent_downloads'])
+                if 'extraction_concurrency' in settings:
+                    self.extraction_concurrency_spinner.setValue(settings['extraction_concurrency'])
+                
+                # Restore adaptive concurrency setting
+                if 'adaptive_concurrency' in settings:
+                    self.adaptive_concurrency_checkbox.setChecked(settings['adaptive_concurrency'])
+                
+                # Restore rate limit settings
+                if 'requests_per_minute' in settings:
+                    self.rate_limit_spinner.setValue(settings['requests_per_minute'])
+                if 'rate_jitter' in settings:
+                    self.rate_jitter_checkbox.setChecked(settings['rate_jitter'])
+
+                # Restore bandwidth setting
+                if 'bandwidth_limit_mb' in settings:
+                    self.bandwidth_spinner.setValue(settings['bandwidth_limit_mb'])
+                
+                # Restore process mode setting
+                if 'use_processes' in settings:
+                    self.process_mode_checkbox.setChecked(settings['use_processes'])
+                
+                # Restore folder layout setting
+                if settings.get('folder_layout') in FOLDER_LAYOUTS:
+                    self.folder_layout_combo.setCurrentIndex(self.folder_layout_combo.findData(settings['folder_layout']))
                 
                 # Restore retry failures setting
                 if 'retry_failures' in settings:
                     self.retry_failures_checkbox.setChecked(settings['retry_failures'])
                 
+                # Restore verify files setting
+                if 'verify_files' in settings:
+                    self.verify_files_checkbox.setChecked(settings['verify_files'])
+                
                 self.log_message("⚙️ Settings restored from previous session")
         except Exception as e:
             self.log_message(f"⚠️ Could not load settings: {e}")
@@ -1408,7 +1241,16 @@ class VideoDownloaderApp(QMainWindow):
                 'date_filter_enabled': self.enable_date_filter.isChecked(),
                 'date_filter_value': date_filter_value,
                 'concurrent_downloads': self.concurrent_downloads_spinner.value(),
-                'retry_failures': self.retry_failures_checkbox.isChecked()
+                'extraction_concurrency': self.extraction_concurrency_spinner.value(),
+                'adaptive_concurrency': self.adaptive_concurrency_checkbox.isChecked(),
+                'requests_per_minute': self.rate_limit_spinner.value(),
+                'rate_jitter': self.rate_jitter_checkbox.isChecked(),
+                'bandwidth_limit_mb': self.bandwidth_spinner.value(),
+                'bandwidth_windows': self.bandwidth_windows,
+                'use_processes': self.process_mode_checkbox.isChecked(),
+                'folder_layout': self.folder_layout_combo.currentData(),
+                'retry_failures': self.retry_failures_checkbox.isChecked(),
+                'verify_files': self.verify_files_checkbox.isChecked()
             }
             
             settings_file = self.get_settings_file_path()
@@ -1428,6 +1270,8 @@ class VideoDownloaderApp(QMainWindow):
 
 # Run the application
 if __name__ == "__main__":
+    # Needed for process mode in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = VideoDownloaderApp()
     window.show()
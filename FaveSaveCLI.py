@@ -0,0 +1,199 @@
+"""
+Headless command-line entry point for FaveSave.
+
+Runs the same download pipeline as the desktop app without importing Qt and
+reports progress as JSON lines on stdout, one event per line:
+
+    {"event": "log", "message": "..."}
+    {"event": "progress", "percent": 42}
+    {"event": "video", "current_video": 10, "total_videos": 200, ...}
+    {"event": "summary", "total_videos": 200, "downloaded": 180, "blocked": 5, "failed": 8, ...}
+
+"failed" counts every video that wasn't downloaded, including the "blocked" ones.
+
+yt-dlp's own messages go to stderr. Example crontab entry:
+
+    0 3 * * * python3 /opt/favesave/FaveSaveCLI.py --json ~/tiktok/user_data_tiktok.json --concurrency 3 >> ~/favesave.jsonl
+"""
+import argparse
+from datetime import date
+import json
+import multiprocessing
+from os import W_OK, access, makedirs, path
+import signal
+import sys
+import threading
+import time
+
+from FaveSaveCore import (
+    FOLDER_LAYOUTS,
+    BandwidthSchedule,
+    DownloadOptions,
+    clear_session_data,
+    load_session_data,
+    parse_byte_rate,
+    process_videos,
+)
+
+
+# Write one machine-readable event line to stdout
+def emit_event(event, **fields):
+    record = {'event': event, 'time': round(time.time(), 3)}
+    record.update(fields)
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+# argparse type for bandwidth values, with the parser's explanation on errors
+def byte_rate(value):
+    try:
+        return parse_byte_rate(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download your favorite/liked TikTok videos from an exported user_data_tiktok.json without the GUI."
+    )
+    parser.add_argument('--json', required=True, help="path to the exported TikTok JSON file")
+    parser.add_argument('--output', help="download folder (defaults to 'downloaded_videos' next to the JSON file)")
+    parser.add_argument('--layout', choices=list(FOLDER_LAYOUTS),
+                        help="folder layout: " + "; ".join(f"{name}: {description}" for name, description in FOLDER_LAYOUTS.items())
+                        + ". Existing videos are moved when it changes (default: keep the folder's current layout, flat for new folders)")
+    parser.add_argument('--no-faves', dest='faves', action='store_false', help="skip favorited videos")
+    parser.add_argument('--no-likes', dest='likes', action='store_false', help="skip liked videos")
+    parser.add_argument('--since', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                        help="only consider videos from this date onwards")
+    parser.add_argument('--concurrency', type=int, default=1, choices=range(1, 11), metavar='1-10',
+                        help="number of videos to download simultaneously (default: 1)")
+    parser.add_argument('--extract-concurrency', type=int, default=0, choices=range(0, 11), metavar='0-10',
+                        help="resolve up to N videos' info ahead of the downloads in a separate pool (default: 0, off)")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="tune concurrency automatically (up to --concurrency) based on throughput and blocks")
+    parser.add_argument('--processes', action='store_true',
+                        help="run each download slot in its own process instead of a thread")
+    parser.add_argument('--rate', type=int, default=0, metavar='N',
+                        help="start at most N video downloads per minute across all workers (default: unlimited)")
+    parser.add_argument('--jitter', type=float, default=0.0, metavar='FRACTION',
+                        help="add a random delay of up to FRACTION x the --rate interval to each download (0-1)")
+    parser.add_argument('--bandwidth', type=byte_rate, default=0, metavar='RATE',
+                        help="cap the combined download speed of all workers, e.g. 500K, 2M or 1.5MiB bytes/s (default: unlimited)")
+    parser.add_argument('--bandwidth-schedule', metavar='FILE',
+                        help="JSON file with a bandwidth limit and time-of-day windows; re-read during the run when it changes")
+    parser.add_argument('--verify', action='store_true',
+                        help="check every downloaded file first (MP4 structure and checksum, skipping files unchanged "
+                             "since their last check) and re-download damaged or missing ones")
+    parser.add_argument('--retry-failures', action='store_true',
+                        help="retry videos that failed or were blocked on previous runs")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write per-stage timing histograms and outcome counts as JSON to FILE at the end of the run")
+    parser.add_argument('--prometheus', metavar='FILE',
+                        help="keep FILE updated with the same metrics in Prometheus text format during the run")
+    parser.add_argument('--quiet', action='store_true', help="silence yt-dlp's own output on stderr")
+    args = parser.parse_args(argv)
+    if args.rate < 0:
+        parser.error("--rate must be 0 (unlimited) or a positive number of downloads per minute")
+    if not 0 <= args.jitter <= 1:
+        parser.error("--jitter must be between 0 and 1")
+    if not (args.faves or args.likes):
+        parser.error("--no-faves and --no-likes leave nothing to download")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if not path.isfile(args.json):
+        emit_event('error', message=f"JSON file not found: {args.json}")
+        return 1
+
+    download_folder = args.output or path.join(path.dirname(path.abspath(args.json)), "downloaded_videos")
+    try:
+        makedirs(download_folder, exist_ok=True)
+    except OSError as e:
+        emit_event('error', message=f"Cannot create download folder {download_folder}: {e}")
+        return 1
+    if not access(download_folder, W_OK):
+        emit_event('error', message=f"Cannot write to download folder: {download_folder}")
+        return 1
+
+    if args.retry_failures:
+        cleared_count = clear_session_data(download_folder)
+        emit_event('log', message=f"Cleared {cleared_count} previous failures - they will be retried")
+    blocked_videos, failed_videos = load_session_data(download_folder)
+
+    # Ctrl+C / SIGTERM cancel the run the same way the GUI's Cancel button does
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        if not stop_event.is_set():
+            emit_event('log', message="Cancellation requested - stopping downloads")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    # Edits to the schedule file are picked up during the run
+    bandwidth_schedule = None
+    if args.bandwidth or args.bandwidth_schedule:
+        bandwidth_schedule = BandwidthSchedule(args.bandwidth, file_path=args.bandwidth_schedule)
+
+    downloader_options = {'noprogress': True, 'logtostderr': True}
+    if args.quiet:
+        downloader_options['quiet'] = True
+
+    start_time = time.time()
+    (
+        total_videos,
+        downloaded_count,
+        blocked_count,
+        failed_count,
+        downloaded_faves,
+        downloaded_likes,
+        _
+    ) = process_videos(
+        args.json,
+        download_folder,
+        lambda message: emit_event('log', message=str(message)),
+        lambda percent: emit_event('progress', percent=percent),
+        lambda progress_info: emit_event('video', **progress_info),
+        args.faves,
+        args.likes,
+        args.since,
+        stop_event=stop_event,
+        max_concurrent_downloads=args.concurrency,
+        blocked_videos=blocked_videos,
+        failed_videos=failed_videos,
+        options=DownloadOptions(
+            downloader_options=downloader_options,
+            adaptive_concurrency=args.adaptive,
+            requests_per_minute=args.rate,
+            rate_jitter=args.jitter,
+            use_processes=args.processes,
+            extraction_concurrency=args.extract_concurrency,
+            metrics_path=args.metrics,
+            prometheus_path=args.prometheus,
+            bandwidth_schedule=bandwidth_schedule,
+            folder_layout=args.layout,
+            verify_files=args.verify
+        )
+    )
+
+    emit_event(
+        'summary',
+        total_videos=total_videos,
+        downloaded=downloaded_count,
+        blocked=blocked_count,
+        failed=failed_count,
+        downloaded_faves=downloaded_faves,
+        downloaded_likes=downloaded_likes,
+        elapsed_time=round(time.time() - start_time, 3),
+        cancelled=stop_event.is_set()
+    )
+    return 130 if stop_event.is_set() else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
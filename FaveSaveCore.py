@@ -0,0 +1,2836 @@
+"""
+FaveSave core: export parsing, download catalog and the download pipeline.
+This module has no Qt dependency so it can be driven by the GUI (FaveSave.py)
+or headless from the command line (FaveSaveCLI.py).
+"""
+from array import array
+import asyncio
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from datetime import date, datetime
+import hashlib
+import html
+import json
+from json import load as json_load
+import mmap
+import multiprocessing
+from os import makedirs, path
+import os
+import queue
+import random
+import re
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import types
+import zlib
+
+import yt_dlp
+from yt_dlp.utils import DownloadCancelled
+
+
+URL_PATTERN = re.compile(r"(https?://[^\s<>\"]+)")
+
+
+def make_links_clickable(message):
+    message = str(message)
+    parts = []
+    last_index = 0
+    for match in URL_PATTERN.finditer(message):
+        parts.append(html.escape(message[last_index:match.start()]))
+        url = match.group(0)
+        if 'tiktok' in url.lower():
+            safe_url = html.escape(url, quote=True)
+            parts.append(f"<a href=\"{safe_url}\">{safe_url}</a>")
+        else:
+            parts.append(html.escape(url))
+        last_index = match.end()
+    parts.append(html.escape(message[last_index:]))
+    return ''.join(parts)
+
+
+CATALOG_FILE = "favesave_catalog.db"
+LEGACY_SESSION_FILE = "favesave_errors.json"
+
+
+# Function to map a filename prefix (faved_/liked_) to its catalog source list
+def get_source_list(prefix):
+    return 'like' if prefix.startswith('liked_') else 'fave'
+
+
+# Function to build a video's filename prefix from its list label (faved/liked) and export date
+def get_file_prefix(label, video_date):
+    if not isinstance(video_date, str):
+        video_date = ''
+    date = video_date.replace(':', '').replace(' ', '-').replace('/', '-')
+    return f"{label}_{date}_" if date else f"{label}_"
+
+
+# Per-folder catalog of every video FaveSave has seen
+class DownloadCatalog:
+    """
+    SQLite catalog stored in the download folder with one row per video and source list.
+    Tracks status (pending/downloaded/failed/blocked), attempts, last error and the
+    downloaded file, and replaces the old favesave_errors.json session file. Partial
+    files of interrupted downloads are tracked too, so the next run resumes them, and
+    a manifest keeps the size, mtime and checksum of every verified file.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT NOT NULL,
+            source TEXT NOT NULL,
+            url TEXT,
+            export_date TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            file_path TEXT,
+            byte_size INTEGER,
+            duration REAL,
+            updated_at REAL,
+            PRIMARY KEY (video_id, source)
+        );
+        CREATE INDEX IF NOT EXISTS videos_status ON videos (status);
+        CREATE INDEX IF NOT EXISTS videos_file_path ON videos (file_path);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        -- Earlier versions cached the info of every downloaded video here; nothing read it
+        DROP TABLE IF EXISTS video_info;
+        CREATE TABLE IF NOT EXISTS resolved_info (
+            video_id TEXT PRIMARY KEY,
+            info BLOB NOT NULL,
+            fetched_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS partials (
+            file_path TEXT PRIMARY KEY,
+            video_id TEXT NOT NULL,
+            source TEXT NOT NULL,
+            byte_size INTEGER,
+            total_bytes INTEGER,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS manifest (
+            file_path TEXT PRIMARY KEY,
+            byte_size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            checksum TEXT,
+            error TEXT,
+            verified_at REAL NOT NULL
+        );
+    """
+
+    # Recorded events between explicit checkpoints of the write-ahead log
+    CHECKPOINT_INTERVAL = 500
+    # Info resolved ahead of its transfer is reused only this long (media URLs expire)
+    INFO_TTL = 3600
+
+    def __init__(self, download_folder):
+        self.download_folder = download_folder
+        makedirs(download_folder, exist_ok=True)
+        self.path = path.join(download_folder, CATALOG_FILE)
+        self._conn = sqlite3.connect(self.path)
+        # Write-ahead logging: each recorded event is an append to the -wal file, which is
+        # replayed on the next open if the app crashes and folded back into the database by
+        # checkpoints. NORMAL sync keeps commits fsync-free while staying crash-consistent.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._writes_since_checkpoint = 0
+        self._conn.executescript(self.SCHEMA)
+        self._import_legacy_session()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.prune_video_info()
+        self.checkpoint()
+        self._conn.close()
+
+    def checkpoint(self):
+        """Compact the write-ahead log into the database file"""
+        try:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error:
+            pass  # Another connection is reading; the next checkpoint will catch up
+        self._writes_since_checkpoint = 0
+
+    def _record_written(self):
+        self._writes_since_checkpoint += 1
+        if self._writes_since_checkpoint >= self.CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def sync_folder(self):
+        """
+        Reconcile the catalog with the video files on disk; returns (missing, new) counts.
+        Downloaded videos whose file is gone become pending again, so the next run downloads
+        them; video files the catalog doesn't know (downloaded before it existed, or copied in)
+        are recorded as downloaded. Only directory entries are read, plus a stat() per new file.
+        """
+        on_disk = {}
+        index = DownloadIndex()
+        for relative_path, entry in iter_folder_files(self.download_folder):
+            if index.add(relative_path):
+                on_disk[relative_path] = entry
+        recorded = {file_path for (file_path,) in self._conn.execute(
+            "SELECT DISTINCT file_path FROM videos WHERE status = 'downloaded' AND file_path IS NOT NULL")}
+        missing = [(file_path,) for file_path in recorded.difference(on_disk)]
+        now = time.time()
+        new_rows = []
+        for relative_path in on_disk.keys() - recorded:
+            entry = on_disk[relative_path]
+            video_id = path.splitext(entry.name)[0].rsplit('_', 1)[-1]
+            new_rows.append((video_id, get_source_list(entry.name), relative_path, entry.stat().st_size, now))
+        if not missing and not new_rows:
+            return 0, 0
+        with self._conn:
+            self._conn.executemany(
+                """UPDATE videos SET status = 'pending', last_error = 'File missing', file_path = NULL,
+                       byte_size = NULL, updated_at = ? WHERE file_path = ?""",
+                [(now, file_path) for (file_path,) in missing]
+            )
+            self._conn.executemany("DELETE FROM manifest WHERE file_path = ?", missing)
+            # A video already downloaded under another name (e.g. a catalog alias) keeps its row
+            cursor = self._conn.executemany(
+                """INSERT INTO videos (video_id, source, status, file_path, byte_size, updated_at)
+                   VALUES (?, ?, 'downloaded', ?, ?, ?)
+                   ON CONFLICT (video_id, source) DO UPDATE SET
+                       status = 'downloaded', file_path = excluded.file_path, byte_size = excluded.byte_size,
+                       updated_at = excluded.updated_at
+                   WHERE status != 'downloaded'""",
+                new_rows
+            )
+        return len(missing), cursor.rowcount
+
+    def _import_legacy_session(self):
+        """Move blocked/failed URLs from an old favesave_errors.json into the catalog"""
+        session_file = path.join(self.download_folder, LEGACY_SESSION_FILE)
+        if not path.exists(session_file):
+            return
+        try:
+            with open(session_file, 'r') as f:
+                session_data = json_load(f)
+        except (json.JSONDecodeError, OSError):
+            session_data = {}
+        with self._conn:
+            for status in ('blocked', 'failed'):
+                self._conn.executemany(
+                    """INSERT INTO videos (video_id, source, url, status, attempts, updated_at)
+                       VALUES (?, '', ?, ?, 1, ?)
+                       ON CONFLICT (video_id, source) DO NOTHING""",
+                    [(get_video_id(url), url, status, time.time()) for url in session_data.get(status, [])]
+                )
+        os.replace(session_file, session_file + ".migrated")
+
+    def get_layout(self):
+        """Folder layout the videos are stored in (see FOLDER_LAYOUTS)"""
+        return self._get_meta('layout') or 'flat'
+
+    def relocate_files(self, moves, layout):
+        """Record moved (old path, new path) files and the folder's new layout in one transaction"""
+        with self._conn:
+            self._conn.executemany("UPDATE videos SET file_path = ? WHERE file_path = ?", [(new, old) for old, new in moves])
+            self._conn.executemany("UPDATE partials SET file_path = ? WHERE file_path = ?", [(new, old) for old, new in moves])
+            self._conn.executemany("UPDATE manifest SET file_path = ? WHERE file_path = ?", [(new, old) for old, new in moves])
+            self._set_meta('layout', layout)
+
+    def register_candidates(self, candidates):
+        """Upsert (video_id, source, url, export_date) rows for this run's candidates"""
+        with self._conn:
+            self._conn.executemany(
+                """INSERT INTO videos (video_id, source, url, export_date, updated_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (video_id, source) DO UPDATE SET url = excluded.url, export_date = excluded.export_date""",
+                [(video_id, source, url, export_date, time.time()) for video_id, source, url, export_date in candidates]
+            )
+
+    def downloaded_files(self):
+        """File names of every downloaded video (a single indexed query)"""
+        return [row[0] for row in self._conn.execute(
+            "SELECT file_path FROM videos WHERE status = 'downloaded' AND file_path IS NOT NULL")]
+
+    def downloaded_aliases(self):
+        """
+        Names downloaded videos would have in their own list when they are stored under the
+        other list's file (a favorite that is also liked, on a file system without hardlinks)
+        """
+        aliases = []
+        for video_id, source, export_date, file_path in self._conn.execute(
+                """SELECT video_id, source, export_date, file_path FROM videos
+                   WHERE status = 'downloaded' AND file_path IS NOT NULL AND source != ''"""):
+            name = path.basename(file_path)
+            if get_source_list(name) != source:
+                label = 'liked' if source == 'like' else 'faved'
+                aliases.append(get_file_prefix(label, export_date or '') + video_id + path.splitext(name)[1])
+        return aliases
+
+    def get_failures(self):
+        """Return the (blocked, failed) video URL sets"""
+        blocked_videos = set()
+        failed_videos = set()
+        for url, status in self._conn.execute(
+                "SELECT url, status FROM videos WHERE status IN ('blocked', 'failed') AND url IS NOT NULL"):
+            (blocked_videos if status == 'blocked' else failed_videos).add(url)
+        return blocked_videos, failed_videos
+
+    def record_download(self, video_id, source, url, file_path, duration=None):
+        byte_size = None
+        try:
+            byte_size = path.getsize(path.join(self.download_folder, file_path))
+        except OSError:
+            pass
+        with self._conn:
+            self._conn.execute(
+                """INSERT INTO videos (video_id, source, url, status, attempts, file_path, byte_size, duration, updated_at)
+                   VALUES (?, ?, ?, 'downloaded', 1, ?, ?, ?, ?)
+                   ON CONFLICT (video_id, source) DO UPDATE SET
+                       status = 'downloaded', attempts = attempts + 1, last_error = NULL,
+                       file_path = excluded.file_path, byte_size = excluded.byte_size,
+                       duration = excluded.duration, updated_at = excluded.updated_at""",
+                (video_id, source, url, file_path, byte_size, duration, time.time())
+            )
+        self._record_written()
+
+    def record_failure(self, video_id, source, url, status, error):
+        """Record a 'failed' or 'blocked' attempt ('pending' keeps a transient failure retryable)"""
+        with self._conn:
+            self._conn.execute(
+                """INSERT INTO videos (video_id, source, url, status, attempts, last_error, updated_at)
+                   VALUES (?, ?, ?, ?, 1, ?, ?)
+                   ON CONFLICT (video_id, source) DO UPDATE SET
+                       status = excluded.status, attempts = attempts + 1,
+                       last_error = excluded.last_error, updated_at = excluded.updated_at""",
+                (video_id, source, url, status, error, time.time())
+            )
+        self._record_written()
+
+    def reset_failures(self):
+        """Mark blocked and failed videos as pending again; returns how many were reset"""
+        with self._conn:
+            cursor = self._conn.execute(
+                "UPDATE videos SET status = 'pending' WHERE status IN ('blocked', 'failed')")
+        return cursor.rowcount
+
+    def record_partials(self, video_id, source, partials):
+        """Remember the partial files (see run_download) an interrupted download left on disk"""
+        rows = []
+        for file_path, _, total_bytes in partials:
+            try:
+                byte_size = path.getsize(file_path)
+            except OSError:
+                continue
+            rows.append((path.relpath(file_path, self.download_folder), video_id, source, byte_size, total_bytes, time.time()))
+        if not rows:
+            return 0
+        with self._conn:
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO partials (file_path, video_id, source, byte_size, total_bytes, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+        self._record_written()
+        return sum(row[3] for row in rows)
+
+    def clear_partials(self, video_id, source):
+        with self._conn:
+            self._conn.execute("DELETE FROM partials WHERE video_id = ? AND source = ?", (video_id, source))
+
+    def get_partials(self):
+        """Return {(video_id, source): bytes on disk} for partial downloads whose files still exist"""
+        partials = {}
+        missing = []
+        for file_path, video_id, source in self._conn.execute("SELECT file_path, video_id, source FROM partials"):
+            try:
+                byte_size = path.getsize(path.join(self.download_folder, file_path))
+            except OSError:
+                missing.append((file_path,))
+                continue
+            partials[(video_id, source)] = partials.get((video_id, source), 0) + byte_size
+        if missing:
+            with self._conn:
+                self._conn.executemany("DELETE FROM partials WHERE file_path = ?", missing)
+        return partials
+
+    def get_manifest(self):
+        """Return {file path: (byte_size, mtime_ns, error)} for every verified file"""
+        return {row[0]: row[1:] for row in self._conn.execute(
+            "SELECT file_path, byte_size, mtime_ns, error FROM manifest")}
+
+    def record_verifications(self, results):
+        """Store (file path, byte_size, mtime_ns, checksum, error) verification results"""
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO manifest (file_path, byte_size, mtime_ns, checksum, error, verified_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [result + (now,) for result in results]
+            )
+        self._record_written()
+
+    def requeue_file(self, file_path, error):
+        """Mark the video stored at file_path as pending again, so the next run re-downloads it"""
+        with self._conn:
+            self._conn.execute(
+                """UPDATE videos SET status = 'pending', last_error = ?, file_path = NULL, byte_size = NULL,
+                       updated_at = ? WHERE file_path = ?""",
+                (error, time.time(), file_path)
+            )
+            self._conn.execute("DELETE FROM manifest WHERE file_path = ?", (file_path,))
+
+    def get_video_info(self, video_id):
+        """Return the info a video was resolved ahead with, or None if missing or expired"""
+        row = self._conn.execute("SELECT info, fetched_at FROM resolved_info WHERE video_id = ?",
+                                 (video_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.INFO_TTL:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put_video_info(self, video_id, info):
+        """Keep a video's resolved (sanitized) info until its transfer finishes"""
+        blob = zlib.compress(json.dumps(info, separators=(',', ':')).encode())
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO resolved_info (video_id, info, fetched_at) VALUES (?, ?, ?)",
+                               (video_id, blob, time.time()))
+        self._record_written()
+
+    def forget_video_info(self, video_id):
+        with self._conn:
+            self._conn.execute("DELETE FROM resolved_info WHERE video_id = ?", (video_id,))
+
+    def prune_video_info(self):
+        """Drop info that has expired"""
+        with self._conn:
+            self._conn.execute("DELETE FROM resolved_info WHERE fetched_at < ?", (time.time() - self.INFO_TTL,))
+
+
+# Session tracking functions for blocked videos
+def load_session_data(download_folder):
+    """Load blocked and failed video URLs from the catalog in the download folder"""
+    if not path.isdir(download_folder):
+        return set(), set()
+    try:
+        with DownloadCatalog(download_folder) as catalog:
+            return catalog.get_failures()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Warning: Could not load session data: {e}")
+        return set(), set()
+
+
+def clear_session_data(download_folder):
+    """Reset blocked and failed videos so they are retried; returns how many were reset"""
+    with DownloadCatalog(download_folder) as catalog:
+        return catalog.reset_failures()
+
+
+# Function to load JSON file with explicit UTF-8 encoding
+def load_json(json_file):
+    try:
+        with open(json_file, 'r', encoding='utf-8') as file:  # Explicitly set UTF-8 encoding
+            return json_load(file)
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Failed to decode JSON file. Ensure it's UTF-8 encoded. Error: {e}")
+    except Exception as e:
+        raise ValueError(f"Failed to load JSON file. Error: {e}")
+
+
+# Function to get data from JSON with fallback logic
+def get_activity_data(data, log_callback=None):
+    """
+    Get activity data from JSON with fallback logic.
+    First tries 'Your Activity' node, then falls back to 'Likes and Favorites' node.
+    """
+    # Try 'Your Activity' first
+    your_activity = data.get('Your Activity', {})
+    if your_activity:
+        if log_callback:
+            log_callback("📊 Using 'Your Activity' node for data parsing")
+        return your_activity
+    
+    # Fall back to 'Likes and Favorites'
+    likes_and_favorites = data.get('Likes and Favorites', {})
+    if likes_and_favorites:
+        if log_callback:
+            log_callback("📊 'Your Activity' node not found, falling back to 'Likes and Favorites' node")
+        return likes_and_favorites
+    
+    # If neither exists, return empty dict
+    if log_callback:
+        log_callback("⚠️ Neither 'Your Activity' nor 'Likes and Favorites' nodes found in JSON")
+    return {}
+
+
+# Activity lists read from the export: node name -> (list key, date key, link key)
+ACTIVITY_LISTS = {
+    'Favorite Videos': ('FavoriteVideoList', 'Date', 'Link'),
+    'Like List': ('ItemFavoriteList', 'date', 'link'),
+}
+
+
+class _JsonStreamReader:
+    """
+    Minimal incremental JSON reader over a binary file.
+    Walks objects and arrays one key/item at a time, skips values without decoding
+    them and only materializes the values it is asked for, so memory use depends on
+    the size of the largest requested value rather than on the size of the file.
+    """
+
+    CHUNK_SIZE = 1 << 20
+    WHITESPACE = re.compile(rb'[ \t\r\n]*')
+    # Runs of container content: plain text, complete strings (which may contain brackets)
+    # and flat nested objects/arrays, so typical records are skipped by a single match
+    _STRING = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+    CONTENT = re.compile(
+        rb'(?:[^"\[\]{}]+|' + _STRING
+        + rb'|\{(?:[^"\[\]{}]|' + _STRING + rb')*\}'
+        + rb'|\[(?:[^"\[\]{}]|' + _STRING + rb')*\])*'
+    )
+    SCALAR = re.compile(rb'[^,\]}\s]*')
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, file):
+        self._file = file
+        self._buffer = b''
+        self._pos = 0  # Read position within the buffer
+        self._offset = 0  # File offset of the first buffered byte
+        self._mark = None  # Buffer position that must survive refills
+        self._eof = False
+
+    def _fill(self):
+        """Read the next chunk, dropping consumed bytes; returns False at end of file"""
+        if self._eof:
+            return False
+        keep_from = self._pos if self._mark is None else self._mark
+        if keep_from:
+            self._buffer = self._buffer[keep_from:]
+            self._offset += keep_from
+            self._pos -= keep_from
+            if self._mark is not None:
+                self._mark -= keep_from
+        chunk = self._file.read(self.CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer += chunk
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            self._pos = self.WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return
+
+    def _error(self, message):
+        return ValueError(f"{message} at offset {self._offset + self._pos}")
+
+    def skip_bom(self):
+        # A chunk may be shorter than the BOM itself
+        while len(self._buffer) < 3 and self._fill():
+            pass
+        if self._buffer.startswith(b'\xef\xbb\xbf'):
+            self._pos += 3
+
+    def tell(self):
+        """File offset of the next value"""
+        self._skip_whitespace()
+        return self._offset + self._pos
+
+    def seek(self, offset):
+        self._file.seek(offset)
+        self._buffer = b''
+        self._pos = 0
+        self._offset = offset
+        self._mark = None
+        self._eof = False
+
+    def peek(self):
+        self._skip_whitespace()
+        if self._pos >= len(self._buffer):
+            raise self._error("Unexpected end of JSON data")
+        return self._buffer[self._pos:self._pos + 1]
+
+    def _expect(self, token):
+        if self.peek() != token:
+            raise self._error(f"Expected {token.decode()!r}")
+        self._pos += 1
+
+    def _skip_string(self):
+        self._pos += 1  # Opening quote
+        while True:
+            end = self._buffer.find(b'"', self._pos)
+            if end == -1:
+                # Keep any trailing backslashes so an escape split across chunks is still seen
+                run_start = len(self._buffer)
+                while run_start > self._pos and self._buffer[run_start - 1] == 0x5C:
+                    run_start -= 1
+                self._pos = run_start
+                if not self._fill():
+                    raise self._error("Unterminated string")
+                continue
+            backslashes = 0
+            while end - backslashes - 1 >= self._pos and self._buffer[end - backslashes - 1] == 0x5C:
+                backslashes += 1
+            self._pos = end + 1
+            if backslashes % 2 == 0:
+                return
+
+    def _skip_container(self):
+        self._pos += 1  # Opening bracket
+        depth = 1
+        while True:
+            self._pos = self.CONTENT.match(self._buffer, self._pos).end()
+            if self._pos >= len(self._buffer):
+                if not self._fill():
+                    raise self._error("Unexpected end of JSON data")
+                continue
+            token = self._buffer[self._pos:self._pos + 1]
+            if token == b'"':
+                # A string cut off by the end of the buffer
+                self._skip_string()
+                continue
+            self._pos += 1
+            if token in (b'{', b'['):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_scalar(self):
+        while True:
+            end = self.SCALAR.match(self._buffer, self._pos).end()
+            if end < len(self._buffer) or not self._fill():
+                self._pos = end
+                return
+
+    def skip_value(self):
+        token = self.peek()
+        if token == b'"':
+            self._skip_string()
+        elif token in (b'{', b'['):
+            self._skip_container()
+        else:
+            self._skip_scalar()
+
+    def read_value(self):
+        """Decode the value at the current position"""
+        self._skip_whitespace()
+        self._mark = self._pos
+        try:
+            self.skip_value()
+            raw = self._buffer[self._mark:self._pos]
+        finally:
+            self._mark = None
+        return self._decoder.decode(raw.decode('utf-8'))
+
+    def iter_object(self):
+        """Yield each key of the object at the current position; the caller must consume every value"""
+        self._expect(b'{')
+        if self.peek() == b'}':
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != b'"':
+                raise self._error("Expected object key")
+            key = self.read_value()
+            self._expect(b':')
+            yield key
+            token = self.peek()
+            self._pos += 1
+            if token == b'}':
+                return
+            if token != b',':
+                raise self._error("Expected ',' or '}'")
+
+    def iter_array(self):
+        """Yield once per item of the array at the current position; the caller must consume every item"""
+        self._expect(b'[')
+        if self.peek() == b']':
+            self._pos += 1
+            return
+        while True:
+            yield
+            token = self.peek()
+            self._pos += 1
+            if token == b']':
+                return
+            if token != b',':
+                raise self._error("Expected ',' or ']'")
+
+
+def _iter_activity_node(reader, log_callback, message):
+    """Yield the video records of one activity node; returns True if the node was non-empty"""
+    if reader.peek() != b'{':
+        reader.skip_value()
+        return False
+    found = False
+    for key in reader.iter_object():
+        if not found:
+            found = True
+            if log_callback:
+                log_callback(message)
+        list_key = ACTIVITY_LISTS.get(key, (None,))[0]
+        if list_key is None or reader.peek() != b'{':
+            reader.skip_value()
+            continue
+        for inner_key in reader.iter_object():
+            if inner_key != list_key or reader.peek() != b'[':
+                reader.skip_value()
+                continue
+            for _ in reader.iter_array():
+                record = reader.read_value()
+                if isinstance(record, dict):
+                    yield key, record
+    return found
+
+
+# Function to stream favorite/liked video records out of the export without loading it whole
+def iter_activity_records(json_file, log_callback=None):
+    """
+    Yield (list name, record) tuples for 'Favorite Videos' and 'Like List' entries.
+    Uses the same fallback as get_activity_data: the 'Your Activity' node when it is
+    non-empty, otherwise the 'Likes and Favorites' node. Everything else in the file
+    is skipped without being decoded, so memory stays flat for any export size.
+    """
+    try:
+        with open(json_file, 'rb') as file:
+            reader = _JsonStreamReader(file)
+            reader.skip_bom()
+            if reader.peek() != b'{':
+                raise ValueError("Top-level JSON value is not an object")
+            fallback_offset = None
+            for key in reader.iter_object():
+                if key == 'Your Activity':
+                    used_activity = yield from _iter_activity_node(
+                        reader, log_callback, "📊 Using 'Your Activity' node for data parsing")
+                    if used_activity:
+                        return
+                elif key == 'Likes and Favorites' and fallback_offset is None:
+                    # 'Your Activity' may still follow, so remember where this node starts
+                    fallback_offset = reader.tell()
+                    reader.skip_value()
+                else:
+                    reader.skip_value()
+
+            if fallback_offset is not None:
+                reader.seek(fallback_offset)
+                used_fallback = yield from _iter_activity_node(
+                    reader, log_callback, "📊 'Your Activity' node not found, falling back to 'Likes and Favorites' node")
+                if used_fallback:
+                    return
+
+            if log_callback:
+                log_callback("⚠️ Neither 'Your Activity' nor 'Likes and Favorites' nodes found in JSON")
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Failed to decode JSON file. Ensure it's UTF-8 encoded. Error: {e}")
+    except Exception as e:
+        raise ValueError(f"Failed to load JSON file. Error: {e}")
+
+
+# Function to parse the date part of a TikTok timestamp "YYYY-MM-DD HH:MM:SS"; None if missing or invalid
+def parse_video_date(date_str):
+    # Exports occasionally carry null or numeric dates; those count as unparseable
+    if not date_str or not isinstance(date_str, str):
+        return None
+    # Extract just the date part (before the space)
+    date_part = date_str.split(' ')[0] if ' ' in date_str else date_str
+    try:
+        return date.fromisoformat(date_part)
+    except (TypeError, ValueError):
+        pass
+    try:
+        # Slower, more lenient fallback (e.g. non zero-padded months/days)
+        return datetime.strptime(date_part, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+# Function to parse date string and check if it's after earliest date
+def is_date_after_earliest(date_str, earliest_date):
+    if not date_str or not earliest_date:
+        return True
+    video_date = parse_video_date(date_str)
+    # If parsing fails, include the video
+    return video_date is None or video_date >= earliest_date
+
+
+# Sorted per-list date index used for filter-count previews
+class ActivityDateIndex:
+    """
+    Dates of every favorite/liked video, parsed once when the export is loaded and kept
+    as sorted arrays of date ordinals per list, so counting the videos on or after a date
+    is a bisect. Videos without a parseable date always count, as in is_date_after_earliest.
+    """
+
+    def __init__(self, dates_by_list=None):
+        self._ordinals = {}
+        self._undated = {}
+        for list_name in ACTIVITY_LISTS:
+            ordinals = []
+            undated = 0
+            for date_str in (dates_by_list or {}).get(list_name, ()):
+                video_date = parse_video_date(date_str)
+                if video_date is None:
+                    undated += 1
+                else:
+                    ordinals.append(video_date.toordinal())
+            ordinals.sort()
+            self._ordinals[list_name] = array('i', ordinals)
+            self._undated[list_name] = undated
+
+    @classmethod
+    def from_json(cls, json_file):
+        dates_by_list = {list_name: [] for list_name in ACTIVITY_LISTS}
+        for list_name, video in iter_activity_records(json_file):
+            dates_by_list[list_name].append(video.get(ACTIVITY_LISTS[list_name][1], ''))
+        return cls(dates_by_list)
+
+    def count(self, list_name, earliest_date=None):
+        """Number of videos in the list dated on or after earliest_date (all videos if None)"""
+        ordinals = self._ordinals[list_name]
+        dated = len(ordinals)
+        if earliest_date is not None:
+            dated -= bisect_left(ordinals, earliest_date.toordinal())
+        return dated + self._undated[list_name]
+
+
+# Options shared by every yt-dlp downloader instance
+YDL_OPTIONS = {
+    # Specify the format to download: best available video and audio
+    'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
+    # Download into .part files and resume them with range requests after a cancel or crash
+    'continuedl': True,
+    'nopart': False,
+}
+
+
+class _DownloaderSlot:
+    """A long-lived YoutubeDL plus the per-task state its hooks dispatch to"""
+
+    def __init__(self, options):
+        self.progress_hook = None
+        self.postprocessor_hook = None
+        self.finished_files = []
+        self.ydl = yt_dlp.YoutubeDL(dict(
+            options, progress_hooks=[self._on_progress], postprocessor_hooks=[self._on_postprocess]))
+        # Post hooks receive the final path once merging/postprocessing is done
+        self.ydl.add_post_hook(self.finished_files.append)
+
+    def _on_progress(self, d):
+        if self.progress_hook:
+            self.progress_hook(d)
+
+    def _on_postprocess(self, d):
+        if self.postprocessor_hook:
+            self.postprocessor_hook(d)
+
+
+# Pool of reusable yt-dlp instances, one per worker thread
+class DownloaderPool:
+    """
+    Keeps one yt_dlp.YoutubeDL per worker thread for the whole run, so option parsing,
+    extractor setup, the cookie jar and keep-alive HTTP connections are reused across
+    downloads. The output template and progress hook are swapped in for each task.
+    """
+
+    def __init__(self, options=None):
+        self.options = dict(YDL_OPTIONS, **(options or {}))
+        self._local = threading.local()
+        self._slots = []
+        self._lock = threading.Lock()
+
+    def _get_slot(self):
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            slot = self._local.slot = _DownloaderSlot(self.options)
+            with self._lock:
+                self._slots.append(slot)
+        return slot
+
+    def extract(self, video_url):
+        """Resolve a video's info (formats, title, ...) without downloading it"""
+        ydl = self._get_slot().ydl
+        # Sanitized like yt-dlp's --load-info-json input: plain data that any instance can download
+        return ydl.sanitize_info(ydl.extract_info(video_url, download=False))
+
+    def download(self, video_url, outtmpl, progress_hook=None, info=None, postprocessor_hook=None):
+        """Download one video with this thread's instance; returns the final file path"""
+        slot = self._get_slot()
+        slot.ydl.params['outtmpl']['default'] = outtmpl
+        slot.progress_hook = progress_hook
+        slot.postprocessor_hook = postprocessor_hook
+        slot.finished_files.clear()
+        try:
+            if info is not None:
+                # Already resolved by the extraction stage: only transfer the media
+                slot.ydl.process_ie_result(info, download=True)
+            else:
+                slot.ydl.extract_info(video_url)
+        finally:
+            slot.progress_hook = None
+            slot.postprocessor_hook = None
+        return slot.finished_files[-1] if slot.finished_files else None
+
+    def close(self):
+        with self._lock:
+            slots, self._slots = self._slots, []
+        for slot in slots:
+            slot.ydl.close()
+
+
+# Function to download video using yt-dlp
+def download_video(video_url, download_folder, prefix, stop_event=None, downloader_pool=None, info=None, stage_marks=None, transfer_hook=None, bandwidth_limiter=None):
+    if stop_event and stop_event.is_set():
+        raise DownloadCancelled('Download cancelled before start')
+    # Bytes already charged to the bandwidth limiter, per file (video and audio may download separately)
+    charged_bytes = {}
+
+    def _progress_hook(d):
+        # Reported before the cancellation check: these bytes are already on disk either way
+        if transfer_hook:
+            transfer_hook(d)
+        if stop_event and stop_event.is_set():
+            raise DownloadCancelled('Download cancelled by user')
+        # Sleeping here holds up yt-dlp's read loop, which throttles the transfer itself
+        if bandwidth_limiter is not None and d.get('status') == 'downloading':
+            downloaded = d.get('downloaded_bytes') or 0
+            # Resumed .part files report the bytes already on disk; only new bytes are charged
+            charged = charged_bytes.get(d.get('filename'), downloaded)
+            charged_bytes[d.get('filename')] = max(downloaded, charged)
+            if downloaded > charged and not bandwidth_limiter.consume(downloaded - charged, stop_event):
+                raise DownloadCancelled('Download cancelled by user')
+        # Optional timestamps for the stage metrics: first media bytes and last finished file
+        if stage_marks is not None:
+            if d.get('status') == 'downloading':
+                stage_marks.setdefault('transfer_start', time.time())
+            elif d.get('status') == 'finished':
+                stage_marks['transfer_end'] = time.time()
+
+    def _postprocessor_hook(d):
+        # MoveFiles puts the finished file in place, after merging and other postprocessing
+        if stage_marks is not None and d.get('postprocessor') == 'MoveFiles' and d.get('status') == 'started':
+            stage_marks.setdefault('finalize_start', time.time())
+
+    # Output template for downloaded videos
+    outtmpl = path.join(download_folder, f"{prefix}%(id)s.%(ext)s")
+    if downloader_pool is not None:
+        return downloader_pool.download(video_url, outtmpl, _progress_hook, info, _postprocessor_hook)
+
+    # One-off download without a shared pool
+    downloader_pool = DownloaderPool()
+    try:
+        return downloader_pool.download(video_url, outtmpl, _progress_hook, info, _postprocessor_hook)
+    finally:
+        downloader_pool.close()
+
+
+# Function to download one video and report the outcome as a status dict instead of raising
+def run_download(video_url, download_folder, prefix, stop_event=None, downloader_pool=None, info=None, transfer_hook=None, bandwidth_limiter=None):
+    """
+    Cancelled and failed results carry 'partials': (file path, downloaded bytes, total bytes)
+    for every file the download left behind (.part files and finished streams awaiting
+    a merge), which yt-dlp resumes when the video is downloaded again.
+    """
+    start = time.time()
+    marks = {'download_start': start}
+    partials = {}
+
+    def _track_partials(d):
+        status = d.get('status')
+        if status == 'downloading' and d.get('tmpfilename'):
+            partials[d.get('filename')] = (d['tmpfilename'], d.get('downloaded_bytes'),
+                                           d.get('total_bytes') or d.get('total_bytes_estimate'))
+        elif status == 'finished' and d.get('filename'):
+            # A complete file only counts when it's one stream of a merge; the final file is indexed normally
+            if is_partial_file(path.basename(d['filename'])):
+                partials[d['filename']] = (d['filename'], d.get('downloaded_bytes'), d.get('total_bytes'))
+            else:
+                partials.pop(d['filename'], None)
+        if transfer_hook:
+            transfer_hook(d)
+
+    try:
+        file_path = download_video(video_url, download_folder, prefix, stop_event=stop_event, downloader_pool=downloader_pool,
+                                   info=info, stage_marks=marks, transfer_hook=_track_partials,
+                                   bandwidth_limiter=bandwidth_limiter)
+        marks['finished'] = time.time()
+        return {'status': 'downloaded', 'duration': marks['finished'] - start, 'file_path': file_path, 'marks': marks}
+    except DownloadCancelled:
+        return {'status': 'cancelled', 'partials': list(partials.values())}
+    except Exception as exc:
+        return {'status': 'error', 'error': str(exc), 'partials': list(partials.values())}
+
+
+# State of a download worker process (process mode), set up once by its initializer
+_process_state = {}
+
+# Minimum seconds between the byte-progress reports a worker process sends for one download
+TRANSFER_REPORT_INTERVAL = 0.5
+
+
+# Function to initialize a download worker process with its own yt-dlp instance
+def _init_download_process(stop_event, downloader_options, transfer_queue, bandwidth_limiter):
+    # Ctrl+C reaches the whole process group; the parent cancels through stop_event instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _process_state['stop_event'] = stop_event
+    _process_state['downloader_pool'] = DownloaderPool(downloader_options)
+    _process_state['transfer_queue'] = transfer_queue
+    _process_state['bandwidth_limiter'] = bandwidth_limiter
+
+
+# Result fields the parent uses; the rest (notably the full video info) stays in the worker
+PROCESS_RESULT_FIELDS = ('status', 'error', 'duration', 'file_path', 'marks', 'partials')
+
+
+# Function run in a download worker process; only the status dict travels back to the parent
+def _download_in_process(video_url, download_folder, prefix, info=None):
+    transfer_queue = _process_state['transfer_queue']
+    last_report = 0.0
+
+    def _transfer_hook(d):
+        # Byte counters go to the parent's TransferMonitor, throttled to keep the queue quiet
+        nonlocal last_report
+        progress = get_transfer_progress(d)
+        now = time.monotonic()
+        if progress[0] == 'downloading' and now - last_report < TRANSFER_REPORT_INTERVAL:
+            return
+        last_report = now
+        transfer_queue.put(('update', (video_url,) + progress))
+
+    result = run_download(video_url, download_folder, prefix, _process_state['stop_event'], _process_state['downloader_pool'], info,
+                          transfer_hook=_transfer_hook, bandwidth_limiter=_process_state['bandwidth_limiter'])
+    # Sent through the same queue, so the parent can't see it ahead of this download's last update
+    transfer_queue.put(('end', (video_url, result['status'] == 'downloaded')))
+    return {field: result[field] for field in PROCESS_RESULT_FIELDS if field in result}
+
+
+# Stand-in for the parent's __main__ while a worker process starts (see _CoreSpawnProcess)
+_WORKER_MAIN = types.ModuleType('__mp_main__')
+_worker_main_lock = threading.Lock()
+
+
+class _CoreSpawnProcess(multiprocessing.context.SpawnProcess):
+    """
+    A spawned process normally re-imports the parent's __main__ module first. For the
+    desktop app that is FaveSave.py, which loads PyQt6 into every download worker. Hiding
+    __main__ while the process starts means the worker only imports this module, when it
+    unpickles its initializer and tasks.
+    """
+
+    def start(self):
+        with _worker_main_lock:
+            main_module = sys.modules['__main__']
+            sys.modules['__main__'] = _WORKER_MAIN
+            try:
+                super().start()
+            finally:
+                sys.modules['__main__'] = main_module
+
+
+class _CoreSpawnContext(multiprocessing.context.SpawnContext):
+    Process = _CoreSpawnProcess
+
+
+# Function to start one yt-dlp worker process per download slot
+def create_download_process_pool(max_workers, downloader_options=None, bandwidth_limiter=None):
+    """
+    Returns (executor, stop_event, transfer_queue); set the multiprocessing stop_event to cancel
+    running downloads. transfer_queue receives (TransferMonitor method name, arguments) tuples.
+    A bandwidth_limiter must be created with the 'spawn' context to be shared with the workers.
+    """
+    # 'spawn' everywhere: forking a process that already runs threads (or Qt) is unsafe
+    context = _CoreSpawnContext()
+    stop_event = context.Event()
+    transfer_queue = context.Queue()
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=context,
+        initializer=_init_download_process,
+        initargs=(stop_event, downloader_options, transfer_queue, bandwidth_limiter)
+    )
+    return executor, stop_event, transfer_queue
+
+
+# Function to extract the video id from a TikTok URL
+def get_video_id(video_url):
+    # Assuming the last part of the path is the video id
+    return video_url.strip('/').split('/')[-1]
+
+
+# Index of downloaded files keyed by video id, built once per run
+class DownloadIndex:
+    """
+    Maps video ids to the downloaded files on disk so that duplicate detection
+    is a dictionary lookup instead of a scan over the whole folder.
+    Only files named '<faved_|liked_>...<video_id>.<mp4|m4a|mp3>' are indexed; paths
+    relative to the download folder are accepted, so any folder layout works.
+    """
+
+    VIDEO_PREFIXES = ('faved_', 'liked_')
+    VIDEO_EXTENSIONS = ('.mp4', '.m4a', '.mp3')
+
+    def __init__(self, file_names=()):
+        self._files_by_id = {}
+        self._file_count = 0
+        for file_name in file_names:
+            self.add(file_name)
+
+    def __len__(self):
+        return self._file_count
+
+    @classmethod
+    def is_video_file(cls, file_name):
+        # Single-format streams of an unfinished merge ('<name>.f137.mp4') are not videos yet
+        return (file_name.startswith(cls.VIDEO_PREFIXES) and path.splitext(file_name)[1] in cls.VIDEO_EXTENSIONS
+                and PARTIAL_FILE_PATTERN.search(file_name) is None)
+
+    def add(self, file_name):
+        """Add a downloaded file (name or relative path) to the index; returns False if it isn't a video file"""
+        name = file_name.rpartition(os.sep)[2]
+        if not self.is_video_file(name):
+            return False
+        video_id = path.splitext(name)[0].rsplit('_', 1)[-1]
+        files = self._files_by_id.setdefault(video_id, set())
+        if file_name not in files:
+            files.add(file_name)
+            self._file_count += 1
+        return True
+
+    def contains(self, video_id, prefix):
+        """Check whether a file for this video id was saved with the given prefix"""
+        return any(file_name.rpartition(os.sep)[2].startswith(prefix) for file_name in self._files_by_id.get(video_id, ()))
+
+    def find(self, video_id):
+        """Return a file saved for this video id under any prefix, or None"""
+        return min(self._files_by_id.get(video_id, ()), default=None)
+
+
+# Function to check if a video is already downloaded
+def is_video_downloaded(video_url, downloaded_videos, prefix):
+    # Accept a prebuilt index (fast path) or any iterable of file names
+    if not isinstance(downloaded_videos, DownloadIndex):
+        downloaded_videos = DownloadIndex(downloaded_videos)
+    return downloaded_videos.contains(get_video_id(video_url), prefix)
+
+
+# Function to walk a download folder, including the subfolders of its layout
+def iter_folder_files(download_folder):
+    """Yield (path relative to the folder, os.DirEntry) for every file; hidden folders and symlinked folders are skipped"""
+    pending_dirs = ['']
+    while pending_dirs:
+        relative_dir = pending_dirs.pop()
+        try:
+            with os.scandir(path.join(download_folder, relative_dir)) as iterator:
+                entries = list(iterator)
+        except OSError:
+            if not relative_dir:
+                raise
+            continue  # An unreadable subfolder shouldn't hide the rest of the library
+        for entry in entries:
+            relative_path = path.join(relative_dir, entry.name) if relative_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith('.'):
+                    pending_dirs.append(relative_path)
+            elif entry.is_file():
+                yield relative_path, entry
+
+
+# Function to get a set of already downloaded video files (paths relative to the folder); creates folder if needed
+def get_downloaded_videos(download_folder):
+    downloaded_videos = set()
+    try:
+        makedirs(download_folder, exist_ok=True)
+        downloaded_videos.update(file_name for file_name, _ in iter_folder_files(download_folder))
+    except PermissionError as e:
+        print(f"Warning: Permission denied accessing {download_folder}: {e}")
+        print("Using empty download list - all videos will be re-downloaded")
+    except Exception as e:
+        print(f"Warning: Error accessing download folder {download_folder}: {e}")
+        print("Using empty download list - all videos will be re-downloaded")
+    return downloaded_videos
+
+
+# Function to build the video id index for a download folder
+def build_download_index(download_folder):
+    return DownloadIndex(get_downloaded_videos(download_folder))
+
+
+# Files an interrupted download leaves behind: yt-dlp's .part/.ytdl files and single-format
+# streams ('<name>.f137.mp4') that were waiting to be merged
+PARTIAL_FILE_PATTERN = re.compile(r"\.(?:part(?:-Frag\d+)?|ytdl)$|\.f[\w-]+\.\w+$")
+
+# Partial files untouched for this long are treated as orphaned and deleted
+PARTIAL_MAX_AGE = 7 * 24 * 3600
+
+
+# Function to check whether a file name belongs to an unfinished download
+def is_partial_file(file_name):
+    return file_name.startswith(DownloadIndex.VIDEO_PREFIXES) and PARTIAL_FILE_PATTERN.search(file_name) is not None
+
+
+# Function to delete partial downloads nobody resumed within max_age seconds
+def clean_partial_downloads(download_folder, max_age=PARTIAL_MAX_AGE):
+    """Returns (files removed, bytes freed)"""
+    cutoff = time.time() - max_age
+    removed_count = 0
+    removed_bytes = 0
+    try:
+        for _, entry in iter_folder_files(download_folder):
+            if not is_partial_file(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+                if stat.st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed_count += 1
+                    removed_bytes += stat.st_size
+            except OSError:
+                pass
+    except OSError:
+        pass
+    return removed_count, removed_bytes
+
+
+# Where video files go inside the download folder
+FOLDER_LAYOUTS = {
+    'flat': "All videos in the download folder",
+    'year_month': "Subfolders by year and month of the export date (2024/03)",
+    'source': "Subfolders for favorites and likes (faved, liked)",
+    'id_hash': "256 subfolders by a hash of the video id (00-ff)",
+}
+LAYOUT_DATE_PATTERN = re.compile(r"^(\d{4})-(\d{2})")
+
+
+# Function to get the subfolder ('' for flat) a video file belongs in under a folder layout
+def get_layout_dir(layout, file_name):
+    """Source, date and video id are read from the FaveSave file name ('faved_<date>_<id>...')"""
+    if layout == 'flat':
+        return ''
+    name = path.basename(file_name)
+    if layout == 'source':
+        return 'liked' if name.startswith('liked_') else 'faved'
+    # Video ids have no dots; everything after the first one is extensions (.mp4, .f137.mp4.part, ...)
+    fields = name.split('.', 1)[0].split('_')
+    if layout == 'id_hash':
+        return f"{zlib.crc32(fields[-1].encode()) & 0xff:02x}"
+    if layout == 'year_month':
+        match = LAYOUT_DATE_PATTERN.match(fields[1]) if len(fields) > 2 else None
+        return path.join(match.group(1), match.group(2)) if match else 'undated'
+    raise ValueError(f"Unknown folder layout '{layout}' (expected one of: {', '.join(FOLDER_LAYOUTS)})")
+
+
+# Function to move a download folder's videos into a folder layout in one step
+def migrate_folder_layout(download_folder, layout, catalog=None, log_callback=None):
+    """
+    Moves every video and partial file to the subfolder `layout` puts it in, records the new
+    paths and layout in the catalog, and removes the folders the old layout leaves empty.
+    Files whose destination already exists are left in place. Returns (moved, skipped).
+    """
+    get_layout_dir(layout, '')  # Validate the layout before touching any file
+    moves = []
+    skipped = 0
+    emptied_dirs = set()
+    for relative_path, entry in list(iter_folder_files(download_folder)):
+        if not (DownloadIndex.is_video_file(entry.name) or is_partial_file(entry.name)):
+            continue
+        target = path.join(get_layout_dir(layout, entry.name), entry.name)
+        if target == relative_path:
+            continue
+        destination = path.join(download_folder, target)
+        try:
+            if path.exists(destination):
+                raise FileExistsError(f"{target} already exists")
+            makedirs(path.dirname(destination), exist_ok=True)
+            os.rename(entry.path, destination)
+        except OSError as e:
+            skipped += 1
+            if log_callback:
+                log_callback(f"⚠️ Could not move {relative_path}: {e}")
+            continue
+        moves.append((relative_path, target))
+        emptied_dirs.add(path.dirname(relative_path))
+    if catalog:
+        catalog.relocate_files(moves, layout)
+    for relative_dir in sorted(emptied_dirs, key=len, reverse=True):
+        while relative_dir:
+            try:
+                os.rmdir(path.join(download_folder, relative_dir))
+            except OSError:
+                break  # Not empty (or already gone)
+            relative_dir = path.dirname(relative_dir)
+    return len(moves), skipped
+
+
+# Function to give a downloaded video a second name in the same download folder without copying it
+def link_video_file(download_folder, file_name, link_name):
+    """Hardlinks link_name to file_name (both relative to the folder); returns False if the file system can't.
+    Raises FileNotFoundError if file_name itself is missing."""
+    link_path = path.join(download_folder, link_name)
+    source_path = path.join(download_folder, file_name)
+    try:
+        makedirs(path.dirname(link_path), exist_ok=True)
+        os.link(source_path, link_path)
+    except FileNotFoundError:
+        if not path.exists(source_path):
+            raise
+        return False
+    except OSError:
+        return False  # No hardlinks (FAT/exFAT, some network shares) or the name is taken
+    return True
+
+
+# Bytes hashed per update while verifying, so a stop request is noticed between chunks
+VERIFY_CHUNK_SIZE = 16 * 1024 * 1024
+# Files checked at once while verifying (hashing releases the GIL, so threads run in parallel)
+VERIFY_MAX_WORKERS = 8
+# Suffix damaged files are renamed with, so they are re-downloaded but not lost
+DAMAGED_FILE_SUFFIX = ".damaged"
+
+
+# Function to check the top-level boxes of an MP4/M4A file (any buffer, e.g. a memory map)
+def check_mp4_boxes(data):
+    """Returns None when the boxes exactly fill the file and include ftyp, moov and mdat, otherwise the problem"""
+    file_size = len(data)
+    offset = 0
+    box_types = []
+    while offset < file_size:
+        if file_size - offset < 8:
+            return f"{file_size - offset} stray bytes after the last box"
+        box_size, box_type = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if box_size == 1:
+            if file_size - offset < 16:
+                return f"truncated '{box_type.decode('latin-1')}' box header at offset {offset}"
+            box_size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = file_size - offset  # The last box may run to the end of the file
+        name = box_type.decode('latin-1')
+        if not box_types and box_type != b'ftyp':
+            return "not an MP4 file (no ftyp box)"
+        if box_size < header_size:
+            return f"invalid size {box_size} for the '{name}' box at offset {offset}"
+        if offset + box_size > file_size:
+            return f"truncated: the '{name}' box at offset {offset} needs {offset + box_size - file_size} more bytes"
+        box_types.append(box_type)
+        offset += box_size
+    if not box_types:
+        return "empty file"
+    for required in (b'moov', b'mdat'):
+        # Fragmented files keep their samples in moof/mdat pairs, which still need an mdat
+        if required not in box_types:
+            return f"no '{required.decode()}' box"
+    return None
+
+
+# Function to check that an MP3 file starts with an ID3 tag or an MPEG frame
+def check_mp3_header(data):
+    if len(data) < 4:
+        return "empty file" if not len(data) else "truncated header"
+    if data[:3] == b'ID3' or (data[0] == 0xff and data[1] & 0xe0 == 0xe0):
+        return None
+    return "not an MP3 file (no ID3 tag or frame sync)"
+
+
+# Function to verify one downloaded file through a memory map
+def check_video_file(file_path, stop_event=None):
+    """
+    Returns (byte_size, mtime_ns, checksum, error): the SHA-256 of a valid file, or the
+    problem found in a damaged one. Returns None if stop_event was set midway.
+    """
+    stat = os.stat(file_path)
+    if stat.st_size == 0:
+        return stat.st_size, stat.st_mtime_ns, None, "empty file"
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        error = check_mp3_header(data) if file_path.endswith('.mp3') else check_mp4_boxes(data)
+        if error:
+            return stat.st_size, stat.st_mtime_ns, None, error
+        digest = hashlib.sha256()
+        with memoryview(data) as view:
+            for offset in range(0, len(view), VERIFY_CHUNK_SIZE):
+                if stop_event and stop_event.is_set():
+                    return None
+                digest.update(view[offset:offset + VERIFY_CHUNK_SIZE])
+    return stat.st_size, stat.st_mtime_ns, digest.hexdigest(), None
+
+
+# Function to verify every downloaded file and queue damaged or missing ones for re-download
+def verify_downloads(download_folder, catalog=None, log_callback=print, progress_callback=None, stop_event=None, max_workers=None):
+    """
+    Checks the files in parallel, skipping those whose size and mtime match their last good
+    check in the catalog's manifest. Damaged files are renamed with DAMAGED_FILE_SUFFIX and
+    their videos set back to pending; so are videos whose file is gone.
+    Returns {'checked', 'unchanged', 'damaged', 'missing'} counts.
+    """
+    manifest = catalog.get_manifest() if catalog else {}
+    to_check = []
+    unchanged = 0
+    on_disk = set()
+    for relative_path, entry in iter_folder_files(download_folder):
+        if not DownloadIndex.is_video_file(entry.name):
+            continue
+        on_disk.add(relative_path)
+        stat = entry.stat()
+        known = manifest.get(relative_path)
+        if known and known == (stat.st_size, stat.st_mtime_ns, None):
+            unchanged += 1
+        else:
+            to_check.append(relative_path)
+
+    missing = 0
+    if catalog:
+        for relative_path in catalog.downloaded_files():
+            if relative_path not in on_disk and not path.exists(path.join(download_folder, relative_path)):
+                catalog.requeue_file(relative_path, "File missing")
+                log_callback(f"🩹 Missing: {relative_path} - queued for re-download")
+                missing += 1
+
+    log_callback(f"🩺 Verifying {len(to_check)} files" + (f" ({unchanged} unchanged since their last check)" if unchanged else "") + "...")
+    results = []
+    damaged = 0
+    workers = max_workers or min(VERIFY_MAX_WORKERS, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(check_video_file, path.join(download_folder, relative_path), stop_event): relative_path
+                   for relative_path in to_check}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                relative_path = futures[future]
+                try:
+                    result = future.result()
+                except (OSError, ValueError) as e:
+                    log_callback(f"⚠️ Could not verify {relative_path}: {e}")
+                    continue
+                if result is None:
+                    continue  # Stopped midway
+                if result[3]:
+                    damaged += 1
+                    file_path = path.join(download_folder, relative_path)
+                    try:
+                        os.replace(file_path, file_path + DAMAGED_FILE_SUFFIX)
+                    except OSError as e:
+                        log_callback(f"⚠️ Could not set aside {relative_path}: {e}")
+                        continue
+                    if catalog:
+                        catalog.requeue_file(relative_path, f"Damaged file: {result[3]}")
+                    log_callback(f"🩹 Damaged: {relative_path} ({result[3]}) - queued for re-download")
+                else:
+                    results.append((relative_path,) + result)
+                if progress_callback:
+                    progress_callback(int(done / len(futures) * 100))
+                if stop_event and stop_event.is_set():
+                    log_callback("🛑 Verification stopped")
+                    break
+        finally:
+            # Unstarted checks are dropped when stopping; what finished is still recorded
+            executor.shutdown(cancel_futures=True)
+            if catalog:
+                catalog.record_verifications(results)
+
+    log_callback(f"🩺 Verified {len(results) + damaged} files: {len(results)} OK, {damaged} damaged, "
+                 f"{missing} missing, {unchanged} unchanged")
+    return {'checked': len(results) + damaged, 'unchanged': unchanged, 'damaged': damaged, 'missing': missing}
+
+
+# Function to check whether a download error is a network timeout
+def is_timeout_error(error_message):
+    message = error_message.lower()
+    return 'timed out' in message or 'timeout' in message
+
+
+# Error classification for in-run retries
+TRANSIENT_ERROR_PATTERN = re.compile(
+    r'timed out|timeout|HTTP Error 5\d\d|connection (?:reset|aborted|refused)|remote end closed'
+    r'|incompleteread|temporary failure in name resolution|network is unreachable',
+    re.IGNORECASE)
+RATE_LIMIT_ERROR_PATTERN = re.compile(r'HTTP Error 429|too many requests|rate.?limit', re.IGNORECASE)
+# Attempts per video within one run, and the exponential backoff between them (seconds)
+MAX_DOWNLOAD_ATTEMPTS = 4
+RETRY_BASE_DELAY = 5
+RATE_LIMIT_BASE_DELAY = 30
+RETRY_MAX_DELAY = 300
+
+
+# Function to sort a yt-dlp error into 'blocked', 'rate_limit', 'transient' or 'permanent'
+def classify_download_error(error_message):
+    if 'IP address is blocked' in error_message:
+        return 'blocked'
+    if RATE_LIMIT_ERROR_PATTERN.search(error_message):
+        return 'rate_limit'
+    if TRANSIENT_ERROR_PATTERN.search(error_message):
+        return 'transient'
+    return 'permanent'
+
+
+# Function to get the backoff before retry number `attempt` (1-based), with jitter
+def get_retry_delay(attempt, error_class):
+    base = RATE_LIMIT_BASE_DELAY if error_class == 'rate_limit' else RETRY_BASE_DELAY
+    delay = min(RETRY_MAX_DELAY, base * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+# Adaptive (AIMD) control of the number of downloads in flight
+class AdaptiveConcurrency:
+    """
+    Additive-increase / multiplicative-decrease controller for download concurrency.
+    Every EVALUATION_WINDOW successful downloads the limit grows by one while throughput
+    (downloads per second) keeps improving, and drops by one when it falls. A block or
+    timeout halves the limit, and CLUSTER_SIZE blocks within CLUSTER_SECONDS also pause
+    all new downloads for COOLDOWN_SECONDS.
+    """
+
+    EVALUATION_WINDOW = 5
+    THROUGHPUT_TOLERANCE = 0.05
+    CLUSTER_SIZE = 3
+    CLUSTER_SECONDS = 60
+    COOLDOWN_SECONDS = 120
+
+    def __init__(self, maximum, minimum=1):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = self.minimum
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_count = 0
+        self._last_throughput = None
+        self._recent_blocks = deque()
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._window_count = 0
+
+    def record_success(self):
+        """Count a finished download; returns the (possibly updated) limit"""
+        with self._lock:
+            self._window_count += 1
+            if self._window_count < self.EVALUATION_WINDOW:
+                return self.limit
+            now = time.time()
+            throughput = self._window_count / max(now - self._window_start, 1e-6)
+            if self._last_throughput is None or throughput > self._last_throughput * (1 + self.THROUGHPUT_TOLERANCE):
+                self.limit = min(self.maximum, self.limit + 1)
+            elif throughput < self._last_throughput * (1 - self.THROUGHPUT_TOLERANCE):
+                self.limit = max(self.minimum, self.limit - 1)
+            self._last_throughput = throughput
+            self._reset_window(now)
+            return self.limit
+
+    def _back_off(self, now):
+        self.limit = max(self.minimum, self.limit // 2)
+        self._last_throughput = None
+        self._reset_window(now)
+
+    def record_timeout(self):
+        with self._lock:
+            self._back_off(time.time())
+            return self.limit
+
+    def record_block(self):
+        """Halve the limit and start a cooldown if blocks are clustering"""
+        with self._lock:
+            now = time.time()
+            self._back_off(now)
+            self._recent_blocks.append(now)
+            while now - self._recent_blocks[0] > self.CLUSTER_SECONDS:
+                self._recent_blocks.popleft()
+            if len(self._recent_blocks) >= self.CLUSTER_SIZE:
+                self.paused_until = now + self.COOLDOWN_SECONDS
+                self._recent_blocks.clear()
+            return self.limit
+
+    def pause_remaining(self):
+        return max(0.0, self.paused_until - time.time())
+
+    def wait_until_resumed(self, stop_event):
+        """Block the calling worker while a cooldown is active"""
+        while not stop_event.is_set():
+            remaining = self.pause_remaining()
+            if remaining <= 0:
+                return
+            stop_event.wait(min(remaining, 1.0))
+
+
+# Token-bucket limiter shared by all download workers
+class RateLimiter:
+    """
+    Allows requests_per_minute video requests across all worker threads, with bursts of
+    up to `burst` requests. Callers that find the bucket empty reserve the next token and
+    sleep until it is due, so requests are spread evenly instead of bunching up after each
+    completion. `jitter` adds a random extra delay of up to that fraction of the interval.
+    """
+
+    def __init__(self, requests_per_minute, burst=1, jitter=0.0):
+        self.interval = 60.0 / requests_per_minute
+        self.burst = max(1, burst)
+        self.jitter = jitter
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token and return how long the caller has to wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+            self._updated = now
+            self._tokens -= 1
+            delay = -self._tokens * self.interval if self._tokens < 0 else 0.0
+        if self.jitter:
+            delay += random.uniform(0, self.jitter * self.interval)
+        return delay
+
+    def acquire(self, stop_event=None):
+        """Wait for the next request slot; returns False if stop_event was set while waiting"""
+        delay = self._reserve()
+        if delay <= 0:
+            return True
+        if stop_event is not None:
+            return not stop_event.wait(delay)
+        time.sleep(delay)
+        return True
+
+
+# Token bucket in bytes shared by all transfers
+class BandwidthLimiter:
+    """
+    Every transfer charges the bytes it just received and sleeps while the bucket is in
+    debt, so the combined rate of all downloads stays at bytes_per_second however many
+    run at once (0 = unlimited). set_rate() applies immediately, also to transfers already
+    waiting. Given a multiprocessing context, the bucket lives in shared memory and the
+    limiter can be handed to download processes.
+    """
+
+    # Bytes a transfer can take without waiting, in seconds' worth of the rate
+    BURST_SECONDS = 1.0
+    # Waiting transfers re-check the bucket this often, so rate changes reach them quickly
+    WAIT_SLICE = 0.25
+
+    def __init__(self, bytes_per_second=0, context=None):
+        # [rate, tokens, last refill]
+        state = [float(bytes_per_second), float(bytes_per_second) * self.BURST_SECONDS, time.monotonic()]
+        if context is None:
+            self._state = state
+            self._lock = threading.Lock()
+        else:
+            self._state = context.Array('d', state)
+            self._lock = self._state.get_lock()
+
+    @property
+    def rate(self):
+        return self._state[0]
+
+    def _refill(self):
+        # Caller holds the lock
+        now = time.monotonic()
+        rate = self._state[0]
+        if rate > 0:
+            self._state[1] = min(rate * self.BURST_SECONDS, self._state[1] + (now - self._state[2]) * rate)
+        else:
+            self._state[1] = 0.0
+        self._state[2] = now
+        return rate
+
+    def set_rate(self, bytes_per_second):
+        with self._lock:
+            self._refill()
+            self._state[0] = float(bytes_per_second)
+            self._state[1] = min(self._state[1], self._state[0] * self.BURST_SECONDS)
+
+    def consume(self, byte_count, stop_event=None):
+        """Charge byte_count and wait until the bucket is out of debt; returns False if stop_event was set meanwhile"""
+        with self._lock:
+            if self._refill() <= 0:
+                return True
+            self._state[1] -= byte_count
+        while True:
+            with self._lock:
+                rate = self._refill()
+                tokens = self._state[1]
+            if rate <= 0 or tokens >= 0:
+                return True
+            delay = min(-tokens / rate, self.WAIT_SLICE)
+            if stop_event is not None:
+                if stop_event.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+
+
+# Decimal units (K, M, G) are powers of 1000; binary ones (Ki, Mi, Gi) powers of 1024
+BYTE_RATE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:([KMG])(i)?)?B?(?:/s)?\s*$", re.IGNORECASE)
+BYTE_RATE_UNITS = {'K': 1, 'M': 2, 'G': 3}
+
+
+# Function to parse a bandwidth such as 500K, 2.5M or 2000000 into bytes per second (0 = unlimited)
+def parse_byte_rate(value):
+    if isinstance(value, (int, float)):
+        rate = float(value)
+    else:
+        match = BYTE_RATE_PATTERN.match(str(value))
+        if not match:
+            raise ValueError(f"Invalid bandwidth '{value}' (expected e.g. 500K, 2M or 0 for unlimited)")
+        number, unit, binary = match.groups()
+        rate = float(number)
+        if unit:
+            rate *= (1024 if binary else 1000) ** BYTE_RATE_UNITS[unit.upper()]
+    if rate < 0:
+        raise ValueError(f"Invalid bandwidth '{value}': must not be negative")
+    return rate
+
+
+# Function to parse a time of day "HH:MM" into minutes after midnight
+def parse_time_of_day(value):
+    try:
+        hours, minutes = str(value).split(':')
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        raise ValueError(f"Invalid time of day '{value}' (expected HH:MM)")
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+        raise ValueError(f"Invalid time of day '{value}' (expected HH:MM)")
+    return hours * 60 + minutes
+
+
+# Function to format minutes after midnight as "HH:MM"
+def format_time_of_day(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+# Bandwidth cap with optional time-of-day windows
+class BandwidthSchedule:
+    """
+    `limit` (bytes/s, 0 = unlimited) applies by default; each window in `windows` is a dict
+    {'from': 'HH:MM', 'to': 'HH:MM', 'limit': '2M'} that overrides it during that time of day
+    (a window whose end is before its start runs past midnight). Both may be changed while a
+    download runs. With file_path, reload() re-reads a JSON file of the same shape
+    ({"limit": ..., "windows": [...]}) whenever it has been modified.
+    """
+
+    def __init__(self, limit=0, windows=(), file_path=None):
+        self.limit = parse_byte_rate(limit)
+        self.windows = self.parse_windows(windows)
+        self.file_path = file_path
+        self._file_mtime = None
+
+    @staticmethod
+    def parse_windows(windows):
+        parsed = []
+        for window in windows or ():
+            if not isinstance(window, dict):
+                raise ValueError(f"Invalid bandwidth window {window!r}")
+            parsed.append((parse_time_of_day(window.get('from')), parse_time_of_day(window.get('to')),
+                           parse_byte_rate(window.get('limit', 0))))
+        return parsed
+
+    def active_window(self, now=None):
+        """The (start minute, end minute, limit) window in effect now, or None"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for window in self.windows:
+            start, end, _ = window
+            if start <= minute < end or (end < start and (minute >= start or minute < end)):
+                return window
+        return None
+
+    def current_limit(self, now=None):
+        window = self.active_window(now)
+        return self.limit if window is None else window[2]
+
+    def reload(self):
+        """Re-read file_path if it changed since the last call; True if it was loaded. Raises ValueError for a bad file."""
+        if not self.file_path:
+            return False
+        try:
+            mtime = os.stat(self.file_path).st_mtime
+        except OSError as e:
+            # Reported once until the file shows up again; the last loaded settings stay in effect
+            if self._file_mtime == -1:
+                return False
+            self._file_mtime = -1
+            raise ValueError(f"Cannot read bandwidth schedule {self.file_path}: {e}")
+        if mtime == self._file_mtime:
+            return False
+        # Remembered before parsing, so a broken file is reported once rather than on every check
+        self._file_mtime = mtime
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json_load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Cannot read bandwidth schedule {self.file_path}: {e}")
+        if not isinstance(data, dict):
+            raise ValueError(f"Bandwidth schedule {self.file_path} must be a JSON object")
+        limit = parse_byte_rate(data.get('limit', self.limit))
+        self.windows = self.parse_windows(data.get('windows'))
+        self.limit = limit
+        return True
+
+
+# Function to format a bandwidth for log messages
+def format_byte_rate(bytes_per_second):
+    return f"{bytes_per_second / 1e6:.2f} MB/s" if bytes_per_second else "unlimited"
+
+
+# Function to pick the byte counters out of a yt-dlp progress hook dict
+def get_transfer_progress(d):
+    """Returns (status, downloaded_bytes, total_bytes, speed); total falls back to yt-dlp's estimate"""
+    return d.get('status'), d.get('downloaded_bytes'), d.get('total_bytes') or d.get('total_bytes_estimate'), d.get('speed')
+
+
+# Byte-level progress of all in-flight downloads
+class TransferMonitor:
+    """
+    Fed from yt-dlp progress hooks (any thread), keyed by video URL. The aggregate rate is
+    sampled periodically and smoothed with an EWMA so the ETA doesn't jump with every chunk.
+    The ETA covers the bytes left in running transfers plus the videos not started yet,
+    assumed to be the average size of the videos completed so far.
+    """
+
+    SMOOTHING = 0.3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        # Bytes of the finished files of each video (separate video and audio formats download two)
+        self._video_bytes = {}
+        self.transferred_bytes = 0
+        self.completed_videos = 0
+        self.completed_bytes = 0
+        self.rate = None
+        self._last_sample = None
+
+    def update(self, key, status, downloaded=None, total=None, speed=None):
+        with self._lock:
+            entry = self._active.get(key)
+            if status == 'downloading':
+                downloaded = downloaded or 0
+                if entry is None:
+                    # Resumed .part files report the bytes already on disk; count only what moves from here on
+                    entry = self._active[key] = {'counted': downloaded}
+                self.transferred_bytes += max(downloaded - entry['counted'], 0)
+                entry.update(counted=max(downloaded, entry['counted']), downloaded=downloaded, total=total, speed=speed)
+            elif status == 'finished' and entry is not None:
+                del self._active[key]
+                size = total or downloaded or entry['downloaded']
+                self.transferred_bytes += max(size - entry['counted'], 0)
+                self._video_bytes[key] = self._video_bytes.get(key, 0) + size
+
+    def end(self, key, completed=False):
+        """Forget a video once its download returned; completed videos feed the average size"""
+        with self._lock:
+            self._active.pop(key, None)
+            size = self._video_bytes.pop(key, 0)
+            if completed and size:
+                self.completed_videos += 1
+                self.completed_bytes += size
+
+    def active_count(self):
+        with self._lock:
+            return len(self._active)
+
+    def sample(self):
+        """Fold the throughput since the previous sample into the smoothed rate (call at a steady interval)"""
+        now = time.monotonic()
+        with self._lock:
+            transferred = self.transferred_bytes
+        if self._last_sample is not None and now > self._last_sample[0]:
+            current = (transferred - self._last_sample[1]) / (now - self._last_sample[0])
+            self.rate = current if self.rate is None else self.SMOOTHING * current + (1 - self.SMOOTHING) * self.rate
+        self._last_sample = (now, transferred)
+
+    def snapshot(self, waiting_videos):
+        """Aggregate rate, ETA (None until it can be estimated) and per-transfer speeds in bytes/s"""
+        with self._lock:
+            active = list(self._active.values())
+            average_size = self.completed_bytes / self.completed_videos if self.completed_videos else None
+        eta = None
+        if self.rate and average_size is not None:
+            in_flight = sum(max(entry['total'] - entry['downloaded'], 0) for entry in active if entry['total'])
+            eta = max(in_flight + waiting_videos * average_size, 0) / self.rate
+        return {
+            'bytes_per_second': self.rate or 0.0,
+            'eta_seconds': eta,
+            'slot_speeds': [entry['speed'] or 0.0 for entry in active],
+            'transferred_bytes': self.transferred_bytes,
+        }
+
+
+# Pipeline stages timed for every downloaded video
+PIPELINE_STAGES = ('queue_wait', 'extraction', 'transfer', 'postprocess', 'finalize')
+
+
+# Function to turn one video's timestamps (see run_download) into seconds per pipeline stage
+def get_stage_durations(marks):
+    finished = marks['finished']
+    download_start = marks['download_start']
+    extract_start = marks.get('extract_start', download_start)
+    # Without a separate extraction stage, extraction lasts until the first media bytes arrive
+    extract_end = marks.get('extract_end', marks.get('transfer_start', finished))
+    transfer_start = max(extract_end, download_start)
+    transfer_end = marks.get('transfer_end', transfer_start)
+    finalize_start = marks.get('finalize_start', finished)
+    return {
+        # Waiting for a slot (or the rate limit), plus any wait between the two pipeline stages
+        'queue_wait': max(0.0, extract_start - marks.get('queued', extract_start)) + max(0.0, download_start - extract_end),
+        'extraction': max(0.0, extract_end - extract_start),
+        'transfer': max(0.0, transfer_end - transfer_start),
+        'postprocess': max(0.0, finalize_start - transfer_end),
+        'finalize': max(0.0, finished - finalize_start),
+    }
+
+
+# Function to replace a file's contents in one step, so readers never see a partial file
+def _write_atomic(file_path, text):
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, file_path)
+
+
+# Aggregated stage timings and outcome counters for one run
+class DownloadMetrics:
+    """
+    Histograms (Prometheus-style cumulative buckets, in seconds) of the time videos spend
+    in each pipeline stage, plus counters of outcomes and downloaded bytes. Exported as
+    JSON at the end of a run and as a Prometheus text file while it runs.
+    """
+
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages = {stage: {'counts': [0] * (len(self.BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+                       for stage in PIPELINE_STAGES}
+        self.outcomes = {}
+        self.bytes_downloaded = 0
+
+    def observe(self, durations, byte_size=None):
+        """Record one downloaded video's stage durations"""
+        for stage, seconds in durations.items():
+            histogram = self.stages[stage]
+            histogram['counts'][bisect_left(self.BUCKETS, seconds)] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+        self.bytes_downloaded += byte_size or 0
+
+    def count_outcome(self, outcome):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def _cumulative_buckets(self, stage):
+        total = 0
+        for bound, count in zip(self.BUCKETS + ('+Inf',), self.stages[stage]['counts']):
+            total += count
+            yield str(bound), total
+
+    def summary(self):
+        """Average seconds per downloaded video in each stage, for the log"""
+        return {stage: histogram['sum'] / histogram['count']
+                for stage, histogram in self.stages.items() if histogram['count']}
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at,
+            'elapsed_seconds': round(time.time() - self.started_at, 3),
+            'bytes_downloaded': self.bytes_downloaded,
+            'outcomes': dict(self.outcomes),
+            'stages': {
+                stage: {
+                    'count': histogram['count'],
+                    'sum_seconds': round(histogram['sum'], 3),
+                    'mean_seconds': round(histogram['sum'] / histogram['count'], 3) if histogram['count'] else None,
+                    'buckets': dict(self._cumulative_buckets(stage)),
+                }
+                for stage, histogram in self.stages.items()
+            },
+        }
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP favesave_stage_seconds Time downloaded videos spent in each pipeline stage",
+            "# TYPE favesave_stage_seconds histogram",
+        ]
+        for stage, histogram in self.stages.items():
+            for bound, count in self._cumulative_buckets(stage):
+                lines.append(f'favesave_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'favesave_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.3f}')
+            lines.append(f'favesave_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        lines += [
+            "# HELP favesave_videos_total Videos by outcome in the current run",
+            "# TYPE favesave_videos_total counter",
+        ]
+        lines += [f'favesave_videos_total{{outcome="{outcome}"}} {count}' for outcome, count in sorted(self.outcomes.items())]
+        lines += [
+            "# HELP favesave_downloaded_bytes_total Bytes of video downloaded in the current run",
+            "# TYPE favesave_downloaded_bytes_total counter",
+            f"favesave_downloaded_bytes_total {self.bytes_downloaded}",
+            "# HELP favesave_run_elapsed_seconds Seconds since the current run started",
+            "# TYPE favesave_run_elapsed_seconds gauge",
+            f"favesave_run_elapsed_seconds {time.time() - self.started_at:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, file_path):
+        _write_atomic(file_path, json.dumps(self.to_dict(), indent=2))
+
+    def write_prometheus(self, file_path):
+        _write_atomic(file_path, self.to_prometheus())
+
+
+# Seconds between refreshes of the Prometheus metrics file during a run
+METRICS_INTERVAL = 15
+
+# Seconds between scheduler timer ticks (stall checks, cancellation polling)
+SCHEDULER_TICK = 0.25
+
+# Minimum seconds between detailed progress updates (~10 per second)
+PROGRESS_INTERVAL = 0.1
+
+# Seconds between throughput samples (and progress refreshes) while downloads run
+TRANSFER_SAMPLE_INTERVAL = 1.0
+
+
+# Optional behaviour of a download run (see process_videos)
+class DownloadOptions:
+    """
+    Everything process_videos can do beyond picking the lists, the date filter and the
+    number of simultaneous downloads. The defaults give a plain run: fixed concurrency,
+    downloads in threads, no rate or bandwidth cap, no metrics files, the folder's current
+    layout and no verification pass.
+    """
+
+    def __init__(self, downloader_options=None, adaptive_concurrency=False, requests_per_minute=0, rate_jitter=0.0,
+                 use_processes=False, extraction_concurrency=0, metrics_path=None, prometheus_path=None,
+                 bandwidth_schedule=None, folder_layout=None, verify_files=False):
+        # Extra yt-dlp options for every downloader instance
+        self.downloader_options = downloader_options
+        # Tune the number of simultaneous downloads (up to the maximum) from throughput and blocks
+        self.adaptive_concurrency = adaptive_concurrency
+        # Download starts per minute across all workers (0 = unlimited), plus random jitter
+        self.requests_per_minute = requests_per_minute
+        self.rate_jitter = rate_jitter
+        # One worker process per download slot instead of threads
+        self.use_processes = use_processes
+        # Videos resolved ahead of the downloads in a separate pool (0 = off)
+        self.extraction_concurrency = extraction_concurrency
+        # Files the stage timings and outcome counts are written to
+        self.metrics_path = metrics_path
+        self.prometheus_path = prometheus_path
+        # BandwidthSchedule for the combined download speed (None = unlimited)
+        self.bandwidth_schedule = bandwidth_schedule
+        # One of FOLDER_LAYOUTS; None keeps the layout the folder already has
+        self.folder_layout = folder_layout
+        # Check every downloaded file first and re-download damaged or missing ones
+        self.verify_files = verify_files
+
+
+# One download run over the videos of an export
+class DownloadScheduler:
+    """
+    Sorts the videos into skipped, already downloaded, linked and queued ones, then keeps
+    up to max_concurrent_downloads downloads in flight from an asyncio loop over a thread
+    pool (or worker processes). Completions arrive as future callbacks on that loop; a
+    timer (watchdog) handles stall detection, bandwidth schedules, transfer sampling and
+    cancellation. Counts and progress are reported through the callbacks as it goes.
+    """
+
+    # Seconds an extraction or download may run before the run is reported as stalled
+    STALL_THRESHOLD = 60
+
+    def __init__(self, download_folder, video_links, downloaded_index, catalog, log_callback, progress_callback,
+                 detailed_progress_callback, stop_event, max_concurrent_downloads, blocked_videos, failed_videos,
+                 options, folder_layout, partials):
+        self.download_folder = download_folder
+        self.video_links = video_links
+        self.total_videos = len(video_links)
+        self.downloaded_index = downloaded_index
+        self.catalog = catalog
+        self.log_callback = log_callback
+        self.progress_callback = progress_callback
+        self.detailed_progress_callback = detailed_progress_callback
+        self.stop_event = stop_event
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.blocked_videos = blocked_videos
+        self.failed_videos = failed_videos
+        self.options = options
+        self.folder_layout = folder_layout
+        # (video id, source) -> bytes of interrupted downloads that can be resumed
+        self.partials = partials
+
+        self.downloaded_count = 0
+        # Blocked videos, new or skipped from earlier runs; they are included in failed_count
+        self.blocked_count = 0
+        self.failed_count = 0
+        self.downloaded_faves = 0
+        self.downloaded_likes = 0
+        self.processed_count = 0
+
+        self.start_time = time.time()
+        self.metrics = DownloadMetrics()
+        self.last_metrics_write = 0.0
+        self.transfer_monitor = TransferMonitor()
+        self.last_transfer_sample = 0.0
+        self.stall_reported = False
+        self.pending_tasks = deque()
+        # Transient failures whose backoff has elapsed, and how many are still waiting on a timer
+        self.ready_retries = deque()
+        self.retries_waiting = 0
+        self.active_futures = {}
+        # Pipeline mode: videos being resolved, and resolved videos waiting for a transfer slot
+        self.active_extractions = {}
+        self.resolved_tasks = deque()
+        self.resolved_queue_size = max(options.extraction_concurrency, max_concurrent_downloads) * 2
+        # Set whenever the scheduler should re-check for free slots (asyncio.Event, created in its loop)
+        self.wakeup = None
+        # Progress is coalesced: detailed updates at most every PROGRESS_INTERVAL seconds,
+        # progress bar updates only when the percentage changes
+        self.last_progress_time = 0.0
+        self.last_progress_context = None
+        self.last_progress_value = None
+        # A throttled update is not lost: the scheduler loop emits it once the interval is over
+        self.progress_pending = False
+        self.trailing_progress_scheduled = False
+
+        # Limits and pools, set up by run()
+        self.concurrency = None
+        self.reported_limit = max_concurrent_downloads
+        self.rate_limiter = None
+        self.bandwidth_limiter = None
+        self.downloader_pool = None
+        self.extraction_pool = None
+        self.process_pool = self.process_stop_event = self.transfer_queue = None
+
+    def results(self):
+        return (
+            self.total_videos,
+            self.downloaded_count,
+            self.blocked_count,
+            self.failed_count,
+            self.downloaded_faves,
+            self.downloaded_likes,
+            self.video_links
+        )
+
+    def emit_progress(self, context, force=False):
+        self.last_progress_context = context
+        now = time.time()
+        if not force and now - self.last_progress_time < PROGRESS_INTERVAL:
+            self.progress_pending = True
+            if not self.trailing_progress_scheduled:
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    return  # Not scheduling yet; queue_videos flushes when it is done
+                self.trailing_progress_scheduled = True
+                loop.call_later(PROGRESS_INTERVAL - (now - self.last_progress_time), self._emit_trailing_progress)
+            return
+        self.last_progress_time = now
+        self.progress_pending = False
+        self.detailed_progress_callback({
+            'current_video': min(context['index'], self.total_videos),
+            'total_videos': self.total_videos,
+            'current_url': context['url'],
+            'video_id': context['video_id'],
+            'prefix': context['prefix'],
+            'elapsed_time': now - self.start_time,
+            'downloaded_count': self.downloaded_count,
+            'failed_count': self.failed_count,
+            'active_downloads': len(self.active_futures),
+            # Videos neither finished nor transferring right now, for the byte-based ETA
+            **self.transfer_monitor.snapshot(
+                self.total_videos - self.processed_count - self.transfer_monitor.active_count())
+        })
+
+    def _emit_trailing_progress(self):
+        self.trailing_progress_scheduled = False
+        if self.progress_pending:
+            self.emit_progress(self.last_progress_context, force=True)
+
+    def flush_progress(self):
+        if self.last_progress_context is not None:
+            self.emit_progress(self.last_progress_context, force=True)
+        self.update_progress_bar()
+
+    def update_progress_bar(self):
+        if self.total_videos == 0:
+            progress = 0
+        else:
+            progress = int((self.processed_count / self.total_videos) * 100)
+        if progress != self.last_progress_value:
+            self.last_progress_value = progress
+            self.progress_callback(progress)
+
+    def count_processed(self, context):
+        self.processed_count += 1
+        self.emit_progress(context)
+        self.update_progress_bar()
+
+    def count_downloaded(self, prefix):
+        self.downloaded_count += 1
+        if "faved_" in prefix:
+            self.downloaded_faves += 1
+        elif "liked_" in prefix:
+            self.downloaded_likes += 1
+
+    def check_for_stall(self):
+        # A page extraction that hangs stalls the run just like a transfer
+        running = list(self.active_futures.values()) + list(self.active_extractions.values())
+        if not running:
+            if self.stall_reported:
+                self.stall_reported = False
+            return
+        current_time = time.time()
+        stalled = any(
+            info.get('start_time') is not None and current_time - info['start_time'] > self.STALL_THRESHOLD
+            for info in running
+        )
+        if stalled and not self.stall_reported:
+            self.stall_reported = True
+            self.log_callback(f"⚠️ Download appears stalled (>{self.STALL_THRESHOLD}s)")
+        elif not stalled and self.stall_reported:
+            self.stall_reported = False
+            self.log_callback("✅ Download resumed...")
+
+    def concurrency_limit(self):
+        return self.concurrency.limit if self.concurrency else self.max_concurrent_downloads
+
+    def report_concurrency_change(self, new_limit):
+        if new_limit != self.reported_limit:
+            self.log_callback(f"⚙️ Adaptive concurrency: {self.reported_limit} → {new_limit} simultaneous downloads")
+            self.reported_limit = new_limit
+
+    async def wait_for_cooldown(self):
+        concurrency = self.concurrency
+        if not concurrency or concurrency.pause_remaining() <= 0:
+            return
+        self.log_callback(f"⏸️ Repeated blocks - pausing new downloads for {concurrency.pause_remaining():.0f}s")
+        # Completions keep being handled by their callbacks while the dispatcher sleeps
+        while concurrency.pause_remaining() > 0 and not self.stop_event.is_set():
+            await asyncio.sleep(min(concurrency.pause_remaining(), SCHEDULER_TICK))
+        if not self.stop_event.is_set():
+            self.log_callback("▶️ Cooldown over - resuming downloads")
+
+    def wait_for_turn(self):
+        # Cooldown and rate limit gate every request to TikTok; False if cancelled meanwhile
+        if self.concurrency:
+            self.concurrency.wait_until_resumed(self.stop_event)
+        if self.rate_limiter and not self.rate_limiter.acquire(self.stop_event):
+            return False
+        return not self.stop_event.is_set()
+
+    def extract_task(self, url):
+        if not self.wait_for_turn():
+            return {'status': 'cancelled'}
+        marks = {'extract_start': time.time()}
+        try:
+            info = self.extraction_pool.extract(url)
+            marks['extract_end'] = time.time()
+            return {'status': 'resolved', 'info': info, 'marks': marks}
+        except Exception as exc:
+            return {'status': 'error', 'error': str(exc)}
+
+    def download_task(self, url, prefix, info=None):
+        # Resolved videos already passed the gate during extraction
+        if info is None and not self.wait_for_turn():
+            return {'status': 'cancelled'}
+        # The folder layout picks the subfolder from the file name this video will get
+        video_folder = path.join(self.download_folder, get_layout_dir(self.folder_layout, prefix + get_video_id(url)))
+        if self.process_pool is None:
+            return run_download(url, video_folder, prefix, stop_event=self.stop_event,
+                                downloader_pool=self.downloader_pool, info=info,
+                                transfer_hook=lambda d: self.transfer_monitor.update(url, *get_transfer_progress(d)),
+                                bandwidth_limiter=self.bandwidth_limiter)
+        # Process mode: this thread only hands the video to a worker process and waits
+        if self.stop_event.is_set():
+            return {'status': 'cancelled'}
+        try:
+            return self.process_pool.submit(_download_in_process, url, video_folder, prefix, info).result()
+        except Exception as exc:
+            return {'status': 'error', 'error': f"Download process failed: {exc}"}
+
+    def link_duplicate(self, context, file_name):
+        # The same video in the other list gets a second name for the downloaded file
+        # (a hardlink, or a catalog alias where hardlinks aren't supported) instead of a second download
+        # Returns False if file_name is gone, in which case the video has to be downloaded again
+        link_name = context['prefix'] + context['video_id'] + path.splitext(file_name)[1]
+        link_name = path.join(get_layout_dir(self.folder_layout, link_name), link_name)
+        try:
+            linked = link_video_file(self.download_folder, file_name, link_name)
+        except FileNotFoundError:
+            self.log_callback(f"⚠️ {file_name} is missing - downloading {context['url']} again")
+            if self.catalog:
+                self.catalog.requeue_file(file_name, "File missing")
+            return False
+        if linked:
+            self.log_callback(f"🔗 Linked: {context['url']} (same video as {file_name})")
+            recorded_name = link_name
+        else:
+            self.log_callback(f"🔗 Already downloaded as {file_name}: {context['url']}")
+            recorded_name = file_name
+        self.downloaded_index.add(link_name)
+        if self.catalog:
+            self.catalog.record_download(context['video_id'], context['source'], context['url'], recorded_name)
+        self.metrics.count_outcome('linked')
+        self.count_downloaded(context['prefix'])
+        return True
+
+    def record_result(self, context, result):
+        catalog = self.catalog
+        status = result.get('status')
+        partial_bytes = 0
+        # Duplicates in the other list settled along with this video
+        settled_duplicates = 0
+        if catalog and result.get('partials'):
+            partial_bytes = catalog.record_partials(context['video_id'], context['source'], result['partials'])
+        if status == 'downloaded':
+            duration = result.get('duration')
+            self.count_downloaded(context['prefix'])
+            # Keep the index current so later lookups in this run stay O(1)
+            file_path = result.get('file_path')
+            # Catalog and index keep paths relative to the download folder
+            if file_path:
+                file_name = path.relpath(file_path, self.download_folder)
+            else:
+                file_name = f"{context['prefix']}{context['video_id']}.mp4"
+                file_name = path.join(get_layout_dir(self.folder_layout, file_name), file_name)
+            self.downloaded_index.add(file_name)
+            if result.get('marks'):
+                marks = dict(context.get('marks', {}), queued=context['queued'], **result['marks'])
+                byte_size = None
+                try:
+                    byte_size = path.getsize(file_path) if file_path else None
+                except OSError:
+                    pass
+                self.metrics.observe(get_stage_durations(marks), byte_size)
+            self.metrics.count_outcome('downloaded')
+            if catalog:
+                catalog.record_download(context['video_id'], context['source'], context['url'], file_name, duration)
+                catalog.clear_partials(context['video_id'], context['source'])
+                if context.pop('stored_info', False):
+                    catalog.forget_video_info(context['video_id'])
+            self.log_callback(f"✅ Downloaded: {context['url']}")
+            for duplicate in context.get('duplicates', ()):
+                if self.link_duplicate(duplicate, file_name):
+                    settled_duplicates += 1
+                else:
+                    self.pending_tasks.appendleft(duplicate)
+            if self.concurrency:
+                self.report_concurrency_change(self.concurrency.record_success())
+        elif status == 'cancelled':
+            kept = f" ({partial_bytes / 1e6:.1f} MB kept to resume)" if partial_bytes else ""
+            self.log_callback(f"🛑 Cancelled: {context['url']}{kept}")
+            self.metrics.count_outcome('cancelled')
+        else:
+            error_message = result.get('error', 'Unknown error')
+            url = context['url']
+            error_class = classify_download_error(error_message)
+            if context.pop('cached_info', False) and error_class == 'permanent':
+                # Cached media URLs may have expired: retry once with freshly resolved info
+                error_class = 'transient'
+            if catalog and context.pop('stored_info', False):
+                # Stored info may hold expired media URLs; the error itself is kept in the videos table
+                catalog.forget_video_info(context['video_id'])
+            if self.concurrency:
+                if error_class in ('blocked', 'rate_limit'):
+                    self.report_concurrency_change(self.concurrency.record_block())
+                elif is_timeout_error(error_message):
+                    self.report_concurrency_change(self.concurrency.record_timeout())
+            # Transient and rate-limit errors go back in the queue with exponential backoff
+            attempt = context.get('attempt', 1)
+            if (error_class in ('transient', 'rate_limit') and attempt < MAX_DOWNLOAD_ATTEMPTS
+                    and not self.stop_event.is_set()):
+                delay = get_retry_delay(attempt, error_class)
+                context['attempt'] = attempt + 1
+                self.log_callback(f"🔁 Retrying {url} in {delay:.0f}s (attempt {attempt + 1} of "
+                                  f"{MAX_DOWNLOAD_ATTEMPTS}): {error_message}")
+                self.schedule_retry(context, delay)
+                self.metrics.count_outcome('retried')
+                return
+            self.failed_count += 1
+            # Check if this is a blocked video error
+            if error_class == 'blocked':
+                self.log_callback(f"🚫 Blocked: {url} - IP address blocked")
+                status = 'blocked'
+                self.blocked_count += 1 + len(context.get('duplicates', ()))
+                if self.blocked_videos is not None:
+                    self.blocked_videos.add(url)
+            elif error_class == 'permanent':
+                self.log_callback(f"❌ Failed to download {url} : {error_message}")
+                status = 'failed'
+                if self.failed_videos is not None:
+                    self.failed_videos.add(url)
+            else:
+                # Out of attempts, but the video itself is fine - leave it for the next run
+                self.log_callback(f"❌ Failed to download {url} after {attempt} attempts: {error_message}")
+                status = 'pending'
+            self.metrics.count_outcome({'blocked': 'blocked', 'permanent': 'failed'}.get(error_class, 'gave_up'))
+            # Record the attempt in the catalog; blocked and failed videos are skipped on the next run
+            for failed_context in [context] + context.get('duplicates', []):
+                if catalog:
+                    catalog.record_failure(failed_context['video_id'], failed_context['source'], failed_context['url'],
+                                           status, error_message)
+                if failed_context is not context:
+                    self.failed_count += 1
+                    if status == 'blocked' and self.blocked_videos is not None:
+                        self.blocked_videos.add(failed_context['url'])
+                    elif status == 'failed' and self.failed_videos is not None:
+                        self.failed_videos.add(failed_context['url'])
+            settled_duplicates = len(context.get('duplicates', ()))
+
+        # Cancelled videos leave their duplicates unprocessed, like any video not reached
+        self.processed_count += settled_duplicates
+        self.count_processed(context)
+
+    def schedule_retry(self, context, delay):
+        self.retries_waiting += 1
+        asyncio.get_running_loop().call_later(delay, self.release_retry, context)
+
+    def release_retry(self, context):
+        self.retries_waiting -= 1
+        context['queued'] = time.time()
+        context.pop('marks', None)
+        self.ready_retries.append(context)
+        self.wakeup.set()
+
+    def log_start(self, context):
+        if context.get('attempt', 1) == 1:
+            self.log_callback(f"🎥 Processing Video {context['index']} of {self.total_videos}")
+            self.log_callback(f"Downloading: {context['url']}")
+
+    def resolve_from_cache(self, context):
+        # First attempts can reuse info resolved ahead by a run that ended before its transfer
+        if self.catalog is None or context.get('attempt', 1) > 1:
+            return None
+        info = self.catalog.get_video_info(context['video_id'])
+        if info is not None:
+            context['stored_info'] = True
+        return info
+
+    def start_task(self, loop, executor, extraction_executor, context):
+        info = self.resolve_from_cache(context)
+        if info is None:
+            if extraction_executor is not None:
+                self.start_extraction(loop, extraction_executor, context)
+            else:
+                self.log_start(context)
+                self.start_download(loop, executor, context)
+            return
+        self.log_start(context)
+        context['info'] = info
+        context['cached_info'] = True
+        if extraction_executor is not None:
+            self.resolved_tasks.append(context)
+        else:
+            self.start_download(loop, executor, context)
+
+    def start_download(self, loop, executor, context):
+        self.emit_progress(context)
+        future = loop.run_in_executor(executor, self.download_task, context['url'], context['prefix'],
+                                      context.pop('info', None))
+        context['start_time'] = time.time()
+        self.active_futures[future] = context
+        future.add_done_callback(self.download_finished)
+
+    def start_extraction(self, loop, executor, context):
+        self.log_start(context)
+        context['start_time'] = time.time()
+        future = loop.run_in_executor(executor, self.extract_task, context['url'])
+        self.active_extractions[future] = context
+        future.add_done_callback(self.extraction_finished)
+
+    @staticmethod
+    def get_future_result(future):
+        if future.cancelled():
+            return {'status': 'cancelled'}
+        exc = future.exception()
+        return future.result() if exc is None else {'status': 'error', 'error': str(exc)}
+
+    def download_finished(self, future):
+        context = self.active_futures.pop(future)
+        try:
+            result = self.get_future_result(future)
+            if self.process_pool is None:
+                # Worker processes report the end of a transfer through transfer_queue instead
+                self.transfer_monitor.end(context['url'], result.get('status') == 'downloaded')
+            self.record_result(context, result)
+        finally:
+            # Free slot: let the dispatcher start the next download right away
+            self.wakeup.set()
+
+    def extraction_finished(self, future):
+        context = self.active_extractions.pop(future)
+        try:
+            result = self.get_future_result(future)
+            if result['status'] == 'resolved':
+                context['info'] = result['info']
+                context['marks'] = result['marks']
+                self.resolved_tasks.append(context)
+                if self.catalog:
+                    # Kept until the transfer finishes, so a run cancelled in between can skip the page request
+                    self.catalog.put_video_info(context['video_id'], result['info'])
+                    context['stored_info'] = True
+            else:
+                self.record_result(context, result)
+        finally:
+            self.wakeup.set()
+
+    def write_prometheus_metrics(self, force=False):
+        prometheus_path = self.options.prometheus_path
+        if not prometheus_path or (not force and time.time() - self.last_metrics_write < METRICS_INTERVAL):
+            return
+        self.last_metrics_write = time.time()
+        try:
+            self.metrics.write_prometheus(prometheus_path)
+        except OSError as e:
+            self.log_callback(f"⚠️ Could not write metrics file {prometheus_path}: {e}")
+
+    def drain_transfer_queue(self):
+        while self.transfer_queue is not None:
+            try:
+                method, args = self.transfer_queue.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                return
+            getattr(self.transfer_monitor, method)(*args)
+
+    def sample_transfers(self):
+        # Once per TRANSFER_SAMPLE_INTERVAL: update the smoothed rate and refresh the progress display
+        self.drain_transfer_queue()
+        now = time.monotonic()
+        if now - self.last_transfer_sample < TRANSFER_SAMPLE_INTERVAL:
+            return
+        self.last_transfer_sample = now
+        self.transfer_monitor.sample()
+        if self.active_futures and self.last_progress_context is not None:
+            self.emit_progress(self.last_progress_context, force=True)
+
+    def apply_bandwidth_schedule(self):
+        # Picks up schedule windows, live changes to the schedule and edits of its file
+        if self.bandwidth_limiter is None:
+            return
+        bandwidth_schedule = self.options.bandwidth_schedule
+        try:
+            if bandwidth_schedule.reload():
+                self.log_callback(f"📶 Bandwidth schedule loaded from {bandwidth_schedule.file_path}")
+        except ValueError as e:
+            self.log_callback(f"⚠️ {e}")
+        limit = bandwidth_schedule.current_limit()
+        if limit != self.bandwidth_limiter.rate:
+            self.bandwidth_limiter.set_rate(limit)
+            self.log_callback(f"📶 Bandwidth cap: {format_byte_rate(limit)} across all downloads")
+
+    def finish_metrics(self):
+        transferred_bytes = self.transfer_monitor.transferred_bytes
+        if transferred_bytes:
+            self.log_callback(f"📶 Transferred {transferred_bytes / 1e6:.1f} MB "
+                              f"({transferred_bytes / 1e6 / max(time.time() - self.start_time, 0.001):.2f} MB/s on average)")
+        averages = self.metrics.summary()
+        if averages:
+            self.log_callback("⏱️ Average time per video: " + ", ".join(
+                f"{stage.replace('_', ' ')} {seconds:.1f}s" for stage, seconds in averages.items()))
+        self.write_prometheus_metrics(force=True)
+        metrics_path = self.options.metrics_path
+        if metrics_path:
+            try:
+                self.metrics.write_json(metrics_path)
+            except OSError as e:
+                self.log_callback(f"⚠️ Could not write metrics file {metrics_path}: {e}")
+
+    def watchdog(self):
+        # Timer-driven stall detection and cancellation polling, independent of completions
+        self.check_for_stall()
+        self.apply_bandwidth_schedule()
+        self.sample_transfers()
+        self.write_prometheus_metrics()
+        if self.stop_event.is_set():
+            if self.process_stop_event is not None:
+                self.process_stop_event.set()
+            self.wakeup.set()
+        else:
+            asyncio.get_running_loop().call_later(SCHEDULER_TICK, self.watchdog)
+
+    def next_task(self):
+        # Due retries go ahead of new videos
+        return self.ready_retries.popleft() if self.ready_retries else self.pending_tasks.popleft()
+
+    def has_queued_tasks(self):
+        return bool(self.ready_retries or self.pending_tasks)
+
+    async def run_scheduler(self, executor, extraction_executor):
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.watchdog()
+        extraction_concurrency = self.options.extraction_concurrency
+        stop_event = self.stop_event
+        # Keep concurrency_limit() downloads in flight. In pipeline mode up to extraction_concurrency
+        # videos are resolved ahead, as long as the queue of resolved videos has room.
+        while not stop_event.is_set():
+            await self.wait_for_cooldown()
+            if stop_event.is_set():
+                # Cancelled during the cooldown: clearing wakeup below would drop the watchdog's last wakeup
+                break
+            if extraction_executor is not None:
+                while (len(self.active_extractions) < extraction_concurrency
+                       and len(self.active_extractions) + len(self.resolved_tasks) < self.resolved_queue_size
+                       and self.has_queued_tasks() and not stop_event.is_set()):
+                    self.start_task(loop, executor, extraction_executor, self.next_task())
+                while (len(self.active_futures) < self.concurrency_limit() and self.resolved_tasks
+                       and not stop_event.is_set()):
+                    self.start_download(loop, executor, self.resolved_tasks.popleft())
+            else:
+                while (len(self.active_futures) < self.concurrency_limit() and self.has_queued_tasks()
+                       and not stop_event.is_set()):
+                    self.start_task(loop, executor, None, self.next_task())
+            if not (self.active_futures or self.active_extractions or self.resolved_tasks
+                    or self.has_queued_tasks() or self.retries_waiting):
+                break
+            self.wakeup.clear()
+            await self.wakeup.wait()
+
+        if stop_event.is_set():
+            self.log_callback("Cancellation requested - stopping new downloads")
+        # In-flight work watches stop_event itself; wait for it to wind down
+        while self.active_futures or self.active_extractions:
+            self.wakeup.clear()
+            await self.wakeup.wait()
+
+    def queue_videos(self):
+        """Skip, count or link the videos that need no download and queue the rest"""
+        log_callback = self.log_callback
+        resume_tasks = []
+        # First context scheduled for each video id; the other list's context rides along as a duplicate
+        scheduled_videos = {}
+        for index, (url, prefix) in enumerate(self.video_links, start=1):
+            if self.stop_event.is_set():
+                break
+            context = {
+                'index': index,
+                'url': url,
+                'prefix': prefix,
+                'video_id': get_video_id(url),
+                'source': get_source_list(prefix),
+                'queued': self.start_time,
+            }
+
+            # Check if video is blocked
+            if self.blocked_videos and url in self.blocked_videos:
+                log_callback(f"🎥 Processing Video {index} of {self.total_videos}")
+                log_callback(f"🚫 Skipping blocked video: {url}")
+                self.metrics.count_outcome('skipped')
+                self.blocked_count += 1
+                self.failed_count += 1
+                self.count_processed(context)
+                continue
+
+            if self.failed_videos and url in self.failed_videos:
+                log_callback(f"🎥 Processing Video {index} of {self.total_videos}")
+                log_callback(f"❌ Skipping failed video: {url}")
+                self.metrics.count_outcome('skipped')
+                self.failed_count += 1
+                self.count_processed(context)
+                continue
+
+            if self.downloaded_index.contains(context['video_id'], prefix):
+                log_callback(f"🎥 Processing Video {index} of {self.total_videos}")
+                log_callback(f"Already downloaded: {url}")
+                self.metrics.count_outcome('already_downloaded')
+                self.count_downloaded(prefix)
+                self.count_processed(context)
+                continue
+
+            existing_file = self.downloaded_index.find(context['video_id'])
+            if existing_file is not None:
+                # Downloaded for the other list already
+                log_callback(f"🎥 Processing Video {index} of {self.total_videos}")
+                if self.link_duplicate(context, existing_file):
+                    self.count_processed(context)
+                    continue
+
+            if context['video_id'] in scheduled_videos:
+                # In both lists: downloaded once, for the first list it appears in
+                scheduled_videos[context['video_id']].setdefault('duplicates', []).append(context)
+            elif (context['video_id'], context['source']) in self.partials:
+                resume_tasks.append(context)
+                scheduled_videos[context['video_id']] = context
+            else:
+                self.pending_tasks.append(context)
+                scheduled_videos[context['video_id']] = context
+
+        # This runs before the scheduler loop, which would otherwise emit the last throttled update
+        self.flush_progress()
+
+        duplicate_count = sum(len(context.get('duplicates', ())) for context in scheduled_videos.values())
+        if duplicate_count:
+            log_callback(f"🔗 {duplicate_count} videos to download are in both lists - each is downloaded once")
+
+        # Interrupted downloads go first, before their partial files can age out
+        if resume_tasks:
+            self.pending_tasks.extendleft(reversed(resume_tasks))
+            resume_bytes = sum(self.partials[(context['video_id'], context['source'])] for context in resume_tasks)
+            log_callback(f"♻️ Resuming {len(resume_tasks)} interrupted downloads "
+                         f"({resume_bytes / 1e6:.1f} MB already downloaded)")
+
+    def run(self):
+        """Queue the videos, download the queue and return process_videos' result tuple"""
+        log_callback = self.log_callback
+        options = self.options
+        max_concurrent_downloads = self.max_concurrent_downloads
+        self.queue_videos()
+        if self.stop_event.is_set():
+            self.finish_metrics()
+            self.flush_progress()
+            return self.results()
+
+        # Adaptive mode starts at one download and tunes itself up to max_concurrent_downloads
+        if options.adaptive_concurrency:
+            self.concurrency = AdaptiveConcurrency(max_concurrent_downloads)
+            log_callback(f"⚡ Adaptive concurrency enabled (1-{max_concurrent_downloads} simultaneous downloads)")
+        self.reported_limit = self.concurrency_limit()
+
+        # Pace download starts across all workers
+        if options.requests_per_minute:
+            self.rate_limiter = RateLimiter(options.requests_per_minute, jitter=options.rate_jitter)
+            log_callback(f"⏱️ Rate limit: {options.requests_per_minute} videos per minute")
+
+        # One byte budget for every transfer; in process mode it lives in shared memory
+        if options.bandwidth_schedule is not None:
+            self.bandwidth_limiter = BandwidthLimiter(
+                context=multiprocessing.get_context('spawn') if options.use_processes else None)
+            self.apply_bandwidth_schedule()
+
+        # Pools are released in reverse order of creation even if the scheduler raises
+        extraction_executor = None
+        with ExitStack() as stack:
+            # Each executor thread keeps its own yt-dlp instance for the whole run; in process mode
+            # each slot's thread forwards to a worker process that holds the instance instead
+            if options.use_processes:
+                log_callback(f"🧩 Process mode: starting {max_concurrent_downloads} download processes")
+                self.process_pool, self.process_stop_event, self.transfer_queue = create_download_process_pool(
+                    max_concurrent_downloads, options.downloader_options, self.bandwidth_limiter)
+                # Workers flush their queued byte reports on exit
+                stack.callback(self.drain_transfer_queue)
+                stack.callback(self.process_pool.shutdown, cancel_futures=True)
+            else:
+                self.downloader_pool = DownloaderPool(options.downloader_options)
+                stack.callback(self.downloader_pool.close)
+            # Pipeline mode: a separate pool resolves video info ahead so page extraction never holds a transfer slot
+            if options.extraction_concurrency:
+                log_callback(f"🔀 Pipeline mode: resolving up to {options.extraction_concurrency} videos ahead of "
+                             f"{max_concurrent_downloads} transfer slots")
+                self.extraction_pool = DownloaderPool(options.downloader_options)
+                stack.callback(self.extraction_pool.close)
+                extraction_executor = stack.enter_context(
+                    ThreadPoolExecutor(max_workers=options.extraction_concurrency))
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_concurrent_downloads))
+            asyncio.run(self.run_scheduler(executor, extraction_executor))
+
+        self.finish_metrics()
+        self.flush_progress()
+        return self.results()
+
+
+# Main processing function (with progress callback added)
+def process_videos(json_file, download_folder, log_callback, progress_callback, detailed_progress_callback, download_faves, download_likes, earliest_date=None, stop_event=None, max_concurrent_downloads=3, blocked_videos=None, failed_videos=None, options=None):
+    options = options or DownloadOptions()
+    stop_event = stop_event or threading.Event()
+    # folder_layout None keeps the layout the folder already has
+    folder_layout = options.folder_layout
+    if folder_layout is not None and folder_layout not in FOLDER_LAYOUTS:
+        log_callback(f"❌ Unknown folder layout '{folder_layout}' (expected one of: {', '.join(FOLDER_LAYOUTS)})")
+        return 0, 0, 0, 0, 0, 0, []
+
+    # Stream the favorite/liked records out of the JSON file
+    fave_links = []
+    like_links = []
+    try:
+        for list_name, video in iter_activity_records(json_file, log_callback):
+            _, date_key, link_key = ACTIVITY_LISTS[list_name]
+            if list_name == 'Favorite Videos':
+                if not download_faves:
+                    continue
+                links, label = fave_links, "faved"
+            else:
+                if not download_likes:
+                    continue
+                links, label = like_links, "liked"
+            link = video.get(link_key)
+            # Check if video date is after earliest date filter
+            video_date = video.get(date_key, '')
+            if not link or not is_date_after_earliest(video_date, earliest_date):
+                continue
+            links.append((link, get_file_prefix(label, video_date), video_date))
+    except Exception as e:
+        log_callback(f"Error loading JSON file: {e}")
+        return 0, 0, 0, 0, 0, 0, []  # Return zero counts on error
+
+    candidates = fave_links + like_links
+    video_links = [(url, prefix) for url, prefix, _ in candidates]
+
+    # Orphaned partial downloads are deleted; recent ones are resumed first
+    removed_count, removed_bytes = clean_partial_downloads(download_folder)
+    if removed_count:
+        log_callback(f"🧹 Removed {removed_count} partial downloads untouched for over "
+                     f"{PARTIAL_MAX_AGE // 86400} days ({removed_bytes / 1e6:.1f} MB)")
+    partials = {}
+
+    # Open the download catalog and index the videos it already has
+    catalog = None
+    try:
+        catalog = DownloadCatalog(download_folder)
+        # Files deleted or added by hand since the last run
+        missing_files, new_files = catalog.sync_folder()
+        if missing_files:
+            log_callback(f"🔍 {missing_files} downloaded files are missing from the folder - their videos will be downloaded again")
+        if new_files:
+            log_callback(f"🔍 Found {new_files} video files added to the folder since the last run")
+        previous_layout = catalog.get_layout()
+        if folder_layout is None:
+            folder_layout = previous_layout
+        elif previous_layout != folder_layout:
+            log_callback(f"🗂️ Moving videos from the '{previous_layout}' to the '{folder_layout}' folder layout...")
+            moved, skipped = migrate_folder_layout(download_folder, folder_layout, catalog, log_callback)
+            log_callback(f"🗂️ Moved {moved} files" + (f", {skipped} left in place" if skipped else ""))
+        if options.verify_files:
+            verify_downloads(download_folder, catalog, log_callback, progress_callback, stop_event)
+        catalog.register_candidates(
+            (get_video_id(url), get_source_list(prefix), url, video_date) for url, prefix, video_date in candidates
+        )
+        downloaded_index = DownloadIndex(catalog.downloaded_files())
+        for alias in catalog.downloaded_aliases():
+            downloaded_index.add(alias)
+        partials = catalog.get_partials()
+        log_callback(f"📁 Download folder: {download_folder}")
+        log_callback(f"📊 Found {len(downloaded_index)} existing videos")
+    except Exception as e:
+        log_callback(f"❌ Error opening download catalog: {e}")
+        log_callback("🔄 Falling back to scanning the download folder")
+        downloaded_index = build_download_index(download_folder)
+        folder_layout = folder_layout or 'flat'
+
+    total_videos = len(video_links)
+    if total_videos == 0:
+        log_callback("No videos to download.")
+        if catalog:
+            catalog.close()
+        return 0, 0, 0, 0, 0, 0, []
+
+    scheduler = DownloadScheduler(download_folder, video_links, downloaded_index, catalog, log_callback,
+                                  progress_callback, detailed_progress_callback, stop_event, max_concurrent_downloads,
+                                  blocked_videos, failed_videos, options, folder_layout, partials)
+    try:
+        return scheduler.run()
+    finally:
+        if catalog:
+            catalog.close()
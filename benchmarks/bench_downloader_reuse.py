@@ -0,0 +1,129 @@
+"""
+Benchmark: a fresh yt-dlp instance per video vs. the per-thread DownloaderPool.
+
+Serves small mp4 payloads from a local keep-alive HTTP server and downloads them
+through download_video both ways, reporting throughput, per-video overhead and
+how many TCP connections each mode opened.
+
+    python3 benchmarks/bench_downloader_reuse.py --videos 200 --concurrency 1 4 10
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from FaveSaveCore import DownloaderPool, download_video  # noqa: E402
+
+
+QUIET_OPTIONS = {'quiet': True, 'noprogress': True}
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serves the same mp4 payload for every path, with keep-alive and range support"""
+
+    protocol_version = 'HTTP/1.1'
+    payload = b''
+    connections = 0
+    connections_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with MediaHandler.connections_lock:
+            MediaHandler.connections += 1
+
+    def _send_payload(self, include_body):
+        body = self.payload
+        match = RANGE_PATTERN.match(self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(body) - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(body)}")
+            body = body[start:end + 1]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_payload(True)
+
+    def do_HEAD(self):
+        self._send_payload(False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is expected here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def run_mode(mode, base_url, videos, concurrency):
+    pool = DownloaderPool(QUIET_OPTIONS) if mode == 'pooled' else None
+
+    def task(index, folder):
+        url = f"{base_url}/video/{mode}{concurrency}x{index}.mp4"
+        if pool is not None:
+            download_video(url, folder, 'faved_', downloader_pool=pool)
+            return
+        # Previous behavior: a new YoutubeDL for every video
+        one_shot = DownloaderPool(QUIET_OPTIONS)
+        try:
+            download_video(url, folder, 'faved_', downloader_pool=one_shot)
+        finally:
+            one_shot.close()
+
+    MediaHandler.connections = 0
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda index: task(index, folder), range(videos)))
+        elapsed = time.perf_counter() - start
+    if pool is not None:
+        pool.close()
+    return elapsed, MediaHandler.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=100, help="downloads per mode and concurrency level")
+    parser.add_argument('--size-kb', type=int, default=64, help="payload size of each fake video")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 10])
+    args = parser.parse_args()
+
+    MediaHandler.payload = os.urandom(args.size_kb * 1024)
+    server = QuietHTTPServer(('127.0.0.1', 0), MediaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{'mode':<8} {'conc':>4} {'videos/s':>9} {'ms/video':>9} {'connections':>12}")
+    try:
+        for concurrency in args.concurrency:
+            for mode in ('fresh', 'pooled'):
+                elapsed, connections = run_mode(mode, base_url, args.videos, concurrency)
+                print(f"{mode:<8} {concurrency:>4} {args.videos / elapsed:>9.1f} "
+                      f"{elapsed / args.videos * 1000 * concurrency:>9.1f} {connections:>12}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
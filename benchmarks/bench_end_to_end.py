@@ -0,0 +1,124 @@
+"""
+End-to-end benchmark: process_videos against a local fake TikTok server.
+
+Generates a synthetic export whose links point at fake_tiktok.py (run in its own
+process), downloads it with the chosen settings and reports videos/s, MB/s,
+CPU time and peak RSS of FaveSave itself. Use --json to keep results for
+comparison across versions.
+
+    python3 benchmarks/bench_end_to_end.py --items 500 --concurrency 4 --latency 0.2 --bandwidth-kb 4096
+    python3 benchmarks/bench_end_to_end.py --items 1000 --concurrency 8 --extract-concurrency 4 --error-rate 0.05 --json e2e.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from FaveSaveCore import FOLDER_LAYOUTS, DownloadOptions, iter_folder_files, process_videos  # noqa: E402
+from fake_tiktok import add_server_arguments, get_server_options, start_server_process  # noqa: E402
+from make_export import generate_export  # noqa: E402
+
+
+QUIET_OPTIONS = {'quiet': True, 'noprogress': True, 'no_warnings': True}
+
+
+def cpu_seconds():
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS; children cover process mode
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / scale
+
+
+def folder_bytes(folder):
+    # Videos in both lists are hardlinked; count each file's bytes once
+    sizes = {}
+    for _, entry in iter_folder_files(folder):
+        if entry.name.endswith('.mp4'):
+            stat = entry.stat()
+            sizes[stat.st_dev, stat.st_ino] = stat.st_size
+    return sum(sizes.values())
+
+
+def run_benchmark(args, base_url, folder):
+    json_file = os.path.join(folder, 'user_data_tiktok.json')
+    likes = args.items // 2
+    generate_export(json_file, args.items - likes, likes, base_url=base_url, overlap=args.overlap)
+    download_folder = os.path.join(folder, 'videos')
+
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    total, downloaded, _, failed, _, _, _ = process_videos(
+        json_file, download_folder,
+        log_callback=(print if args.verbose else lambda message: None),
+        progress_callback=lambda progress: None,
+        detailed_progress_callback=lambda info: None,
+        download_faves=True,
+        download_likes=True,
+        max_concurrent_downloads=args.concurrency,
+        options=DownloadOptions(
+            downloader_options=QUIET_OPTIONS,
+            adaptive_concurrency=args.adaptive,
+            requests_per_minute=args.rate,
+            use_processes=args.processes,
+            extraction_concurrency=args.extract_concurrency,
+            folder_layout=args.layout
+        )
+    )
+    elapsed = time.perf_counter() - start
+    cpu = cpu_seconds() - cpu_start
+    transferred = folder_bytes(download_folder)
+    return {
+        'items': total,
+        'downloaded': downloaded,
+        'failed': failed,
+        'elapsed_s': round(elapsed, 3),
+        'videos_per_s': round(downloaded / elapsed, 2),
+        'mb_per_s': round(transferred / elapsed / 1e6, 2),
+        'cpu_s': round(cpu, 2),
+        'cpu_percent': round(cpu / elapsed * 100, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200, help="favorites + likes in the synthetic export")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--extract-concurrency', type=int, default=0)
+    parser.add_argument('--overlap', type=float, default=0.0, help="share of likes that are also favorites")
+    parser.add_argument('--adaptive', action='store_true')
+    parser.add_argument('--processes', action='store_true')
+    parser.add_argument('--rate', type=int, default=0, help="downloads per minute (default: unlimited)")
+    parser.add_argument('--layout', choices=list(FOLDER_LAYOUTS), default='flat')
+    parser.add_argument('--json', metavar='FILE', help="also write the settings and results to FILE")
+    parser.add_argument('--verbose', action='store_true', help="print FaveSave's log")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server_process(**get_server_options(args))
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            results = run_benchmark(args, base_url, folder)
+    finally:
+        server.terminate()
+        server.join()
+
+    for name, value in results.items():
+        print(f"{name:<14} {value}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Microbenchmarks for the parsing, filtering and dedup paths that dominate reruns
+where nothing new downloads.
+
+Each case runs on a synthetic export (and a download folder) of every requested
+size; the best of --repeat runs is reported, along with the time per record.
+calculate_filtered_counts lives in the Qt window, so its two halves are timed
+directly: building the ActivityDateIndex (once per export) and counting (per preview).
+
+    python3 benchmarks/bench_hot_paths.py --sizes 10000 100000 1000000 --json hot_paths.json
+"""
+import argparse
+from datetime import date
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from FaveSaveCore import (  # noqa: E402
+    ActivityDateIndex,
+    DownloadCatalog,
+    build_download_index,
+    get_activity_data,
+    get_downloaded_videos,
+    get_video_id,
+    is_date_after_earliest,
+    is_video_downloaded,
+    iter_activity_records,
+    load_json,
+    make_links_clickable,
+)
+from make_export import generate_export  # noqa: E402
+
+
+# Filter date in the middle of the generated range, so both sides of the comparison run
+EARLIEST_DATE = date(2023, 8, 1)
+# Number of previews timed per count case (the GUI recounts on every filter change)
+PREVIEW_COUNTS = 1000
+
+
+def quiet(message):
+    pass
+
+
+def time_best(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def make_folder(folder, records):
+    """Create an empty 'downloaded' file for every record, named the way FaveSave names them"""
+    os.makedirs(folder, exist_ok=True)
+    for index, (url, video_date) in enumerate(records):
+        prefix = 'faved_' if index % 2 else 'liked_'
+        stamp = video_date.replace(':', '').replace(' ', '-')
+        open(os.path.join(folder, f"{prefix}{stamp}_{get_video_id(url)}.mp4"), 'wb').close()
+
+
+def bench_size(size, workdir, repeat):
+    json_file = os.path.join(workdir, f"export_{size}.json")
+    generate_export(json_file, size - size // 2, size // 2)
+    data = load_json(json_file)
+    records = [(video.get('Link') or video.get('link'), video.get('Date') or video.get('date'))
+               for _, video in iter_activity_records(json_file, quiet)]
+    dates = [video_date for _, video_date in records]
+    messages = [f"✅ Downloaded: {url}" for url, _ in records]
+    date_index = ActivityDateIndex.from_json(json_file)
+
+    folder = os.path.join(workdir, f"videos_{size}")
+    make_folder(folder, records)
+    download_index = build_download_index(folder)
+    with DownloadCatalog(folder) as catalog:
+        catalog.sync_folder()  # The first sync records every file
+
+    def open_catalog():
+        with DownloadCatalog(folder) as catalog:
+            catalog.downloaded_files()
+
+    def sync_catalog():
+        with DownloadCatalog(folder) as catalog:
+            catalog.sync_folder()
+
+    cases = [
+        ('load_json', lambda: load_json(json_file), size),
+        ('get_activity_data', lambda: get_activity_data(data, quiet), size),
+        ('iter_activity_records', lambda: sum(1 for _ in iter_activity_records(json_file, quiet)), size),
+        ('is_date_after_earliest', lambda: sum(is_date_after_earliest(d, EARLIEST_DATE) for d in dates), size),
+        ('ActivityDateIndex.from_json', lambda: ActivityDateIndex.from_json(json_file), size),
+        ('ActivityDateIndex.count', lambda: [date_index.count('Favorite Videos', EARLIEST_DATE)
+                                             for _ in range(PREVIEW_COUNTS)], PREVIEW_COUNTS),
+        ('get_downloaded_videos', lambda: get_downloaded_videos(folder), size),
+        ('build_download_index', lambda: build_download_index(folder), size),
+        ('is_video_downloaded', lambda: sum(is_video_downloaded(url, download_index, 'faved_')
+                                            for url, _ in records), size),
+        ('catalog.downloaded_files', open_catalog, size),
+        ('catalog.sync_folder', sync_catalog, size),
+        ('make_links_clickable', lambda: [make_links_clickable(m) for m in messages], size),
+    ]
+    results = []
+    for name, function, operations in cases:
+        seconds = time_best(function, repeat)
+        results.append({
+            'name': name,
+            'size': size,
+            'seconds': round(seconds, 6),
+            'us_per_op': round(seconds / operations * 1e6, 3),
+        })
+        print(f"{name:<28} {size:>9} {seconds:>10.4f} {seconds / operations * 1e6:>10.3f}")
+    return results
+
+
+def get_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="records in the export and files in the folder")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case; the best is reported")
+    parser.add_argument('--json', metavar='FILE', help="write the results to FILE")
+    args = parser.parse_args()
+
+    print(f"{'case':<28} {'size':>9} {'seconds':>10} {'us/op':>10}")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            results.extend(bench_size(size, workdir, args.repeat))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'revision': get_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
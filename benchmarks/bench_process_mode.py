@@ -0,0 +1,92 @@
+"""
+Benchmark: thread mode vs. process mode in process_videos.
+
+Generates a synthetic export whose links point at a local keep-alive HTTP server
+and runs the full download pipeline in both modes, reporting throughput, CPU time
+(parent + worker processes) and CPU utilization. In thread mode all yt-dlp work
+shares one GIL, so CPU utilization stays near 100% of a single core however many
+downloads run at once. Process mode pays a one-time start-up cost per slot (each
+worker imports yt-dlp), so it needs spare cores and a long enough run to come out
+ahead. The local server's CPU time is included in both modes.
+
+    python3 benchmarks/bench_process_mode.py --videos 200 --concurrency 8 10
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from FaveSaveCore import DownloadOptions, process_videos  # noqa: E402
+from bench_downloader_reuse import QUIET_OPTIONS, MediaHandler, QuietHTTPServer  # noqa: E402
+
+
+def write_export(json_file, base_url, videos, tag):
+    records = [
+        {'Date': f"2024-01-01 10:{index // 60 % 60:02d}:{index % 60:02d}", 'Link': f"{base_url}/video/{tag}{index}.mp4"}
+        for index in range(videos)
+    ]
+    with open(json_file, 'w') as f:
+        json.dump({'Your Activity': {'Favorite Videos': {'FavoriteVideoList': records}}}, f)
+
+
+def cpu_seconds():
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def run_mode(mode, base_url, videos, concurrency):
+    with tempfile.TemporaryDirectory() as folder:
+        json_file = os.path.join(folder, 'export.json')
+        write_export(json_file, base_url, videos, f"{mode}{concurrency}x")
+        download_folder = os.path.join(folder, 'videos')
+        cpu_start = cpu_seconds()
+        start = time.perf_counter()
+        results = process_videos(
+            json_file, download_folder,
+            log_callback=lambda message: None,
+            progress_callback=lambda progress: None,
+            detailed_progress_callback=lambda info: None,
+            download_faves=True,
+            download_likes=False,
+            max_concurrent_downloads=concurrency,
+            options=DownloadOptions(downloader_options=QUIET_OPTIONS, use_processes=(mode == 'process'))
+        )
+        elapsed = time.perf_counter() - start
+        cpu = cpu_seconds() - cpu_start
+    downloaded = results[1]
+    if downloaded != videos:
+        print(f"warning: {mode} mode downloaded {downloaded} of {videos} videos", file=sys.stderr)
+    return elapsed, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=100, help="downloads per mode and concurrency level")
+    parser.add_argument('--size-kb', type=int, default=256, help="payload size of each fake video")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 10])
+    args = parser.parse_args()
+
+    MediaHandler.payload = os.urandom(args.size_kb * 1024)
+    server = QuietHTTPServer(('127.0.0.1', 0), MediaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{'mode':<8} {'conc':>4} {'videos/s':>9} {'cpu s':>7} {'cpu %':>6}")
+    try:
+        for concurrency in args.concurrency:
+            for mode in ('thread', 'process'):
+                elapsed, cpu = run_mode(mode, base_url, args.videos, concurrency)
+                print(f"{mode:<8} {concurrency:>4} {args.videos / elapsed:>9.1f} {cpu:>7.2f} {cpu / elapsed * 100:>6.0f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Local stand-in for TikTok used by the end-to-end benchmarks.
+
+Serves a small HTML page per video (/video/<id>) whose og:video tag points at its
+media (/media/<id>.mp4), which yt-dlp's generic extractor resolves just like a
+real share link. Latency, per-connection bandwidth, a random error rate and a
+share of 'IP blocked' videos are configurable:
+
+    python3 benchmarks/fake_tiktok.py --port 8765 --latency 0.2 --bandwidth-kb 2048 --error-rate 0.05
+
+Generate a matching export with make_export.py --base-url http://127.0.0.1:8765
+to point the desktop app at it.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PAGE_PATTERN = re.compile(r"^/video/([\w-]+)/?$")
+MEDIA_PATTERN = re.compile(r"^/media/([\w-]+)\.mp4$")
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+# Same wording as TikTok's error, so FaveSave classifies the response as a block
+BLOCKED_REASON = "Your IP address is blocked from accessing this post"
+CHUNK_SIZE = 16 * 1024
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head>
+<title>Fake TikTok video {video_id}</title>
+<meta property="og:title" content="Fake TikTok video {video_id}">
+<meta property="og:video" content="{media_url}">
+<meta property="og:video:type" content="video/mp4">
+</head><body></body></html>
+"""
+
+
+class FakeTikTokHandler(BaseHTTPRequestHandler):
+    """Request handler; behaviour comes from the server's `options` dict"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _is_blocked(self, video_id):
+        # Deterministic per video: a blocked video stays blocked across retries
+        block_rate = self.server.options['block_rate']
+        return block_rate > 0 and zlib.crc32(video_id.encode()) % 10000 < block_rate * 10000
+
+    def _send_body(self, status, content_type, body, include_body, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if include_body:
+            self._write_throttled(body)
+
+    def _write_throttled(self, body):
+        bandwidth = self.server.options['bandwidth']
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        start = time.monotonic()
+        for offset in range(0, len(body), CHUNK_SIZE):
+            self.wfile.write(body[offset:offset + CHUNK_SIZE])
+            # Sleep until the bytes sent so far fit the per-connection bandwidth
+            ahead = (offset + CHUNK_SIZE) / bandwidth - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def _serve_page(self, video_id, include_body):
+        if self._is_blocked(video_id):
+            self.send_response(403, BLOCKED_REASON)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if random.random() < self.server.options['error_rate']:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        media_url = f"http://{self.headers.get('Host')}/media/{video_id}.mp4"
+        page = PAGE_TEMPLATE.format(video_id=video_id, media_url=media_url).encode()
+        self._send_body(200, 'text/html; charset=utf-8', page, include_body)
+
+    def _serve_media(self, include_body):
+        body = self.server.payload
+        match = RANGE_PATTERN.match(self.headers.get('Range', ''))
+        if not match:
+            self._send_body(200, 'video/mp4', body, include_body, [('Accept-Ranges', 'bytes')])
+            return
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(body) - 1
+        self._send_body(206, 'video/mp4', body[start:end + 1], include_body, [
+            ('Accept-Ranges', 'bytes'),
+            ('Content-Range', f"bytes {start}-{end}/{len(body)}"),
+        ])
+
+    def _handle(self, include_body):
+        latency = self.server.options['latency']
+        if latency:
+            time.sleep(latency)
+        page = PAGE_PATTERN.match(self.path)
+        if page:
+            self._serve_page(page.group(1), include_body)
+        elif MEDIA_PATTERN.match(self.path):
+            self._serve_media(include_body)
+        else:
+            self._send_body(404, 'text/plain', b'Not found', include_body)
+
+    def do_GET(self):
+        self._handle(True)
+
+    def do_HEAD(self):
+        self._handle(False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTikTokServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, bandwidth=0, error_rate=0.0, block_rate=0.0, size_kb=512):
+        super().__init__(address, FakeTikTokHandler)
+        self.options = {
+            'latency': latency,
+            'bandwidth': bandwidth,
+            'error_rate': error_rate,
+            'block_rate': block_rate,
+        }
+        # Every video shares one payload, laid out like an mp4 (ftyp, moov and mdat boxes) so it passes verification
+        media_size = size_kb * 1024 - 32
+        self.payload = (b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom' + b'\x00\x00\x00\x08moov'
+                        + struct.pack('>I', media_size) + b'mdat' + os.urandom(media_size - 8))
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is expected here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _serve_forever(options, port_queue):
+    server = FakeTikTokServer(('127.0.0.1', 0), **options)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server_process(**options):
+    """
+    Run a FakeTikTokServer in a separate process, so its CPU time and memory stay out of
+    the benchmark's measurements. Returns (process, base_url); terminate() the process when done.
+    """
+    context = multiprocessing.get_context('spawn')
+    port_queue = context.Queue()
+    process = context.Process(target=_serve_forever, args=(options, port_queue), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+
+def add_server_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before every response (default: 0)")
+    parser.add_argument('--bandwidth-kb', type=int, default=0,
+                        help="per-connection bandwidth in KB/s (default: unlimited)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of page requests answered with 503")
+    parser.add_argument('--block-rate', type=float, default=0.0, help="share of videos answered with 'IP blocked'")
+    parser.add_argument('--size-kb', type=int, default=512, help="media size of every video (default: 512)")
+
+
+def get_server_options(args):
+    return {
+        'latency': args.latency,
+        'bandwidth': args.bandwidth_kb * 1024,
+        'error_rate': args.error_rate,
+        'block_rate': args.block_rate,
+        'size_kb': args.size_kb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeTikTokServer(('127.0.0.1', args.port), **get_server_options(args))
+    print(f"Fake TikTok serving on http://127.0.0.1:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
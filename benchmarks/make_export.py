@@ -0,0 +1,85 @@
+"""
+Generate a synthetic TikTok data export (user_data_tiktok.json) for benchmarks.
+
+Writes 'Your Activity' with a favorites list and a like list (dates spread over
+the last --days days, newest first), plus optional browsing-history filler that
+the parser has to skip, the way real exports are mostly made of other sections.
+Records are streamed to disk, so 500k-item exports don't need the whole document
+in memory.
+
+    python3 benchmarks/make_export.py out.json --items 100000
+    python3 benchmarks/make_export.py out.json --items 1000 --base-url http://127.0.0.1:8765
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import random
+
+
+# Function to build the share link for a video id (real TikTok form unless a fake server is used)
+def get_video_link(video_id, base_url=None):
+    if base_url:
+        return f"{base_url.rstrip('/')}/video/{video_id}/"
+    return f"https://www.tiktokv.com/share/video/{video_id}/"
+
+
+def _write_list(f, records):
+    f.write('[')
+    for index, record in enumerate(records):
+        if index:
+            f.write(',')
+        f.write(json.dumps(record))
+    f.write(']')
+
+
+def _iter_records(count, date_key, link_key, days, base_url, rng, seen_ids=None, reused_ids=()):
+    now = datetime(2025, 1, 1)
+    step = timedelta(days=days) / max(count, 1)
+    for index in range(count):
+        video_id = reused_ids[index] if index < len(reused_ids) else rng.randrange(10 ** 18, 10 ** 19)
+        if seen_ids is not None:
+            seen_ids.append(video_id)
+        yield {
+            date_key: (now - step * index).strftime('%Y-%m-%d %H:%M:%S'),
+            link_key: get_video_link(video_id, base_url),
+        }
+
+
+def generate_export(json_file, faves, likes, base_url=None, history=0, days=1000, seed=0, overlap=0.0):
+    """
+    Write an export with `faves` favorites, `likes` likes and `history` browsing-history records;
+    `overlap` is the share of likes that are favorites too
+    """
+    rng = random.Random(seed)
+    fave_ids = [] if overlap else None
+    with open(json_file, 'w', encoding='utf-8') as f:
+        f.write('{"Profile": {"Profile Information": {"ProfileMap": {"userName": "benchmark"}}}, ')
+        f.write('"Your Activity": {"Watch History": {"VideoList": ')
+        _write_list(f, _iter_records(history, 'Date', 'Link', days, None, rng))
+        f.write('}, "Favorite Videos": {"FavoriteVideoList": ')
+        _write_list(f, _iter_records(faves, 'Date', 'Link', days, base_url, rng, fave_ids))
+        f.write('}, "Like List": {"ItemFavoriteList": ')
+        shared_ids = rng.sample(fave_ids, min(int(likes * overlap), faves)) if overlap else ()
+        _write_list(f, _iter_records(likes, 'date', 'link', days, base_url, rng, reused_ids=shared_ids))
+        f.write('}}}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('json_file')
+    parser.add_argument('--items', type=int, default=1000, help="favorites + likes (default: 1000)")
+    parser.add_argument('--like-share', type=float, default=0.5, help="share of items in the like list (default: 0.5)")
+    parser.add_argument('--overlap', type=float, default=0.0, help="share of likes that are also favorites (default: 0)")
+    parser.add_argument('--history', type=int, default=0, help="browsing-history records to add as filler")
+    parser.add_argument('--days', type=int, default=1000, help="days the dates are spread over (default: 1000)")
+    parser.add_argument('--base-url', help="point links at a fake server (see fake_tiktok.py) instead of TikTok")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    likes = int(args.items * args.like_share)
+    generate_export(args.json_file, args.items - likes, likes, args.base_url, args.history, args.days, args.seed, args.overlap)
+    print(f"Wrote {args.items - likes} favorites, {likes} likes and {args.history} history records to {args.json_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Bandwidth cap: parse_byte_rate's decimal and binary units, BandwidthSchedule windows
+(including ones that run past midnight), live cap changes, reload() of a schedule file,
+and the BandwidthLimiter shared by threads and download processes.
+"""
+from datetime import datetime
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from FaveSaveCore import BandwidthLimiter, BandwidthSchedule, parse_byte_rate
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('0', 0),
+    (0, 0),
+    (1500, 1500),
+    ('500', 500),
+    ('500B/s', 500),
+    ('500K', 500 * 1000),
+    ('500 KB/s', 500 * 1000),
+    ('2.5M', 2.5 * 1000 ** 2),
+    ('1G', 1000 ** 3),
+    ('1Ki', 1024),
+    ('1.5MiB/s', 1.5 * 1024 ** 2),
+    ('1.5mib/s', 1.5 * 1024 ** 2),
+    ('2Mi', 2 * 1024 ** 2),
+    ('1GiB', 1024 ** 3),
+])
+def test_parse_byte_rate(value, expected):
+    assert parse_byte_rate(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', 'fast', '5iB', '1T', '1.5.2M', '-1', -1, 'M'])
+def test_parse_byte_rate_rejects(value):
+    with pytest.raises(ValueError):
+        parse_byte_rate(value)
+
+
+def at(hour, minute, day=1):
+    return datetime(2024, 1, day, hour, minute)
+
+
+def test_window_past_midnight():
+    schedule = BandwidthSchedule('5M', [{'from': '22:00', 'to': '06:00', 'limit': '1M'}])
+    assert schedule.current_limit(at(21, 59)) == 5e6
+    assert schedule.current_limit(at(22, 0)) == 1e6
+    assert schedule.current_limit(at(23, 59)) == 1e6
+    assert schedule.current_limit(at(0, 0, day=2)) == 1e6
+    assert schedule.current_limit(at(5, 59, day=2)) == 1e6
+    assert schedule.current_limit(at(6, 0, day=2)) == 5e6
+    assert schedule.current_limit(at(12, 0, day=2)) == 5e6
+
+
+def test_window_within_a_day():
+    schedule = BandwidthSchedule(0, [{'from': '09:00', 'to': '17:30', 'limit': '512Ki'}])
+    assert schedule.current_limit(at(8, 59)) == 0
+    assert schedule.active_window(at(9, 0)) == (9 * 60, 17 * 60 + 30, 512 * 1024)
+    assert schedule.current_limit(at(17, 29)) == 512 * 1024
+    assert schedule.current_limit(at(17, 30)) == 0
+
+
+@pytest.mark.parametrize('window', [{'from': '25:00', 'to': '06:00'}, {'from': '22:00'}, ['22:00', '06:00'],
+                                    {'from': '22:00', 'to': '06:00', 'limit': 'lots'}])
+def test_invalid_window(window):
+    with pytest.raises(ValueError):
+        BandwidthSchedule(0, [window])
+
+
+def test_live_cap_change_waits_for_the_active_window():
+    # What the desktop app's Bandwidth Cap spinner does during a download
+    schedule = BandwidthSchedule('5M', [{'from': '22:00', 'to': '06:00', 'limit': '1M'}])
+    schedule.limit = 8e6
+    assert schedule.active_window(at(23, 0)) == (22 * 60, 6 * 60, 1e6)
+    assert schedule.current_limit(at(23, 0)) == 1e6
+    assert schedule.current_limit(at(6, 0, day=2)) == 8e6
+    # Outside any window the change applies at once
+    assert schedule.active_window(at(12, 0)) is None
+    assert schedule.current_limit(at(12, 0)) == 8e6
+
+
+def test_reload(tmp_path):
+    file_path = str(tmp_path / 'bandwidth.json')
+    schedule = BandwidthSchedule('2M', file_path=file_path)
+
+    # A missing file is reported once; the settings given on the command line stay in effect
+    with pytest.raises(ValueError):
+        schedule.reload()
+    assert schedule.reload() is False
+    assert schedule.current_limit(at(12, 0)) == 2e6
+
+    def write(data, mtime):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+        os.utime(file_path, (mtime, mtime))
+
+    write({'limit': '3Mi', 'windows': [{'from': '22:00', 'to': '06:00', 'limit': '1M'}]}, 1000)
+    assert schedule.reload() is True
+    assert schedule.current_limit(at(12, 0)) == 3 * 1024 ** 2
+    assert schedule.current_limit(at(1, 0)) == 1e6
+    assert schedule.reload() is False
+
+    # Without "limit" the current one is kept; windows are replaced
+    write({'windows': []}, 2000)
+    assert schedule.reload() is True
+    assert (schedule.limit, schedule.windows) == (3 * 1024 ** 2, [])
+
+    # A broken edit is reported once and leaves the last good settings in place
+    for broken, mtime in (('{"limit": ', 3000), ([1, 2], 4000), ({'limit': '-5M'}, 5000)):
+        write(broken, mtime)
+        with pytest.raises(ValueError):
+            schedule.reload()
+        assert schedule.reload() is False
+        assert schedule.limit == 3 * 1024 ** 2
+
+
+def test_limiter_unlimited_never_waits():
+    limiter = BandwidthLimiter(0)
+    start = time.monotonic()
+    assert limiter.consume(10 ** 12)
+    assert time.monotonic() - start < 0.1
+
+
+def test_limiter_shares_the_rate_between_threads():
+    # 1 MB/s with a 1 s burst: 2 MB from four threads take about a second
+    limiter = BandwidthLimiter(1e6)
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [limiter.consume(50000) for _ in range(10)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    assert 0.8 < elapsed < 3
+
+
+def test_limiter_rate_change_reaches_waiting_transfers():
+    limiter = BandwidthLimiter(1000)
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (limiter.consume(10 ** 6), done.set()))
+    thread.start()
+    assert not done.wait(0.5)
+    limiter.set_rate(0)
+    assert done.wait(2)
+
+
+def test_limiter_stops_waiting_on_cancel():
+    limiter = BandwidthLimiter(1000)
+    stop_event = threading.Event()
+    threading.Timer(0.3, stop_event.set).start()
+    start = time.monotonic()
+    assert limiter.consume(10 ** 6, stop_event) is False
+    assert time.monotonic() - start < 2
+
+
+def _use_limiter(limiter):
+    limiter.consume(400000)
+    limiter.set_rate(3e6)
+
+
+def test_limiter_is_shared_with_processes():
+    context = multiprocessing.get_context('spawn')
+    limiter = BandwidthLimiter(1e6, context=context)
+    process = context.Process(target=_use_limiter, args=(limiter,))
+    process.start()
+    process.join(60)
+    assert process.exitcode == 0
+    assert limiter.rate == 3e6
+    # The child's charge shows in the shared bucket (read without refilling it)
+    assert limiter._state[1] < 1e6
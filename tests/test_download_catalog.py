@@ -0,0 +1,78 @@
+"""
+DownloadCatalog against a real download folder: sync_folder and verify_downloads only
+catalog and check finished videos, never what an interrupted download left behind, and
+resolved info is kept only until it expires or its video is transferred.
+"""
+import os
+import sqlite3
+import struct
+
+from FaveSaveCore import CATALOG_FILE, DownloadCatalog, DownloadIndex, verify_downloads
+
+MERGED = 'faved_2024-01-01-000000_111.mp4'
+MERGE_STREAMS = ['faved_2024-01-02-000000_222.f137.mp4', 'faved_2024-01-02-000000_222.f140.m4a']
+PARTIALS = ['liked_2024-01-03-000000_333.mp4.part', 'liked_2024-01-03-000000_333.mp4.ytdl']
+
+
+def write_video(folder, name):
+    # Smallest file check_mp4_boxes accepts: ftyp, moov and mdat boxes
+    with open(os.path.join(folder, name), 'wb') as f:
+        f.write(b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom' + b'\x00\x00\x00\x08moov'
+                + struct.pack('>I', 16) + b'mdat' + b'\x00' * 8)
+
+
+def test_is_video_file_rejects_partial_downloads():
+    assert DownloadIndex.is_video_file(MERGED)
+    for name in MERGE_STREAMS + PARTIALS:
+        assert not DownloadIndex.is_video_file(name)
+        assert not DownloadIndex().add(name)
+
+
+def test_merge_streams_are_never_cataloged(tmp_path):
+    folder = str(tmp_path)
+    for name in [MERGED] + MERGE_STREAMS + PARTIALS:
+        write_video(folder, name)
+    logs = []
+    with DownloadCatalog(folder) as catalog:
+        assert catalog.sync_folder() == (0, 1)
+        assert catalog.downloaded_files() == [MERGED]
+        assert verify_downloads(folder, catalog, logs.append)['checked'] == 1
+        assert list(catalog.get_manifest()) == [MERGED]
+
+    # yt-dlp merges the streams and deletes them: nothing goes missing, the merged file is new
+    for name in MERGE_STREAMS:
+        os.remove(os.path.join(folder, name))
+    write_video(folder, 'faved_2024-01-02-000000_222.mp4')
+    with DownloadCatalog(folder) as catalog:
+        assert catalog.sync_folder() == (0, 1)
+        assert sorted(catalog.downloaded_files()) == [MERGED, 'faved_2024-01-02-000000_222.mp4']
+        assert verify_downloads(folder, catalog, logs.append)['missing'] == 0
+    assert not any("Missing" in message for message in logs)
+
+
+def test_resolved_info_is_kept_until_forgotten_or_expired(tmp_path, monkeypatch):
+    info = {'id': '111', 'title': 'é', 'formats': [{'url': 'http://127.0.0.1/media/111.mp4'}]}
+    with DownloadCatalog(str(tmp_path)) as catalog:
+        assert catalog.get_video_info('111') is None
+        catalog.put_video_info('111', info)
+        assert catalog.get_video_info('111') == info
+        catalog.forget_video_info('111')
+        assert catalog.get_video_info('111') is None
+
+        catalog.put_video_info('111', info)
+        monkeypatch.setattr(DownloadCatalog, 'INFO_TTL', -1)
+        assert catalog.get_video_info('111') is None
+    with DownloadCatalog(str(tmp_path)) as catalog:
+        # Expired rows are pruned on close
+        assert catalog._conn.execute("SELECT COUNT(*) FROM resolved_info").fetchone() == (0,)
+
+
+def test_old_video_info_cache_is_dropped(tmp_path):
+    with sqlite3.connect(os.path.join(str(tmp_path), CATALOG_FILE)) as conn:
+        conn.execute("CREATE TABLE video_info (video_id TEXT PRIMARY KEY, info BLOB, byte_size INTEGER, "
+                     "fetched_at REAL, last_used REAL)")
+    conn.close()
+    with DownloadCatalog(str(tmp_path)) as catalog:
+        tables = {name for (name,) in catalog._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert 'video_info' not in tables
+    assert 'resolved_info' in tables
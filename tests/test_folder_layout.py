@@ -0,0 +1,137 @@
+"""
+migrate_folder_layout on a real download folder: every layout round trip keeps each file,
+its catalog row and its manifest entry together, partial downloads stay resumable and
+nothing is overwritten.
+"""
+import os
+
+import pytest
+
+from FaveSaveCore import (DownloadCatalog, get_layout_dir, get_source_list, iter_folder_files, migrate_folder_layout,
+                          verify_downloads)
+
+VIDEOS = {
+    'faved_2024-03-05-101500_111.mp4': '111',
+    'faved_2023-12-31-235959_222.mp4': '222',
+    'liked_2024-03-20-080000_333.mp4': '333',
+    'liked_2022-01-01-000000_444.m4a': '444',
+}
+# Files an interrupted download of video 555 left behind
+PARTIALS = ['faved_2024-03-06-000000_555.f137.mp4', 'faved_2024-03-06-000000_555.f140.m4a.part']
+FINISHED_PARTIAL = 'faved_2024-03-06-000000_555.mp4'
+# Not FaveSave videos: never moved
+OTHER_FILES = ['notes.txt', 'faved_2024-03-05-101500_666.mp4.damaged']
+
+
+def write_file(download_folder, relative_path, data):
+    file_path = os.path.join(download_folder, relative_path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+
+
+def folder_contents(download_folder):
+    contents = {}
+    for relative_path, entry in iter_folder_files(download_folder):
+        if not relative_path.startswith('favesave_catalog.db'):
+            with open(entry.path, 'rb') as f:
+                contents[relative_path] = f.read()
+    return contents
+
+
+def layout_path(layout, name):
+    return os.path.join(get_layout_dir(layout, name), name)
+
+
+@pytest.fixture
+def download_folder(tmp_path):
+    download_folder = str(tmp_path)
+    # Each file holds its own name, so a mix-up shows in the contents
+    for name in list(VIDEOS) + PARTIALS + OTHER_FILES:
+        write_file(download_folder, name, b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom'
+                   + b'\x00\x00\x00\x08moov' + (8 + len(name)).to_bytes(4, 'big') + b'mdat' + name.encode())
+    with DownloadCatalog(download_folder) as catalog:
+        for name, video_id in VIDEOS.items():
+            catalog.record_download(video_id, get_source_list(name), f"https://www.tiktokv.com/share/video/{video_id}/",
+                                    name)
+        catalog.record_partials('555', 'faved',
+                                [(os.path.join(download_folder, name), None, None) for name in PARTIALS])
+        verify_downloads(download_folder, catalog, log_callback=lambda message: None)
+    return download_folder
+
+
+def test_round_trip_through_every_layout(download_folder):
+    original = folder_contents(download_folder)
+    with DownloadCatalog(download_folder) as catalog:
+        partial_bytes = catalog.get_partials()
+        assert partial_bytes[('555', 'faved')] > 0
+        assert set(catalog.get_manifest()) == set(VIDEOS)
+
+    previous = 'flat'
+    for layout in ('year_month', 'id_hash', 'source', 'flat'):
+        with DownloadCatalog(download_folder) as catalog:
+            moved, skipped = migrate_folder_layout(download_folder, layout, catalog)
+            assert (moved, skipped) == (sum(layout_path(previous, name) != layout_path(layout, name)
+                                            for name in list(VIDEOS) + PARTIALS), 0)
+            assert catalog.get_layout() == layout
+            assert sorted(catalog.downloaded_files()) == sorted(layout_path(layout, name) for name in VIDEOS)
+            assert set(catalog.get_manifest()) == {layout_path(layout, name) for name in VIDEOS}
+            assert catalog.get_partials() == partial_bytes
+
+        # The folder started flat, so original's paths are plain file names
+        expected = {name if name in OTHER_FILES else layout_path(layout, name): data
+                    for name, data in original.items()}
+        assert folder_contents(download_folder) == expected
+        previous = layout
+
+    # Back to flat: the layout folders are gone again
+    assert sorted(entry.name for entry in os.scandir(download_folder) if entry.is_dir()) == []
+    assert folder_contents(download_folder) == original
+
+
+def test_layout_dirs():
+    assert get_layout_dir('year_month', 'faved_2024-03-05-101500_111.mp4') == os.path.join('2024', '03')
+    assert get_layout_dir('year_month', 'faved_2024-03-06-000000_555.f140.m4a.part') == os.path.join('2024', '03')
+    assert get_layout_dir('year_month', 'faved_111.mp4') == 'undated'
+    assert get_layout_dir('source', 'liked_2024-03-20-080000_333.mp4') == 'liked'
+    assert get_layout_dir('id_hash', 'faved_2024-03-05-101500_111.mp4') == get_layout_dir('id_hash', 'liked_111.mp4')
+    assert get_layout_dir('flat', 'faved_2024-03-05-101500_111.mp4') == ''
+
+
+def test_partial_files_stay_resumable(download_folder):
+    with DownloadCatalog(download_folder) as catalog:
+        partial_bytes = catalog.get_partials()
+        migrate_folder_layout(download_folder, 'year_month', catalog)
+        assert catalog.get_partials() == partial_bytes
+        recorded = {file_path for (file_path,) in catalog._conn.execute("SELECT file_path FROM partials")}
+    # Next to where the resumed download writes, so yt-dlp finds them again
+    assert recorded == {layout_path('year_month', name) for name in PARTIALS}
+    for name in PARTIALS:
+        assert os.path.dirname(layout_path('year_month', name)) == get_layout_dir('year_month', FINISHED_PARTIAL)
+        assert os.path.isfile(os.path.join(download_folder, layout_path('year_month', name)))
+
+
+def test_existing_destination_is_skipped(download_folder):
+    name = 'faved_2024-03-05-101500_111.mp4'
+    target = layout_path('year_month', name)
+    write_file(download_folder, target, b'already there')
+    original = folder_contents(download_folder)
+    logs = []
+    with DownloadCatalog(download_folder) as catalog:
+        moved, skipped = migrate_folder_layout(download_folder, 'year_month', catalog, logs.append)
+        assert skipped == 1
+        assert name in catalog.downloaded_files()
+        assert name in catalog.get_manifest()
+    assert any(message.startswith(f"⚠️ Could not move {name}") for message in logs)
+    contents = folder_contents(download_folder)
+    assert contents[name] == original[name]
+    assert contents[target] == b'already there'
+
+
+def test_unknown_layout_moves_nothing(download_folder):
+    original = folder_contents(download_folder)
+    with DownloadCatalog(download_folder) as catalog:
+        with pytest.raises(ValueError):
+            migrate_folder_layout(download_folder, 'by_color', catalog)
+        assert catalog.get_layout() == 'flat'
+    assert folder_contents(download_folder) == original
@@ -0,0 +1,166 @@
+"""
+_JsonStreamReader and iter_activity_records against json.loads: every document is read
+with tiny chunk sizes too, so escapes, multibyte characters and tokens end up split
+across chunk boundaries.
+"""
+import io
+import json
+
+import pytest
+
+from FaveSaveCore import ACTIVITY_LISTS, _JsonStreamReader, get_activity_data, iter_activity_records
+
+CHUNK_SIZES = list(range(1, 18)) + [_JsonStreamReader.CHUNK_SIZE]
+
+VALUES = [
+    "plain",
+    "quote \" backslash \\ slash \\/ controls \b\f\n\r\t",
+    "trailing backslash \\",
+    "\\\\\\\"",
+    "é ü 日本語 😀  ",
+    "brackets ] } [ { and , : inside a string",
+    0, -1, 1.5e-3, 12345678901234567890, True, False, None,
+    [], {}, [[]], {"": {}},
+    {"a": [1, {"b": [2, [3, {"c": "d"}]]}], "e": {"f": {"g": {"h": []}}}},
+    [{"Date": "2024-01-01 10:00:00", "Link": "https://www.tiktokv.com/share/video/1/"}, "x", [None]],
+]
+
+
+def make_reader(data, chunk_size, monkeypatch):
+    monkeypatch.setattr(_JsonStreamReader, 'CHUNK_SIZE', chunk_size)
+    return _JsonStreamReader(io.BytesIO(data))
+
+
+def encodings(value):
+    # Escaped (\uXXXX, surrogate pairs for emoji) and raw UTF-8, compact and indented
+    for ensure_ascii in (True, False):
+        for indent in (None, 2):
+            yield json.dumps(value, ensure_ascii=ensure_ascii, indent=indent).encode('utf-8')
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('value', VALUES)
+def test_read_value_matches_json_loads(value, chunk_size, monkeypatch):
+    for data in encodings(value):
+        assert make_reader(data, chunk_size, monkeypatch).read_value() == json.loads(data)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_skip_value_lands_on_the_next_value(chunk_size, monkeypatch):
+    for data in encodings([value for value in VALUES for value in (value, "sentinel")]):
+        reader = make_reader(data, chunk_size, monkeypatch)
+        for index, _ in enumerate(reader.iter_array()):
+            if index % 2:
+                assert reader.read_value() == "sentinel"
+            else:
+                reader.skip_value()
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_iter_object_yields_every_key(chunk_size, monkeypatch):
+    document = {"é": 1, "a\"b": [2], "\\": {"nested": True}, "😀": None}
+    for data in encodings(document):
+        reader = make_reader(data, chunk_size, monkeypatch)
+        assert {key: reader.read_value() for key in reader.iter_object()} == document
+
+
+def favorites(*ids):
+    return {'Favorite Videos': {'FavoriteVideoList': [
+        {'Date': f"2024-01-0{i} 10:00:00", 'Link': f"https://www.tiktokv.com/share/video/{i}/"} for i in ids]}}
+
+
+def likes(*ids):
+    return {'Like List': {'ItemFavoriteList': [
+        {'date': f"2023-05-0{i} 10:00:00", 'link': f"https://www.tiktokv.com/share/video/{i}/"} for i in ids]}}
+
+
+def activity(*nodes):
+    merged = {}
+    for node in nodes:
+        merged.update(node)
+    return merged
+
+
+# Key order matters to the streaming reader, so each document is a list of top-level items
+EXPORTS = {
+    'your_activity': [('Your Activity', activity(favorites(1, 2), likes(3)))],
+    'filler_first': [('Browsing History', {'VideoList': [{'Link': "]}\"{["}] * 3}),
+                     ('Your Activity', activity(likes(4), favorites(5)))],
+    'fallback_before_activity': [('Likes and Favorites', activity(favorites(6))),
+                                 ('Your Activity', activity(favorites(7), likes(8)))],
+    'fallback_before_empty_activity': [('Likes and Favorites', activity(favorites(6), likes(7))),
+                                       ('Your Activity', {})],
+    'fallback_only': [('Profile', {'Name': "x"}), ('Likes and Favorites', activity(likes(1), favorites(2)))],
+    'fallback_after_empty_activity': [('Your Activity', {}), ('Likes and Favorites', activity(favorites(3)))],
+    'nested_fallback_is_ignored': [('Other', {'Likes and Favorites': activity(favorites(1))})],
+    'unexpected_shapes': [('Your Activity', {'Favorite Videos': [], 'Like List': {'ItemFavoriteList': {}},
+                                             'Comments': {'CommentsList': [1, "2"]}})],
+    'non_dict_records': [('Your Activity', {'Favorite Videos': {'FavoriteVideoList': [
+        "x", None, {'Date': "é 😀", 'Link': "https://www.tiktokv.com/share/video/\\9/"}, [1]]}})],
+    'empty': [],
+}
+
+
+def dump_export(items, ensure_ascii=True, indent=None):
+    # json.dumps keeps the order of the items, like a real export
+    return json.dumps(dict(items), ensure_ascii=ensure_ascii, indent=indent).encode('utf-8')
+
+
+def expected_records(data):
+    """The records get_activity_data's fallback finds in a json.loads'ed export"""
+    activity_data = get_activity_data(json.loads(data.decode('utf-8-sig')))
+    records = []
+    for name, (list_key, _, _) in ACTIVITY_LISTS.items():
+        node = activity_data.get(name)
+        if isinstance(node, dict) and isinstance(node.get(list_key), list):
+            records += [(name, record) for record in node[list_key] if isinstance(record, dict)]
+    return records
+
+
+def stream_records(data, tmp_path):
+    json_file = tmp_path / 'user_data_tiktok.json'
+    json_file.write_bytes(data)
+    return list(iter_activity_records(str(json_file)))
+
+
+def sort_records(records):
+    return sorted(records, key=lambda record: json.dumps(record, sort_keys=True))
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('name', EXPORTS)
+def test_iter_activity_records_matches_json_loads(name, chunk_size, tmp_path, monkeypatch):
+    monkeypatch.setattr(_JsonStreamReader, 'CHUNK_SIZE', chunk_size)
+    for ensure_ascii in (True, False):
+        data = dump_export(EXPORTS[name], ensure_ascii=ensure_ascii, indent=1)
+        for prefix in (b'', b'\xef\xbb\xbf'):
+            assert sort_records(stream_records(prefix + data, tmp_path)) == sort_records(expected_records(prefix + data))
+
+
+def test_fallback_is_only_used_without_your_activity(tmp_path):
+    records = stream_records(dump_export(EXPORTS['fallback_before_activity']), tmp_path)
+    assert records == expected_records(dump_export(EXPORTS['fallback_before_activity']))
+    assert [name for name, _ in records] == ['Favorite Videos', 'Like List']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, _JsonStreamReader.CHUNK_SIZE])
+def test_truncated_export_raises(chunk_size, tmp_path, monkeypatch):
+    monkeypatch.setattr(_JsonStreamReader, 'CHUNK_SIZE', chunk_size)
+    data = dump_export([('Browsing History', {'VideoList': ["a\\\"b"]}),
+                        ('Your Activity', activity(favorites(1), likes(2, 3)))], ensure_ascii=False)
+    # The records are read as soon as 'Your Activity' closes, so any cut before that must fail
+    end = data.rindex(b'}', 0, len(data) - 1) + 1
+    for cut in range(end):
+        with pytest.raises(ValueError):
+            stream_records(data[:cut], tmp_path)
+
+
+def test_multibyte_character_cut_in_half_raises(tmp_path, monkeypatch):
+    monkeypatch.setattr(_JsonStreamReader, 'CHUNK_SIZE', 1)
+    # Records are decoded, so a broken character in one is an error (skipped values aren't decoded)
+    export = favorites(1)
+    export['Favorite Videos']['FavoriteVideoList'][0]['Link'] += "😀"
+    data = json.dumps({'Your Activity': export}, ensure_ascii=False).encode('utf-8')
+    broken = data.replace("😀".encode('utf-8'), "😀".encode('utf-8')[:2])
+    with pytest.raises(ValueError):
+        stream_records(broken, tmp_path)
@@ -0,0 +1,352 @@
+"""
+process_videos end to end against benchmarks/fake_tiktok.py: downloads, reruns that skip
+what is already there, re-downloads of missing and damaged files, videos in both lists,
+blocked videos, in-run retries of transient and rate-limit errors, cancellation, resolved
+info kept across a cancel and the pipeline and process modes.
+"""
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+import FaveSaveCore
+from FaveSaveCore import (MAX_DOWNLOAD_ATTEMPTS, BandwidthSchedule, DownloadCatalog, DownloadIndex, DownloadOptions,
+                          classify_download_error, get_retry_delay, get_video_id, iter_folder_files, load_session_data,
+                          process_videos)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from fake_tiktok import FakeTikTokServer  # noqa: E402
+from make_export import generate_export  # noqa: E402
+
+QUIET_OPTIONS = {'quiet': True, 'noprogress': True, 'no_warnings': True}
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = FakeTikTokServer(('127.0.0.1', 0), size_kb=16)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def download_folder(tmp_path):
+    return str(tmp_path / 'videos')
+
+
+def make_export(tmp_path, server, faves=4, likes=4, overlap=0.0):
+    json_file = str(tmp_path / 'user_data_tiktok.json')
+    generate_export(json_file, faves, likes, base_url=server.base_url, overlap=overlap)
+    return json_file
+
+
+def run_export(json_file, download_folder, concurrency=3, stop_event=None, log_callback=None, **options):
+    """Run process_videos the way the CLI does; returns its result tuple and the log lines"""
+    logs = []
+
+    def log(message):
+        logs.append(message)
+        if log_callback:
+            log_callback(message)
+
+    blocked_videos, failed_videos = load_session_data(download_folder)
+    result = process_videos(
+        json_file, download_folder, log, lambda percent: None, lambda info: None, True, True,
+        stop_event=stop_event,
+        max_concurrent_downloads=concurrency,
+        blocked_videos=blocked_videos,
+        failed_videos=failed_videos,
+        options=DownloadOptions(downloader_options=QUIET_OPTIONS, **options)
+    )
+    return result, logs
+
+
+def started_downloads(logs):
+    return [message for message in logs if message.startswith("Downloading: ")]
+
+
+def video_files(download_folder):
+    return sorted(relative_path for relative_path, entry in iter_folder_files(download_folder)
+                  if DownloadIndex.is_video_file(entry.name))
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'extraction_concurrency': 2},
+    {'use_processes': True},
+    {'adaptive_concurrency': True},
+], ids=['threads', 'pipeline', 'processes', 'adaptive'])
+def test_downloads_every_video(tmp_path, server, download_folder, options):
+    json_file = make_export(tmp_path, server, faves=5, likes=3)
+    (total, downloaded, blocked, failed, faves, likes, links), logs = run_export(json_file, download_folder, **options)
+    assert (total, downloaded, blocked, failed, faves, likes) == (8, 8, 0, 0, 5, 3)
+    assert len(links) == 8
+    assert len(started_downloads(logs)) == 8
+    assert len(video_files(download_folder)) == 8
+
+
+def test_rerun_skips_downloaded_videos(tmp_path, server, download_folder):
+    json_file = make_export(tmp_path, server)
+    run_export(json_file, download_folder)
+    (total, downloaded, _, failed, _, _, _), logs = run_export(json_file, download_folder)
+    assert (total, downloaded, failed) == (8, 8, 0)
+    assert started_downloads(logs) == []
+
+
+def test_rerun_downloads_deleted_file_again(tmp_path, server, download_folder):
+    json_file = make_export(tmp_path, server)
+    run_export(json_file, download_folder)
+    files = video_files(download_folder)
+    os.remove(os.path.join(download_folder, files[0]))
+    (_, downloaded, _, failed, _, _, _), logs = run_export(json_file, download_folder)
+    assert (downloaded, failed) == (8, 0)
+    assert len(started_downloads(logs)) == 1
+    assert video_files(download_folder) == files
+
+
+def test_verify_downloads_damaged_file_again(tmp_path, server, download_folder):
+    json_file = make_export(tmp_path, server)
+    run_export(json_file, download_folder)
+    files = video_files(download_folder)
+    with open(os.path.join(download_folder, files[0]), 'r+b') as f:
+        f.truncate(100)
+    (_, downloaded, _, failed, _, _, _), logs = run_export(json_file, download_folder, verify_files=True)
+    assert (downloaded, failed) == (8, 0)
+    assert any(message.startswith("🩹 Damaged: ") for message in logs)
+    assert len(started_downloads(logs)) == 1
+    assert video_files(download_folder) == files
+
+
+def test_video_in_both_lists_is_downloaded_once(tmp_path, server, download_folder):
+    json_file = make_export(tmp_path, server, faves=4, likes=4, overlap=0.5)
+    with open(json_file, encoding='utf-8') as f:
+        activity = json.load(f)['Your Activity']
+    fave_ids = {get_video_id(item['Link']) for item in activity['Favorite Videos']['FavoriteVideoList']}
+    like_ids = {get_video_id(item['link']) for item in activity['Like List']['ItemFavoriteList']}
+    shared_ids = fave_ids & like_ids
+    assert len(shared_ids) == 2
+
+    (total, downloaded, _, failed, faves, likes, _), logs = run_export(json_file, download_folder)
+    assert (total, downloaded, failed, faves, likes) == (8, 8, 0, 4, 4)
+    assert len(started_downloads(logs)) == 6
+    files = video_files(download_folder)
+    assert len(files) == 8
+    for video_id in shared_ids:
+        copies = [os.path.join(download_folder, name) for name in files if video_id in name]
+        assert len(copies) == 2
+        assert os.path.samefile(*copies)
+
+
+def test_blocked_videos_are_skipped_on_the_next_run(tmp_path, server, download_folder, monkeypatch):
+    monkeypatch.setitem(server.options, 'block_rate', 1.0)
+    # One video is in both lists: it is requested once but counted for both
+    json_file = make_export(tmp_path, server, faves=2, likes=2, overlap=0.5)
+    (total, downloaded, blocked, failed, _, _, links), logs = run_export(json_file, download_folder)
+    assert (total, downloaded, blocked, failed) == (4, 0, 4, 4)
+    assert sum(message.startswith("🚫 Blocked: ") for message in logs) == 3
+    blocked_videos, _ = load_session_data(download_folder)
+    assert blocked_videos == {url for url, _ in links}
+
+    (_, downloaded, blocked, failed, _, _, _), logs = run_export(json_file, download_folder)
+    assert (downloaded, blocked, failed) == (0, 4, 4)
+    assert started_downloads(logs) == []
+    assert sum(message.startswith("🚫 Skipping blocked video: ") for message in logs) == 4
+
+
+@pytest.mark.parametrize('error_message, error_class', [
+    ("ERROR: [TikTok] 111: Your IP address is blocked from accessing this post", 'blocked'),
+    ("ERROR: [TikTok] 111: Unable to download webpage: HTTP Error 429: Too Many Requests", 'rate_limit'),
+    ("ERROR: [TikTok] 111: Unable to download webpage: HTTP Error 503: Service Unavailable", 'transient'),
+    ("ERROR: [download] Got error: The read operation timed out", 'transient'),
+    ("ERROR: [download] Got error: [Errno 104] Connection reset by peer", 'transient'),
+    ("ERROR: [TikTok] 111: Unable to download webpage: HTTP Error 404: Not Found", 'permanent'),
+    ("ERROR: Unsupported URL: https://example.com/", 'permanent'),
+])
+def test_classify_download_error(error_message, error_class):
+    assert classify_download_error(error_message) == error_class
+
+
+def test_retry_delay_backs_off(monkeypatch):
+    monkeypatch.setattr(FaveSaveCore.random, 'uniform', lambda low, high: high)
+    assert [get_retry_delay(attempt, 'transient') for attempt in (1, 2, 3)] == [5, 10, 20]
+    assert [get_retry_delay(attempt, 'rate_limit') for attempt in (1, 2, 3)] == [30, 60, 120]
+    assert get_retry_delay(10, 'rate_limit') == FaveSaveCore.RETRY_MAX_DELAY
+
+
+def script_errors(monkeypatch, video_id, errors):
+    """Make the first downloads of video_id fail with `errors`, in order; returns its download count"""
+    attempts = []
+    run_download = FaveSaveCore.run_download
+
+    def scripted_run_download(video_url, *args, **kwargs):
+        if get_video_id(video_url) != video_id:
+            return run_download(video_url, *args, **kwargs)
+        attempts.append(video_url)
+        if len(attempts) <= len(errors):
+            return {'status': 'error', 'error': errors[len(attempts) - 1], 'partials': []}
+        return run_download(video_url, *args, **kwargs)
+
+    monkeypatch.setattr(FaveSaveCore, 'run_download', scripted_run_download)
+    return attempts
+
+
+def export_video_ids(json_file):
+    with open(json_file, encoding='utf-8') as f:
+        activity = json.load(f)['Your Activity']
+    return [get_video_id(item['Link']) for item in activity['Favorite Videos']['FavoriteVideoList']]
+
+
+def catalog_statuses(download_folder):
+    with DownloadCatalog(download_folder) as catalog:
+        return dict(catalog._conn.execute("SELECT video_id, status FROM videos"))
+
+
+def retries(logs):
+    return [message for message in logs if message.startswith("🔁 Retrying ")]
+
+
+def test_transient_error_is_retried_in_the_same_run(tmp_path, server, download_folder, monkeypatch):
+    monkeypatch.setattr(FaveSaveCore, 'RETRY_BASE_DELAY', 0)
+    monkeypatch.setitem(server.options, 'error_rate', 1.0)
+    json_file = make_export(tmp_path, server, faves=2, likes=0)
+
+    def recover_on_retry(message):
+        if message.startswith("🔁 Retrying "):
+            server.options['error_rate'] = 0.0
+
+    (total, downloaded, _, failed, _, _, _), logs = run_export(json_file, download_folder, concurrency=1,
+                                                               log_callback=recover_on_retry)
+    assert (total, downloaded, failed) == (2, 2, 0)
+    assert len(retries(logs)) == 1
+    assert f"(attempt 2 of {MAX_DOWNLOAD_ATTEMPTS}): " in retries(logs)[0]
+    assert "HTTP Error 503" in retries(logs)[0]
+    assert set(catalog_statuses(download_folder).values()) == {'downloaded'}
+
+
+def test_rate_limit_is_retried_with_its_own_backoff(tmp_path, server, download_folder, monkeypatch):
+    json_file = make_export(tmp_path, server, faves=2, likes=0)
+    video_id = export_video_ids(json_file)[0]
+    attempts = script_errors(monkeypatch, video_id, ["HTTP Error 429: Too Many Requests",
+                                                     "HTTP Error 503: Service Unavailable"])
+    backoffs = []
+    monkeypatch.setattr(FaveSaveCore, 'get_retry_delay',
+                        lambda attempt, error_class: backoffs.append((attempt, error_class)) or 0)
+
+    (total, downloaded, _, failed, _, _, _), logs = run_export(json_file, download_folder)
+    assert (total, downloaded, failed) == (2, 2, 0)
+    assert len(attempts) == 3
+    assert backoffs == [(1, 'rate_limit'), (2, 'transient')]
+    assert len(retries(logs)) == 2
+
+
+def test_video_out_of_attempts_is_left_pending(tmp_path, server, download_folder, monkeypatch):
+    monkeypatch.setattr(FaveSaveCore, 'RETRY_BASE_DELAY', 0)
+    monkeypatch.setitem(server.options, 'error_rate', 1.0)
+    json_file = make_export(tmp_path, server, faves=2, likes=0)
+    (total, downloaded, blocked, failed, _, _, _), logs = run_export(json_file, download_folder)
+    assert (total, downloaded, blocked, failed) == (2, 0, 0, 2)
+    assert len(retries(logs)) == 2 * (MAX_DOWNLOAD_ATTEMPTS - 1)
+    assert sum(f"after {MAX_DOWNLOAD_ATTEMPTS} attempts: " in message for message in logs) == 2
+    assert set(catalog_statuses(download_folder).values()) == {'pending'}
+    # Not blocked or failed: the next run tries again
+    assert load_session_data(download_folder) == (set(), set())
+
+    server.options['error_rate'] = 0.0
+    (_, downloaded, _, failed, _, _, _), logs = run_export(json_file, download_folder)
+    assert (downloaded, failed) == (2, 0)
+    assert len(started_downloads(logs)) == 2
+
+
+def test_permanent_error_fails_without_retry(tmp_path, server, download_folder, monkeypatch):
+    json_file = make_export(tmp_path, server, faves=2, likes=0)
+    video_id = export_video_ids(json_file)[0]
+    attempts = script_errors(monkeypatch, video_id, ["HTTP Error 404: Not Found"])
+    (total, downloaded, blocked, failed, _, _, _), logs = run_export(json_file, download_folder)
+    assert (total, downloaded, blocked, failed) == (2, 1, 0, 1)
+    assert len(attempts) == 1
+    assert retries(logs) == []
+    assert any(message.startswith("❌ Failed to download ") and "HTTP Error 404" in message for message in logs)
+    assert catalog_statuses(download_folder)[video_id] == 'failed'
+
+    # Failed videos are skipped on the next run
+    (_, downloaded, _, failed, _, _, _), logs = run_export(json_file, download_folder)
+    assert (downloaded, failed) == (1, 1)
+    assert len(attempts) == 1
+    assert sum(message.startswith("❌ Skipping failed video: ") for message in logs) == 1
+
+
+def test_cancel_stops_the_run(tmp_path, server, download_folder):
+    json_file = make_export(tmp_path, server, faves=10, likes=10)
+    stop_event = threading.Event()
+
+    def cancel_after_first_download(message):
+        if message.startswith("✅ Downloaded: "):
+            stop_event.set()
+
+    (total, downloaded, _, _, _, _, _), _ = run_export(json_file, download_folder, concurrency=1,
+                                                       stop_event=stop_event,
+                                                       log_callback=cancel_after_first_download)
+    assert total == 20
+    assert 1 <= downloaded < 20
+
+
+def test_cancel_during_block_cooldown(tmp_path, server, download_folder, monkeypatch):
+    monkeypatch.setitem(server.options, 'block_rate', 1.0)
+    json_file = make_export(tmp_path, server)
+    stop_event = threading.Event()
+    cooldown = threading.Event()
+
+    class CancellingSchedule(BandwidthSchedule):
+        # The watchdog reads the schedule right before it polls stop_event, so the
+        # cancellation is seen there while the dispatcher sleeps through the cooldown
+        def current_limit(self, now=None):
+            if cooldown.is_set():
+                stop_event.set()
+            return super().current_limit(now)
+
+    def watch_for_cooldown(message):
+        if message.startswith("⏸️ Repeated blocks"):
+            cooldown.set()
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(run_export(
+        json_file, download_folder, stop_event=stop_event, log_callback=watch_for_cooldown,
+        adaptive_concurrency=True, bandwidth_schedule=CancellingSchedule())), daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive(), "process_videos did not return after cancellation"
+    (total, downloaded, _, failed, _, _, _), logs = results[0]
+    assert cooldown.is_set()
+    assert (total, downloaded) == (8, 0)
+    assert "Cancellation requested - stopping new downloads" in logs
+
+
+def stored_info_count(download_folder):
+    with DownloadCatalog(download_folder) as catalog:
+        return catalog._conn.execute("SELECT COUNT(*) FROM resolved_info").fetchone()[0]
+
+
+def test_resolved_info_is_kept_only_until_transferred(tmp_path, server, download_folder):
+    json_file = make_export(tmp_path, server, faves=6, likes=6)
+    run_export(json_file, download_folder)
+    assert stored_info_count(download_folder) == 0
+
+    # Pipeline mode resolves ahead; a cancel leaves the resolved but untransferred videos' info behind
+    other_folder = str(tmp_path / 'pipeline')
+    stop_event = threading.Event()
+
+    def cancel_after_first_download(message):
+        if message.startswith("✅ Downloaded: "):
+            stop_event.set()
+
+    run_export(json_file, other_folder, concurrency=1, stop_event=stop_event,
+               log_callback=cancel_after_first_download, extraction_concurrency=4)
+    assert stored_info_count(other_folder) > 0
+    (_, downloaded, _, failed, _, _, _), _ = run_export(json_file, other_folder)
+    assert (downloaded, failed) == (12, 0)
+    assert stored_info_count(other_folder) == 0